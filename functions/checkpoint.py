@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+import inspect
+import pandas as pd
+
+# Checkpoints por etapa do pipeline, endereçados pelo conteúdo: cada etapa grava
+# sua saída em Parquet com uma chave que resume as entradas, o código e a
+# configuração que a produziram. Se nada disso mudou, a saída pode ser reaproveitada.
+
+INDEX_NAME = 'checkpoints.json'
+
+def hash_values(*values):
+    """SHA-256 de uma sequência de valores serializáveis em JSON."""
+    texto = json.dumps(values, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+def source_hash(*objs):
+    """Hash do código-fonte de módulos/funções (muda quando o código muda)."""
+    return hash_values(*[inspect.getsource(obj) for obj in objs])
+
+def _load_index(checkpoint_dir):
+    path = os.path.join(checkpoint_dir, INDEX_NAME)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def _save_index(index, checkpoint_dir):
+    path = os.path.join(checkpoint_dir, INDEX_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def has_checkpoint(checkpoint_dir, stage, key):
+    """True se existe checkpoint da etapa com exatamente esta chave."""
+    entry = _load_index(checkpoint_dir).get(stage)
+    return (
+        entry is not None
+        and entry['chave'] == key
+        and all(os.path.exists(os.path.join(checkpoint_dir, f)) for f in entry['arquivos'].values())
+    )
+
+def save_checkpoint(checkpoint_dir, stage, key, output):
+    """
+    Writes a stage output (a DataFrame or a dict of DataFrames) to Parquet and
+    records it in the index. The previous checkpoint of the stage is removed.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    partes = output if isinstance(output, dict) else {'': output}
+    arquivos = {}
+    for parte, df in partes.items():
+        nome = f"{stage}{'_' + parte if parte else ''}_{key[:16]}.parquet"
+        df.to_parquet(os.path.join(checkpoint_dir, nome), index=False)
+        arquivos[parte] = nome
+
+    index = _load_index(checkpoint_dir)
+    antigo = index.get(stage)
+    index[stage] = {'chave': key, 'arquivos': arquivos, 'dict': isinstance(output, dict)}
+    _save_index(index, checkpoint_dir)
+
+    if antigo:
+        for nome in set(antigo['arquivos'].values()) - set(arquivos.values()):
+            path = os.path.join(checkpoint_dir, nome)
+            if os.path.exists(path):
+                os.remove(path)
+
+def load_checkpoint(checkpoint_dir, stage):
+    """Lê a saída gravada da etapa (DataFrame ou dict de DataFrames)."""
+    entry = _load_index(checkpoint_dir)[stage]
+    partes = {
+        parte: pd.read_parquet(os.path.join(checkpoint_dir, nome))
+        for parte, nome in entry['arquivos'].items()
+    }
+    return partes if entry['dict'] else partes['']
@@ -1,40 +1,222 @@
 import pandas as pd
+import numpy as np
 import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functions.parsing import parse_brl_decimal, parse_date_ddmmyyyy
 
-def load_and_combine_csvs(csv_path):
+# Layout oficial do CPGF (Portal da Transparência).
+# Códigos como inteiros, nomes repetitivos como categóricos; data e valor ficam
+# como texto Arrow e são convertidos em clean_dataframe (functions/parsing.py).
+# CPF/CNPJ são identificadores, não números: como texto, mantêm os zeros à
+# esquerda e aceitam os valores mascarados (***.123.456-**) ou vazios.
+CPGF_SCHEMA = {
+    'CÓDIGO ÓRGÃO SUPERIOR': 'int32',
+    'NOME ÓRGÃO SUPERIOR': 'category',
+    'CÓDIGO ÓRGÃO': 'int32',
+    'NOME ÓRGÃO': 'category',
+    'CÓDIGO UNIDADE GESTORA': 'int32',
+    'NOME UNIDADE GESTORA': 'category',
+    'ANO EXTRATO': 'int16',
+    'MÊS EXTRATO': 'int8',
+    'CPF PORTADOR': 'str',
+    'NOME PORTADOR': 'str',
+    'CNPJ OU CPF FAVORECIDO': 'str',
+    'NOME FAVORECIDO': 'category',
+    'TRANSAÇÃO': 'category',
+    'DATA TRANSAÇÃO': 'string[pyarrow]',
+    'VALOR TRANSAÇÃO': 'string[pyarrow]',
+}
+
+# Política de tipos categóricos: colunas de texto repetitivas ficam codificadas como
+# dicionário (category) da ingestão até o Parquet do dashboard.
+CATEGORICAL_COLUMNS = [
+    'NOME ÓRGÃO SUPERIOR', 'NOME ÓRGÃO', 'NOME UNIDADE GESTORA', 'NOME FAVORECIDO',
+    'TRANSAÇÃO', 'ARQUIVO_ORIGEM', 'ESTADO_ESTIMADO',
+]
+
+def apply_categorical_policy(df):
+    """Converts the CATEGORICAL_COLUMNS present in df to category (in place)."""
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+def _source_column(file_path, n):
+    """ARQUIVO_ORIGEM como categórico de uma única categoria (códigos zerados)."""
+    return pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), categories=[os.path.basename(file_path)])
+
+# Colunas de documento lidas como texto também na leitura inferida, para o
+# ID_TRANSACAO não depender do caminho de leitura
+DOCUMENT_COLUMNS = {'CPF PORTADOR': 'str', 'CNPJ OU CPF FAVORECIDO': 'str'}
+
+def _read_legacy_file(file_path, motivo=None):
+    """Leitura original: pandas infere todos os tipos (menos os documentos)."""
+    start = time.perf_counter()
+    df = pd.read_csv(file_path, sep=';', encoding='latin-1', low_memory=False, dtype=DOCUMENT_COLUMNS)
+    df['ARQUIVO_ORIGEM'] = _source_column(file_path, len(df))
+    apply_categorical_policy(df)
+    return df, _file_report(file_path, df, start, 'inferido', motivo)
+
+def _file_report(file_path, df, start, schema, motivo=None):
+    report = {
+        'arquivo': os.path.basename(file_path),
+        'linhas': len(df),
+        'segundos': round(time.perf_counter() - start, 3),
+        'esquema': schema,
+    }
+    if motivo:
+        report['motivo'] = motivo
+    return report
+
+def report_line(r):
+    """Linha do relatório de ingestão de um arquivo, com o motivo quando o esquema fixo não foi usado."""
+    linha = f"{r['arquivo']}: {r['linhas']} linhas em {r['segundos']}s ({r['esquema']})"
+    return f"{linha} - {r['motivo']}" if r.get('motivo') else linha
+
+def _read_cpgf_file(file_path):
+    """
+    Reads a single CPGF CSV with the pinned schema.
+    Falls back to the legacy inferred read when the header does not match
+    CPGF_SCHEMA or a column fails the pinned dtype; the reason goes to the
+    report ('motivo').
+
+    Returns (DataFrame, report dict with file, rows, seconds and schema used).
+    """
+    start = time.perf_counter()
+    motivo = schema_mismatch(pd.read_csv(file_path, sep=';', encoding='latin-1', nrows=0).columns)
+    if motivo:
+        return _read_legacy_file(file_path, motivo)
+    try:
+        df = pd.read_csv(file_path, sep=';', encoding='latin-1', dtype=CPGF_SCHEMA)
+    except (ValueError, TypeError, OverflowError) as erro:
+        return _read_legacy_file(file_path, f'tipo fixo falhou: {erro}')
+
+    df['ARQUIVO_ORIGEM'] = _source_column(file_path, len(df))
+    return df, _file_report(file_path, df, start, 'cpgf')
+
+def schema_mismatch(header):
+    """Motivo para não usar o CPGF_SCHEMA com este cabeçalho (None se confere)."""
+    faltando = [c for c in CPGF_SCHEMA if c not in set(header)]
+    extras = [c for c in header if c not in CPGF_SCHEMA]
+    if not faltando and not extras:
+        return None
+    return f'cabeçalho fora do layout do CPGF (faltando: {faltando}, extras: {extras})'
+
+def _concat_preserving_categories(dfs):
+    """
+    pd.concat turns categoricals with different categories into object.
+    Aligns the categories of every CATEGORICAL_COLUMNS column first so the
+    combined frame stays dictionary-encoded.
+    """
+    for col in CATEGORICAL_COLUMNS:
+        if not all(col in d.columns and isinstance(d[col].dtype, pd.CategoricalDtype) for d in dfs):
+            continue
+        categorias = dfs[0][col].cat.categories
+        for d in dfs[1:]:
+            categorias = categorias.union(d[col].cat.categories)
+        for d in dfs:
+            d[col] = d[col].cat.set_categories(categorias)
+    return pd.concat(dfs, ignore_index=True)
+
+def load_and_combine_csvs(csv_path, parallel=False, max_workers=None, verbose=False):
     """
     Load all CSV files from a directory into a single DataFrame.
     Adds a column 'ARQUIVO_ORIGEM' with the file name for traceability.
     Assumes ; as separator and latin-1 encoding.
+    The CATEGORICAL_COLUMNS are read as category in both modes.
+
+    parallel=True reads the files concurrently in a process pool using
+    CPGF_SCHEMA (unknown layouts fall back to the legacy read).
+    The per-file parse time and row count are stored in
+    df.attrs['ingestion_report'] (and printed when verbose=True).
     """
-    dfs = []
-    csv_files = [f for f in os.listdir(csv_path) if f.lower().endswith('.csv')]
-    for file in csv_files:
-        file_path = os.path.join(csv_path, file)
-        df_temp = pd.read_csv(file_path, sep=';', encoding='latin-1', low_memory=False)
-        df_temp['ARQUIVO_ORIGEM'] = file
-        dfs.append(df_temp)
-    df = pd.concat(dfs, ignore_index=True)
+    csv_files = sorted(f for f in os.listdir(csv_path) if f.lower().endswith('.csv'))
+    file_paths = [os.path.join(csv_path, f) for f in csv_files]
+
+    # Com parallel=True usamos o esquema fixo do CPGF; caso contrário, a leitura original
+    reader = _read_cpgf_file if parallel else _read_legacy_file
+    if parallel and len(file_paths) > 1:
+        workers = max_workers or min(len(file_paths), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(reader, file_paths))
+    else:
+        results = [reader(file_path) for file_path in file_paths]
+
+    dfs = [df_temp for df_temp, _ in results]
+    reports = [report for _, report in results]
+    df = _concat_preserving_categories(dfs)
+
+    if verbose:
+        for r in reports:
+            print(report_line(r))
+    df.attrs['ingestion_report'] = reports
     ## Opt.: Adicionar fluxo para considerar somente os ultimos X meses para melhorar performance.
     return df
 
+# Valor que representa um código vazio no fingerprint
+NULL_CODE = np.iinfo(np.int64).min
+
+def _nullable_integer_column(col, serie):
+    """Coluna inteira do CPGF_SCHEMA lida como float por ter vazios (valores todos inteiros)."""
+    if col not in CPGF_SCHEMA or not pd.api.types.is_integer_dtype(CPGF_SCHEMA[col]):
+        return False
+    if not pd.api.types.is_float_dtype(serie.dtype):
+        return False
+    valores = serie.dropna().to_numpy()
+    return bool((valores == np.floor(valores)).all())
+
+def add_fingerprint(df):
+    """
+    Adds 'ID_TRANSACAO': a 64-bit fingerprint of the source fields of each
+    transaction (every CPGF column, not ARQUIVO_ORIGEM, so the same
+    transaction in overlapping monthly files gets the same key).
+
+    Integer and datetime columns are hashed in a canonical dtype, so the key is
+    the same whether the file was read with the pinned schema or inferred
+    (an integer code with empty values, read as float, is hashed as int64).
+    """
+    colunas = [c for c in CPGF_SCHEMA if c in df.columns]
+    if not colunas:
+        colunas = [c for c in df.columns if c not in ('ARQUIVO_ORIGEM', 'ID_TRANSACAO')]
+    hashes = None
+    for col in colunas:
+        serie = df[col]
+        if _nullable_integer_column(col, serie):
+            # Código inteiro com vazios chega como float na leitura inferida
+            serie = serie.fillna(NULL_CODE).astype('int64')
+        if pd.api.types.is_integer_dtype(serie.dtype):
+            serie = serie.astype('int64')
+        elif pd.api.types.is_datetime64_any_dtype(serie.dtype):
+            serie = serie.astype('datetime64[ns]')
+        h = pd.util.hash_pandas_object(serie, index=False).to_numpy()
+        # Combinação no estilo do hash de tuplas do Python (multiplica e faz XOR)
+        hashes = h if hashes is None else (hashes * np.uint64(1000003)) ^ h
+    df['ID_TRANSACAO'] = hashes.view(np.int64)
+    return df
+
 def clean_dataframe(df):
     """
     Cleans key columns:
     - Converts 'DATA TRANSAÇÃO' to datetime (%d/%m/%Y).
     - Converts 'VALOR TRANSAÇÃO' from Brazilian format to float.
-    - Drops duplicates.
+    - Adds the 'ID_TRANSACAO' fingerprint and drops duplicates on it.
     Returns a cleaned DataFrame.
+
+    The number of null and failed conversions per column is stored in
+    df.attrs['parse_report'].
     """
     df = df.copy()
-    df['DATA TRANSAÇÃO'] = pd.to_datetime(df['DATA TRANSAÇÃO'], format='%d/%m/%Y', errors='coerce')
-    df['VALOR TRANSAÇÃO'] = (
-        df['VALOR TRANSAÇÃO']
-        .astype(str)
-        .str.replace('.', '', regex=False)
-        .str.replace(',', '.', regex=False)
-    )
-    df['VALOR TRANSAÇÃO'] = pd.to_numeric(df['VALOR TRANSAÇÃO'], errors='coerce').fillna(0)
-    df_limpo = df.drop_duplicates()
+    datas, report_data = parse_date_ddmmyyyy(df['DATA TRANSAÇÃO'])
+    valores, report_valor = parse_brl_decimal(df['VALOR TRANSAÇÃO'])
+    df['DATA TRANSAÇÃO'] = datas
+    df['VALOR TRANSAÇÃO'] = valores
+    df['VALOR TRANSAÇÃO'] = df['VALOR TRANSAÇÃO'].fillna(0)
+    add_fingerprint(df)
+    df_limpo = df.drop_duplicates(subset='ID_TRANSACAO')
+    df_limpo.attrs['parse_report'] = {
+        'DATA TRANSAÇÃO': report_data,
+        'VALOR TRANSAÇÃO': report_valor,
+    }
     return df_limpo
@@ -0,0 +1,163 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from functions.clean_df import CPGF_SCHEMA
+
+# Saída do ETL para o dashboard: dataset Parquet particionado por mês do extrato e
+# sigilo (pastas ANO EXTRATO=/MÊS EXTRATO=/SIGILOSO=), com as linhas de cada
+# partição em ordem decrescente de PRIORITY_SCORE, zstd e estatísticas por row
+# group. O dashboard lê com pyarrow.dataset e os filtros de estado, órgão, data e
+# sigilo são aplicados na leitura: partições inteiras e row groups cujas
+# estatísticas não casam com o filtro nem são lidos.
+# Ao lado do dataset vai um cubo pequeno de agregados (estado x órgão superior x
+# órgão x unidade x mês x sigilo), de onde saem os KPIs, os mapas e o gráfico mensal.
+
+PARTITION_COLUMNS = ['ANO EXTRATO', 'MÊS EXTRATO', 'SIGILOSO']
+SORT_COLUMN = 'PRIORITY_SCORE'
+
+# Linhas por row group: grande o bastante para a compressão e pequeno o bastante
+# para o filtro por estatísticas descartar trechos de uma partição
+ROW_GROUP_ROWS = 128 * 1024
+
+COMPRESSION = 'zstd'
+COMPRESSION_LEVEL = 3
+
+# Mesmos tipos do DataFrame (esquema do CPGF; SIGILOSO é int64)
+PARTITION_TYPES = {
+    'ANO EXTRATO': CPGF_SCHEMA['ANO EXTRATO'],
+    'MÊS EXTRATO': CPGF_SCHEMA['MÊS EXTRATO'],
+    'SIGILOSO': 'int64',
+}
+PARTITIONING = ds.partitioning(
+    pa.schema([(c, pa.from_numpy_dtype(t)) for c, t in PARTITION_TYPES.items()]), flavor='hive'
+)
+
+## Dataset particionado
+
+def write_dashboard_dataset(df, output_dir, row_group_rows=ROW_GROUP_ROWS):
+    """
+    Writes df as the partitioned dashboard dataset in output_dir, replacing
+    any previous one only after the new one is complete. df.attrs go to the
+    schema metadata under the same key pandas.to_parquet uses.
+
+    Returns:
+        str: output_dir.
+    """
+    df = df.sort_values(
+        PARTITION_COLUMNS + [SORT_COLUMN], ascending=[True] * len(PARTITION_COLUMNS) + [False],
+        kind='stable'
+    )
+    df = df.astype(PARTITION_TYPES)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if df.attrs:
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, b'PANDAS_ATTRS': json.dumps(df.attrs)}
+        )
+
+    # Posição da coluna de ordenação nos arquivos (sem as colunas de partição)
+    colunas_arquivo = [c for c in table.column_names if c not in PARTITION_COLUMNS]
+    formato = ds.ParquetFileFormat()
+    opcoes = formato.make_write_options(
+        compression=COMPRESSION, compression_level=COMPRESSION_LEVEL, write_statistics=True,
+        sorting_columns=[pq.SortingColumn(colunas_arquivo.index(SORT_COLUMN), descending=True)],
+    )
+
+    tmp_dir = output_dir.rstrip('/\\') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    ds.write_dataset(
+        table, tmp_dir, format=formato, file_options=opcoes, partitioning=PARTITIONING,
+        basename_template='parte-{i}.parquet', preserve_order=True,
+        min_rows_per_group=row_group_rows, max_rows_per_group=row_group_rows,
+    )
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return output_dir
+
+## Cubo de agregados
+
+# Chaves do cubo: os filtros da barra lateral do dashboard + o mês da transação
+CUBE_KEYS = ['ESTADO_ESTIMADO', 'NOME ÓRGÃO SUPERIOR', 'NOME ÓRGÃO', 'NOME UNIDADE GESTORA', 'MES', 'SIGILOSO']
+
+# Sem TECHNICAL_LABEL, são anomalias as transações com PRIORITY_SCORE no decil
+# superior da sua partição (sigilosas ou não)
+ANOMALY_QUANTILE = 0.90
+
+def transaction_months(df):
+    """
+    Mês de cada transação ('AAAA-MM', categórica); sem DATA TRANSAÇÃO (sigilosas),
+    o mês do extrato, como na imputação do dia 01 feita pelo dashboard.
+    """
+    datas = df['DATA TRANSAÇÃO']
+    mes = (datas.dt.year * 12 + datas.dt.month - 1).to_numpy(dtype=float, na_value=np.nan)
+    mes_extrato = (df['ANO EXTRATO'].astype(np.int64) * 12 + df['MÊS EXTRATO'].astype(np.int64) - 1).to_numpy()
+    mes = np.where(np.isnan(mes), mes_extrato, mes).astype(np.int64)
+    unicos, codigos = np.unique(mes, return_inverse=True)
+    return pd.Categorical.from_codes(codigos.ravel(), [f'{m // 12}-{m % 12 + 1:02d}' for m in unicos])
+
+def anomaly_cuts(df, quantile=ANOMALY_QUANTILE):
+    """Corte de PRIORITY_SCORE de cada partição SIGILOSO."""
+    prioridade = df['PRIORITY_SCORE'].to_numpy()
+    sigilo = df['SIGILOSO'].to_numpy()
+    return {int(s): float(np.quantile(prioridade[sigilo == s], quantile)) for s in np.unique(sigilo)}
+
+def flag_anomalies(df, cortes):
+    """TECHNICAL_LABEL == -1 quando existir; senão PRIORITY_SCORE acima do corte da partição."""
+    if 'TECHNICAL_LABEL' in df.columns:
+        return (df['TECHNICAL_LABEL'] == -1).to_numpy()
+    limiar = df['SIGILOSO'].map(cortes).to_numpy(dtype=float)
+    return df['PRIORITY_SCORE'].to_numpy() >= limiar
+
+def build_cube(df):
+    """
+    Aggregates the dashboard rows by CUBE_KEYS: VALOR_TOTAL, TRANSACOES,
+    VALOR_ANOMALIAS and RISCO_MAX (max PRIORITY_SCORE). The anomaly cuts
+    used go to attrs['cortes_anomalia'].
+    """
+    cortes = anomaly_cuts(df)
+    valor = df['VALOR TRANSAÇÃO'].to_numpy()
+    base = df[[c for c in CUBE_KEYS if c != 'MES']].reset_index(drop=True).assign(
+        MES=transaction_months(df),
+        VALOR_TOTAL=valor,
+        VALOR_ANOMALIAS=np.where(flag_anomalies(df, cortes), valor, 0.0),
+        RISCO_MAX=df['PRIORITY_SCORE'].to_numpy(),
+    )
+    cubo = base.groupby(CUBE_KEYS, observed=True, dropna=False, sort=False).agg(
+        VALOR_TOTAL=('VALOR_TOTAL', 'sum'),
+        TRANSACOES=('VALOR_TOTAL', 'size'),
+        VALOR_ANOMALIAS=('VALOR_ANOMALIAS', 'sum'),
+        RISCO_MAX=('RISCO_MAX', 'max'),
+    ).reset_index()
+    cubo.attrs = {'cortes_anomalia': cortes, 'quantil_anomalia': ANOMALY_QUANTILE}
+    return cubo
+
+def write_dashboard_cube(df, path):
+    """Grava o cubo de df em path (Parquet zstd); os attrs vão junto."""
+    cubo = build_cube(df)
+    cubo.to_parquet(path + '.tmp', index=False, compression=COMPRESSION)
+    os.replace(path + '.tmp', path)
+    return cubo
+
+## Leitura
+
+def open_dashboard_dataset(path):
+    """pyarrow.dataset do dashboard; também abre um Parquet único (saídas antigas)."""
+    if os.path.isdir(path):
+        return ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+    return ds.dataset(path, format='parquet')
+
+def read_dashboard_dataset(path, columns=None, filter=None):
+    """
+    Reads the dashboard dataset into pandas, projecting columns and pushing
+    filter (a pyarrow.dataset expression) down to the scan.
+    """
+    dataset = open_dashboard_dataset(path)
+    df = dataset.to_table(columns=columns, filter=filter).to_pandas()
+    metadata = dataset.schema.metadata or {}
+    if b'PANDAS_ATTRS' in metadata:
+        df.attrs = json.loads(metadata[b'PANDAS_ATTRS'])
+    return df
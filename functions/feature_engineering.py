@@ -1,7 +1,16 @@
 import numpy as np
+import pandas as pd
 
-def feature_engineering(df):
+# Colunas categóricas que recebem frequency encoding
+coluna_frequencia = ['NOME ÓRGÃO', 'ESTADO_ESTIMADO', 'NOME FAVORECIDO']
+
+# Chave da média do valor por órgão, ano e mês
+grupo_orgao_mes = ['NOME ÓRGÃO', 'ANO EXTRATO', 'MÊS EXTRATO']
 
+def row_features(df):
+    """
+    Features que dependem apenas da própria linha (não precisam de estatísticas globais).
+    """
     # Add confidential flag
     df['SIGILOSO'] = (df['TRANSAÇÃO'] == 'Informações protegidas por sigilo').astype(int)
 
@@ -16,16 +25,56 @@ def feature_engineering(df):
     # Transform value into log
     df['LOG_VALOR'] = np.log1p(df['VALOR TRANSAÇÃO'])
 
+    return df
+
+def compute_aggregates(df):
+    """
+    Global statistics behind FREQ_* and MEDIA_VALOR_ORGAO_MES, kept as
+    additive counts and sums so they can be combined across batches.
+    """
+    contagens = {col: df[col].value_counts() for col in coluna_frequencia}
+    grupos = df.groupby(grupo_orgao_mes, observed=True)['VALOR TRANSAÇÃO']
+    return {
+        'contagens': {col: c[c > 0] for col, c in contagens.items()},
+        'soma_mes': grupos.sum(),
+        'contagem_mes': grupos.count(),
+    }
+
+def merge_aggregates(agg_a, agg_b):
+    """Soma dois conjuntos de agregados (ex.: de lotes diferentes)."""
+    if agg_a is None:
+        return agg_b
+    return {
+        'contagens': {
+            col: agg_a['contagens'][col].add(agg_b['contagens'][col], fill_value=0)
+            for col in coluna_frequencia
+        },
+        'soma_mes': agg_a['soma_mes'].add(agg_b['soma_mes'], fill_value=0),
+        'contagem_mes': agg_a['contagem_mes'].add(agg_b['contagem_mes'], fill_value=0),
+    }
+
+def apply_aggregates(df, aggs):
+    """
+    Maps the global statistics back onto the rows:
+    FREQ_* (normalized frequency), MEDIA_VALOR_ORGAO_MES and RATIO_MES.
+    """
     # Frequência para cada coluna categórica informada
-    coluna_frequencia = ['NOME ÓRGÃO', 'ESTADO_ESTIMADO', 'NOME FAVORECIDO']
     for col in coluna_frequencia:
-        freq_map = df[col].value_counts(normalize=True)
-        df[f'FREQ_{col}'] = df[col].map(freq_map)
+        contagem = aggs['contagens'][col]
+        freq_map = contagem / contagem.sum()
+        df[f'FREQ_{col}'] = df[col].map(freq_map).astype('float64')
 
-    # Adiciona uma coluna contendo a média do valor da transação por órgão, ano e mês
-    df['MEDIA_VALOR_ORGAO_MES'] = df.groupby(['NOME ÓRGÃO', 'ANO EXTRATO','MÊS EXTRATO'])['VALOR TRANSAÇÃO'].transform('mean')
+    # Média do valor da transação por órgão, ano e mês
+    media = aggs['soma_mes'] / aggs['contagem_mes']
+    chave = pd.MultiIndex.from_frame(df[grupo_orgao_mes])
+    df['MEDIA_VALOR_ORGAO_MES'] = media.reindex(chave).to_numpy()
 
     # Adiciona uma coluna para razão entre o valor da transação e o órgão
     df['RATIO_MES'] = df['VALOR TRANSAÇÃO'] / df['MEDIA_VALOR_ORGAO_MES']
 
     return df
+
+def feature_engineering(df):
+
+    row_features(df)
+    return apply_aggregates(df, compute_aggregates(df))
@@ -0,0 +1,146 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from functions.feature_engineering import (
+    coluna_frequencia, grupo_orgao_mes, row_features, apply_aggregates
+)
+from functions.state_imput import rules_hash
+
+# Feature store incremental: guarda, por arquivo de origem, as contagens e somas
+# por trás de FREQ_*, MEDIA_VALOR_ORGAO_MES e RATIO_MES. Num novo mês, só as linhas
+# dos arquivos novos/alterados são agregadas; os totais saem da soma dos agregados.
+# ESTADO_ESTIMADO não vem do arquivo, e sim das regras de functions/state_imput.py:
+# o store guarda o rules_hash() e é refeito por inteiro quando as regras mudam.
+
+# Incrementar quando a definição das features agregadas mudar
+FEATURE_STORE_VERSION = 1
+
+INDEX_NAME = 'feature_store.json'
+CONTAGENS_NAME = 'contagens.parquet'
+GRUPOS_NAME = 'grupos_orgao_mes.parquet'
+
+def _file_signatures(df):
+    """
+    Signature of the rows of each source file present in df: row count and
+    the wrapping sum of ID_TRANSACAO. Any added, removed or changed
+    transaction changes it.
+    """
+    ids = pd.Series(df['ID_TRANSACAO'].to_numpy().view(np.uint64), index=df.index)
+    grupos = ids.groupby(df['ARQUIVO_ORIGEM'], observed=True)
+    assinaturas = pd.DataFrame({'linhas': grupos.size(), 'soma_ids': grupos.sum()})
+    return {
+        str(arquivo): [int(r.linhas), str(int(r.soma_ids))]
+        for arquivo, r in assinaturas.iterrows()
+    }
+
+def _aggregates_by_file(df):
+    """Contagens por valor e somas por órgão/ano/mês, separadas por arquivo de origem."""
+    contagens = []
+    for col in coluna_frequencia:
+        c = df.groupby(['ARQUIVO_ORIGEM', col], observed=True).size().rename('contagem').reset_index()
+        c = c.rename(columns={col: 'valor'})
+        c['coluna'] = col
+        contagens.append(c[['ARQUIVO_ORIGEM', 'coluna', 'valor', 'contagem']])
+    contagens = pd.concat(contagens, ignore_index=True)
+
+    g = df.groupby(['ARQUIVO_ORIGEM'] + grupo_orgao_mes, observed=True)['VALOR TRANSAÇÃO']
+    grupos = pd.DataFrame({'soma': g.sum(), 'contagem': g.count()}).reset_index()
+    return _as_plain(contagens), _as_plain(grupos)
+
+def _as_plain(df):
+    """Chaves como texto/inteiro simples (sem categóricos) para gravar e somar entre execuções."""
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str)
+    if 'valor' in df.columns:
+        df['valor'] = df['valor'].astype(str)
+    for col in ('ANO EXTRATO', 'MÊS EXTRATO'):
+        if col in df.columns:
+            df[col] = df[col].astype('int64')
+    return df
+
+def _load_store(store_dir):
+    path = os.path.join(store_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get('versao') != FEATURE_STORE_VERSION or index.get('regras_geo') != rules_hash():
+        return None
+    contagens = pd.read_parquet(os.path.join(store_dir, CONTAGENS_NAME))
+    grupos = pd.read_parquet(os.path.join(store_dir, GRUPOS_NAME))
+    return index, contagens, grupos
+
+def _save_store(store_dir, assinaturas, contagens, grupos):
+    os.makedirs(store_dir, exist_ok=True)
+    contagens.to_parquet(os.path.join(store_dir, CONTAGENS_NAME), index=False)
+    grupos.to_parquet(os.path.join(store_dir, GRUPOS_NAME), index=False)
+    path = os.path.join(store_dir, INDEX_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(
+            {'versao': FEATURE_STORE_VERSION, 'regras_geo': rules_hash(), 'arquivos': assinaturas},
+            f, ensure_ascii=False, indent=2
+        )
+    os.replace(path + '.tmp', path)
+
+def _totals(contagens, grupos):
+    """
+    Sums the per-file aggregates into the format expected by
+    feature_engineering.apply_aggregates.
+    """
+    totais = {
+        col: contagens[contagens['coluna'] == col].groupby('valor')['contagem'].sum()
+        for col in coluna_frequencia
+    }
+
+    g = grupos.groupby(grupo_orgao_mes)[['soma', 'contagem']].sum()
+    return {'contagens': totais, 'soma_mes': g['soma'], 'contagem_mes': g['contagem']}
+
+def update_feature_store(df, store_dir, verbose=False):
+    """
+    Updates the feature store with the rows of df and returns the global
+    aggregates (same format as compute_aggregates).
+
+    Only the rows of source files whose signature changed (new month,
+    re-downloaded file) are aggregated; files no longer in df are dropped
+    from the store. A change in the state estimation rules (which derive
+    ESTADO_ESTIMADO) invalidates every file.
+    """
+    assinaturas = _file_signatures(df)
+    armazenado = _load_store(store_dir)
+    if armazenado is None:
+        antigas, contagens, grupos = {}, None, None
+    else:
+        index, contagens, grupos = armazenado
+        antigas = index['arquivos']
+
+    validos = [a for a, s in assinaturas.items() if antigas.get(a) == s]
+    pendentes = [a for a in assinaturas if a not in validos]
+
+    partes_contagens, partes_grupos = [], []
+    if contagens is not None:
+        partes_contagens.append(contagens[contagens['ARQUIVO_ORIGEM'].isin(validos)])
+        partes_grupos.append(grupos[grupos['ARQUIVO_ORIGEM'].isin(validos)])
+    if pendentes:
+        novos = df[df['ARQUIVO_ORIGEM'].isin(pendentes)]
+        novas_contagens, novos_grupos = _aggregates_by_file(novos)
+        partes_contagens.append(novas_contagens)
+        partes_grupos.append(novos_grupos)
+
+    contagens = pd.concat(partes_contagens, ignore_index=True)
+    grupos = pd.concat(partes_grupos, ignore_index=True)
+    if pendentes or set(antigas) != set(assinaturas):
+        _save_store(store_dir, assinaturas, contagens, grupos)
+
+    if verbose:
+        print(f"Feature store: {len(validos)} arquivo(s) reaproveitado(s), {len(pendentes)} agregado(s)")
+    return _totals(contagens, grupos)
+
+def feature_engineering_incremental(df, store_dir, verbose=False):
+    """
+    Same output as feature_engineering, with the global statistics taken from
+    the feature store in store_dir instead of a full rescan.
+    """
+    row_features(df)
+    return apply_aggregates(df, update_feature_store(df, store_dir, verbose=verbose))
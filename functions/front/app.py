@@ -1,10 +1,13 @@
 import os
 import io
+import json
 import base64
 from datetime import datetime, timedelta
 import streamlit as st
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
 import plotly.express as px
 import folium
 from folium.plugins import HeatMap
@@ -85,6 +88,9 @@ TRANS = {
         "kpi_trans": "Transações filtradas",
         "kpi_valor": "Valor total filtrado",
         "kpi_anom_valor": "Valor total das anomalias",
+        "kpi_anom_decil": "(decil de risco da base)",
+        "kpi_anom_help": "Anomalias: transações com TECHNICAL_LABEL = -1 no ETL.",
+        "kpi_anom_decil_help": "Anomalias: transações com Pontuação de Risco entre os 10% maiores de toda a base do mesmo tipo (sigilosas ou não sigilosas). O corte é fixo e não é recalculado sobre a seleção filtrada.",
         "kpi_estado": "Estado Principal",
         "map_anom": '<i class="fa-solid fa-map" style="margin-right:8px;"></i> Mapa de Calor: Risco & Anomalias',
         "map_spend": '<i class="fa-solid fa-dollar-sign" style="margin-right:8px;"></i> Mapa de Calor: Volume de Gastos',
@@ -100,7 +106,14 @@ TRANS = {
         "csv_cap": "Ideal para auditoria completa e importação em outros sistemas.",
         "csv_btn": "Baixar Tudo",
         "csv_help": "Baixa todos os dados filtrados atualmente, sem limite de linhas.",
-        "rows_label": "linhas"
+        "rows_label": "linhas",
+        "export_prepare": "Preparar arquivos de exportação",
+        "export_prepare_help": "Lê as colunas completas das transações filtradas para gerar os arquivos.",
+        "weights_title": "Pesos da Pontuação de Risco",
+        "weight_tech": "Peso do Score Técnico",
+        "weight_tech_help": "O restante vai para o Risco Financeiro.",
+        "weight_lof": "Peso do LOF no Score Técnico",
+        "weight_lof_help": "O restante vai para o Isolation Forest."
     },
     "en": {
         "title": "🦉 Project Jacurutu",
@@ -119,6 +132,9 @@ TRANS = {
         "kpi_trans": "Filtered transactions",
         "kpi_valor": "Total amount",
         "kpi_anom_valor": "Total amount of anomalies",
+        "kpi_anom_decil": "(dataset risk decile)",
+        "kpi_anom_help": "Anomalies: transactions with TECHNICAL_LABEL = -1 in the ETL.",
+        "kpi_anom_decil_help": "Anomalies: transactions whose Risk Score is in the top 10% of the whole dataset of the same kind (classified or not). The cut-off is fixed and is not recomputed over the filtered selection.",
         "kpi_estado": "Top state",
         "map_anom": '<i class="fa-solid fa-map"></i> Heatmap: Anomalies',
         "map_spend": '<i class="fa-solid fa-dollar-sign"></i> Heatmap: Spending Volume',
@@ -134,7 +150,14 @@ TRANS = {
         "csv_cap": "Best for full audits and importing into other systems.",
         "csv_btn": "Download All",
         "csv_help": "Downloads all currently filtered data, with no row limit.",
-        "rows_label": "rows"
+        "rows_label": "rows",
+        "export_prepare": "Prepare export files",
+        "export_prepare_help": "Reads the full columns of the filtered transactions to build the files.",
+        "weights_title": "Risk Score Weights",
+        "weight_tech": "Technical Score weight",
+        "weight_tech_help": "The rest goes to Financial Risk.",
+        "weight_lof": "LOF weight in the Technical Score",
+        "weight_lof_help": "The rest goes to Isolation Forest."
     }
 }
 
@@ -153,17 +176,395 @@ COORDS_ESTADOS = {
 }
 
 
+# Colunas mantidas como categóricas (mesma política do ETL em functions/clean_df.py)
+COLUNAS_CATEGORICAS = [
+    "NOME ÓRGÃO SUPERIOR", "NOME ÓRGÃO", "NOME UNIDADE GESTORA", "NOME FAVORECIDO",
+    "TRANSAÇÃO", "ARQUIVO_ORIGEM", "ESTADO_ESTIMADO"
+]
+
+
+# Pesos padrão da Pontuação de Risco (os mesmos do ETL em functions/pipeline.py);
+# o Score Técnico gravado é a média de LOF e IF
+PESO_TECNICO_PADRAO = 0.7
+PESO_LOF_PADRAO = 0.5
+
+# Componentes gravados pelo ETL (float32) para recalcular a prioridade com outros pesos
+COLUNAS_PRIORIDADE = ["LOF_SCORE_NORM", "IF_SCORE_NORM", "FINANCIAL_RISK"]
+
+
+def recompute_priority(df_input, peso_tecnico, peso_lof):
+    """PRIORITY_SCORE com outros pesos, vetorizado em float32 sobre os componentes do ETL."""
+    lof = df_input["LOF_SCORE_NORM"].to_numpy(np.float32)
+    iso = df_input["IF_SCORE_NORM"].to_numpy(np.float32)
+    financeiro = df_input["FINANCIAL_RISK"].to_numpy(np.float32)
+    tecnico = np.float32(peso_lof) * lof + np.float32(1 - peso_lof) * iso
+    return np.float32(peso_tecnico) * tecnico + np.float32(1 - peso_tecnico) * financeiro
+
+
+def top_k(scores, k):
+    """Posições das k maiores pontuações, em ordem decrescente, sem ordenar o resto."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    posicoes = np.argpartition(-scores, k - 1)[:k]
+    return posicoes[np.argsort(-scores[posicoes], kind="stable")]
+
+
 # 2. CARREGAMENTO DE DADOS
-@st.cache_data
-def load_data():
-    path = "functions/front/dashboard_data.parquet"
-    if not os.path.exists(path):
-        path = "dashboard_data.parquet"
-    if os.path.exists(path):
-        return pd.read_parquet(path)
-    return pd.DataFrame()
+# O ETL grava um dataset Parquet particionado por ANO EXTRATO/MÊS EXTRATO/SIGILOSO
+# (functions/dashboard_store.py). As colunas do painel ficam em memória, uma cópia
+# por processo, junto de um índice dos filtros montado na carga: as opções da
+# cascata e as linhas filtradas saem do índice, sem varrer a tabela. A exportação
+# lê as demais colunas do dataset com os filtros aplicados na leitura (partições
+# e row groups que não casam com o filtro não são lidos).
+CAMINHOS_DADOS = [
+    "functions/front/dashboard_data",
+    "dashboard_data",
+]
+
+# Colunas lidas por visão: o Parquet também traz as features do ETL e os scores
+# brutos, que nenhum widget mostra e por isso nunca são lidos aqui
+COLUNAS_CASCATA = ["ESTADO_ESTIMADO", "NOME ÓRGÃO SUPERIOR", "NOME ÓRGÃO", "NOME UNIDADE GESTORA"]
+COLUNAS_FILTROS = COLUNAS_CASCATA + ["SIGILOSO", "DATA TRANSAÇÃO", "ANO EXTRATO", "MÊS EXTRATO"]
+COLUNAS_PAINEL = [
+    "DATA TRANSAÇÃO", "ANO EXTRATO", "MÊS EXTRATO", "SIGILOSO", "ESTADO_ESTIMADO",
+    "NOME ÓRGÃO SUPERIOR", "NOME ÓRGÃO", "NOME FAVORECIDO", "TRANSAÇÃO",
+    "VALOR TRANSAÇÃO", "PRIORITY_SCORE", "TECHNICAL_LABEL"
+]
+# Só lidas quando a exportação é pedida
+COLUNAS_EXPORTACAO = [
+    "CÓDIGO ÓRGÃO SUPERIOR", "NOME ÓRGÃO SUPERIOR", "CÓDIGO ÓRGÃO", "NOME ÓRGÃO",
+    "CÓDIGO UNIDADE GESTORA", "NOME UNIDADE GESTORA", "ANO EXTRATO", "MÊS EXTRATO",
+    "CNPJ OU CPF FAVORECIDO", "NOME FAVORECIDO", "TRANSAÇÃO", "DATA TRANSAÇÃO",
+    "VALOR TRANSAÇÃO", "ESTADO_ESTIMADO", "SIGILOSO", "PRIORITY_SCORE", "TECHNICAL_LABEL"
+]
+
+
+@st.cache_resource
+def open_dataset():
+    for path in CAMINHOS_DADOS:
+        if os.path.isdir(path):
+            return ds.dataset(path, format="parquet", partitioning="hive")
+    return None
+
+
+def dataset_attrs(dataset):
+    """df.attrs gravados pelo ETL (pesos da prioridade, limiares...)."""
+    metadata = dataset.schema.metadata or {}
+    return json.loads(metadata[b"PANDAS_ATTRS"]) if b"PANDAS_ATTRS" in metadata else {}
+
+
+def to_frame(table):
+    df_out = table.to_pandas()
+    # Parquets antigos (gerados antes da política) chegam como texto
+    for col in COLUNAS_CATEGORICAS:
+        if col in df_out.columns and not isinstance(df_out[col].dtype, pd.CategoricalDtype):
+            df_out[col] = df_out[col].astype("category")
+    return df_out
+
+
+def impute_dates(df_out):
+    mask_sem_data = df_out["DATA TRANSAÇÃO"].isna()
+    if mask_sem_data.any():
+        # Cria data dia 01 do mês/ano de referência
+        datas_imputadas = pd.to_datetime(
+            df_out.loc[mask_sem_data, "ANO EXTRATO"].astype(str) + "-" +
+            df_out.loc[mask_sem_data, "MÊS EXTRATO"].astype(str) + "-01",
+            errors='coerce'
+        )
+        df_out.loc[mask_sem_data, "DATA TRANSAÇÃO"] = datas_imputadas
+    return df_out
 
-df = load_data()
+
+def value_index(serie):
+    """
+    Posições das linhas de cada valor distinto de serie: todas as posições em
+    ordem do valor (ordem[limites[i]:limites[i + 1]] são as linhas de valores[i]).
+    Valores nulos ficam de fora.
+    """
+    codigos, valores = pd.factorize(serie, sort=True)
+    # Códigos de 16 bits usam o radix sort do numpy
+    codigos = codigos.astype(np.int16 if len(valores) < 2**15 else np.int32)
+    ordem = np.argsort(codigos, kind="stable").astype(np.int32)
+    limites = np.searchsorted(codigos[ordem], np.arange(len(valores) + 1))
+    return {
+        "valores": np.asarray(valores),
+        "posicao": {v: i for i, v in enumerate(valores)},
+        "ordem": ordem,
+        "limites": limites,
+        "codigos": codigos,
+    }
+
+
+def build_filter_index(df_filtros):
+    """
+    Índice dos filtros sobre as linhas de df_filtros (mesma ordem da tabela do painel):
+    - posições das linhas de cada valor das colunas da cascata (value_index);
+    - o SIGILOSO de cada linha;
+    - o mesmo índice por data (com a imputação do dia 01), com as datas distintas
+      em ordem para achar um período por busca binária;
+    - as combinações distintas da cascata, de onde saem as opções de cada nível.
+    """
+    indice = {"linhas": len(df_filtros), "valores": {}}
+    chave = np.zeros(len(df_filtros), dtype=np.int64)
+    for col in COLUNAS_CASCATA:
+        indice["valores"][col] = valores = value_index(df_filtros[col])
+        chave = chave * (len(valores["valores"]) + 1) + valores.pop("codigos") + 1
+
+    # Combinações distintas, decodificadas da chave única
+    unicas = pd.unique(chave)
+    combinacoes = {}
+    for col in reversed(COLUNAS_CASCATA):
+        valores = indice["valores"][col]["valores"]
+        unicas, codigos = np.divmod(unicas, len(valores) + 1)
+        combinacoes[col] = pd.Categorical.from_codes(codigos - 1, categories=valores)
+    indice["combinacoes"] = pd.DataFrame({col: combinacoes[col] for col in COLUNAS_CASCATA})
+
+    indice["sigiloso"] = pd.to_numeric(df_filtros["SIGILOSO"], errors='coerce').fillna(0).to_numpy(np.int8)
+
+    datas = df_filtros["DATA TRANSAÇÃO"]
+    indice["data_min"], indice["data_max"] = datas.min(), datas.max()
+    datas = impute_dates(df_filtros[["DATA TRANSAÇÃO", "ANO EXTRATO", "MÊS EXTRATO"]].copy())["DATA TRANSAÇÃO"]
+    indice["datas"] = value_index(datas)
+    indice["datas"].pop("codigos")
+    indice["datas"]["valores"] = indice["datas"]["valores"].astype("datetime64[ns]")
+    return indice
+
+
+@st.cache_resource
+def load_panel():
+    """Colunas do painel (pyarrow.Table, compartilhada entre as sessões) e o índice dos filtros."""
+    dataset = open_dataset()
+    if dataset is None:
+        return None
+    nomes = dataset.schema.names
+    colunas = [c for c in dict.fromkeys(COLUNAS_PAINEL + COLUNAS_PRIORIDADE + COLUNAS_FILTROS) if c in nomes]
+    tabela = dataset.to_table(columns=colunas)
+    indice = build_filter_index(to_frame(tabela.select(COLUNAS_FILTROS)))
+    return {"tabela": tabela.select([c for c in colunas if c in COLUNAS_PAINEL + COLUNAS_PRIORIDADE]), "indice": indice}
+
+
+def cascade_options(indice, col, selecoes):
+    """Opções de col dadas as seleções dos níveis acima ({coluna: valores})."""
+    combinacoes = indice["combinacoes"]
+    mascara = np.ones(len(combinacoes), dtype=bool)
+    for pai, selecao in selecoes.items():
+        if selecao:
+            mascara &= combinacoes[pai].isin(selecao).to_numpy()
+    return sorted(combinacoes.loc[mascara, col].unique().tolist())
+
+
+def value_bitmap(indice, col, selecao):
+    """Bitmap das linhas com algum dos valores selecionados em col."""
+    valores = indice["valores"][col]
+    bitmap = np.zeros(indice["linhas"], dtype=bool)
+    for v in selecao:
+        i = valores["posicao"].get(v)
+        if i is not None:
+            bitmap[valores["ordem"][valores["limites"][i]:valores["limites"][i + 1]]] = True
+    return bitmap
+
+
+def filter_rows(indice, filtros):
+    """Posições das linhas que passam nos filtros: interseção dos bitmaps de cada filtro."""
+    estados, orgsup, orgs, ugs, sigiloso, periodo = filtros
+    mascara = indice["sigiloso"] == sigiloso
+    for col, selecao in zip(COLUNAS_CASCATA, (estados, orgsup, orgs, ugs)):
+        if selecao:
+            mascara &= value_bitmap(indice, col, selecao)
+
+    if periodo:
+        # Datas distintas do período por busca binária; as linhas são um trecho contíguo da ordem
+        datas = indice["datas"]
+        inicio = np.searchsorted(datas["valores"], np.datetime64(pd.to_datetime(periodo[0]), "ns"), side="left")
+        fim = np.searchsorted(datas["valores"], np.datetime64(pd.to_datetime(periodo[1]), "ns"), side="right")
+        no_periodo = np.zeros(indice["linhas"], dtype=bool)
+        no_periodo[datas["ordem"][datas["limites"][inicio]:datas["limites"][fim]]] = True
+        mascara &= no_periodo
+    return np.flatnonzero(mascara)
+
+
+def build_filter(dataset, estados, orgsup, orgs, ugs, sigiloso, periodo):
+    """Expressão do pyarrow.dataset equivalente aos filtros da barra lateral."""
+    filtro = ds.field("SIGILOSO") == sigiloso
+    for col, selecao in [("ESTADO_ESTIMADO", estados), ("NOME ÓRGÃO SUPERIOR", orgsup),
+                         ("NOME ÓRGÃO", orgs), ("NOME UNIDADE GESTORA", ugs)]:
+        if selecao:
+            filtro &= ds.field(col).isin(list(selecao))
+
+    if periodo:
+        inicio, fim = pd.to_datetime(periodo[0]), pd.to_datetime(periodo[1])
+        tipo_data = dataset.schema.field("DATA TRANSAÇÃO").type
+        data = ds.field("DATA TRANSAÇÃO")
+        com_data = (data >= pa.scalar(inicio.to_pydatetime(), type=tipo_data)) & \
+                   (data <= pa.scalar(fim.to_pydatetime(), type=tipo_data))
+
+        # Sem data (sigilosas): vale o dia 01 do mês do extrato, como na imputação
+        mes = ds.field("ANO EXTRATO") * 12 + ds.field("MÊS EXTRATO") - 1
+        primeiro_mes = inicio.year * 12 + inicio.month - 1 + (0 if inicio == inicio.replace(day=1) else 1)
+        ultimo_mes = fim.year * 12 + fim.month - 1
+        sem_data = data.is_null() & (mes >= primeiro_mes) & (mes <= ultimo_mes)
+        filtro &= com_data | sem_data
+    return filtro
+
+
+@st.cache_data(max_entries=8)
+def load_filtered(filtros, colunas):
+    dataset = open_dataset()
+    return impute_dates(to_frame(dataset.to_table(columns=list(colunas), filter=build_filter(dataset, *filtros))))
+
+
+def finish_view(df_out, pesos):
+    if "SIGILOSO" in df_out.columns:
+        df_out["SIGILOSO"] = pd.to_numeric(df_out["SIGILOSO"], errors='coerce').fillna(0).astype(int)
+    if pesos:
+        df_out["PRIORITY_SCORE"] = recompute_priority(df_out, *pesos)
+    return df_out
+
+
+def priority_at(linhas, pesos=None):
+    """PRIORITY_SCORE das linhas do painel (todas com linhas=None), recalculado se houver pesos."""
+    tabela = load_panel()["tabela"]
+    colunas = COLUNAS_PRIORIDADE if pesos else ["PRIORITY_SCORE"]
+    tabela = tabela.select(colunas) if linhas is None else tabela.select(colunas).take(linhas)
+    if pesos:
+        return recompute_priority(tabela.to_pandas(), *pesos)
+    return tabela.column("PRIORITY_SCORE").to_numpy()
+
+
+def load_rows(linhas, colunas, pesos=None):
+    """
+    Linhas do painel nas posições dadas (na mesma ordem), só com as colunas
+    pedidas. Com pesos = (peso_tecnico, peso_lof), recalcula o PRIORITY_SCORE
+    a partir dos componentes.
+    """
+    tabela = load_panel()["tabela"]
+    if pesos:
+        colunas = colunas + COLUNAS_PRIORIDADE
+    if "DATA TRANSAÇÃO" in colunas:
+        colunas = colunas + ["ANO EXTRATO", "MÊS EXTRATO"]
+    nomes = [c for c in dict.fromkeys(colunas) if c in tabela.column_names]
+    df_out = to_frame(tabela.select(nomes).take(linhas))
+    if "DATA TRANSAÇÃO" in df_out.columns:
+        impute_dates(df_out)
+    return finish_view(df_out, pesos)
+
+
+def load_export(filtros, pesos=None):
+    """Linhas filtradas com as colunas de exportação, lidas do dataset só quando pedidas."""
+    colunas = COLUNAS_EXPORTACAO + (COLUNAS_PRIORIDADE if pesos else [])
+    nomes = open_dataset().schema.names
+    df_out = load_filtered(filtros, tuple(c for c in dict.fromkeys(colunas) if c in nomes))
+    return finish_view(df_out, pesos)
+
+
+# 2.1. CUBO DE AGREGADOS
+# O ETL grava ao lado do dataset um cubo pequeno (estado x órgão superior x órgão x
+# unidade x mês x sigilo) com VALOR_TOTAL, TRANSACOES, VALOR_ANOMALIAS e RISCO_MAX.
+# KPIs, mapas e gráfico mensal saem dele; só os meses cortados pelo período (e tudo,
+# com outros pesos) são agregados a partir das linhas, com a mesma regra do ETL.
+CAMINHOS_CUBO = [
+    "functions/front/dashboard_cube.parquet",
+    "dashboard_cube.parquet",
+]
+
+# Mesma regra de anomalia do cubo (functions/dashboard_store.py): TECHNICAL_LABEL
+# quando existir; senão o decil superior de PRIORITY_SCORE da partição SIGILOSO
+QUANTIL_ANOMALIA = 0.90
+COLUNAS_AGREGADOS = ["VALOR_TOTAL", "TRANSACOES", "VALOR_ANOMALIAS", "RISCO_MAX"]
+COLUNAS_LINHAS_CUBO = ["ESTADO_ESTIMADO", "DATA TRANSAÇÃO", "SIGILOSO", "VALOR TRANSAÇÃO", "PRIORITY_SCORE", "TECHNICAL_LABEL"]
+
+
+@st.cache_resource
+def load_cube():
+    for path in CAMINHOS_CUBO:
+        if os.path.exists(path):
+            return pd.read_parquet(path)
+    return None
+
+
+@st.cache_data
+def anomaly_cuts(pesos=None):
+    """Corte de PRIORITY_SCORE de cada partição SIGILOSO: o do ETL ou, com outros pesos, recalculado."""
+    cubo = load_cube()
+    if not pesos and cubo is not None and "cortes_anomalia" in cubo.attrs:
+        return {int(s): float(c) for s, c in cubo.attrs["cortes_anomalia"].items()}
+    prioridade = priority_at(None, pesos)
+    sigilo = load_panel()["indice"]["sigiloso"]
+    return {int(s): float(np.quantile(prioridade[sigilo == s], QUANTIL_ANOMALIA)) for s in np.unique(sigilo)}
+
+
+def summarize(df_input):
+    """Agregados por estado e mês."""
+    return df_input.groupby(["ESTADO_ESTIMADO", "MES"], observed=True, dropna=False).agg(
+        VALOR_TOTAL=("VALOR_TOTAL", "sum"),
+        TRANSACOES=("TRANSACOES", "sum"),
+        VALOR_ANOMALIAS=("VALOR_ANOMALIAS", "sum"),
+        RISCO_MAX=("RISCO_MAX", "max"),
+    ).reset_index()
+
+
+def aggregate_rows(linhas, pesos=None):
+    """Os agregados do cubo calculados sobre as linhas dadas."""
+    df_rows = load_rows(linhas, COLUNAS_LINHAS_CUBO, pesos)
+    valor = df_rows["VALOR TRANSAÇÃO"].to_numpy()
+    if "TECHNICAL_LABEL" in df_rows.columns:
+        anomalia = (df_rows["TECHNICAL_LABEL"] == -1).to_numpy()
+    else:
+        corte = df_rows["SIGILOSO"].map(anomaly_cuts(pesos)).to_numpy(dtype=float)
+        anomalia = df_rows["PRIORITY_SCORE"].to_numpy() >= corte
+    return summarize(pd.DataFrame({
+        "ESTADO_ESTIMADO": df_rows["ESTADO_ESTIMADO"],
+        "MES": df_rows["DATA TRANSAÇÃO"].dt.to_period("M").astype(str),
+        "VALOR_TOTAL": valor,
+        "TRANSACOES": 1,
+        "VALOR_ANOMALIAS": np.where(anomalia, valor, 0.0),
+        "RISCO_MAX": df_rows["PRIORITY_SCORE"].to_numpy(),
+    }))
+
+
+def split_period(periodo):
+    """Meses inteiros do período ('AAAA-MM') e os trechos (início, fim) dos meses cortados."""
+    inicio, fim = pd.Timestamp(periodo[0]), pd.Timestamp(periodo[1])
+    meses, trechos = [], []
+    for mes in pd.period_range(inicio, fim, freq="M"):
+        primeiro, ultimo = mes.start_time.normalize(), mes.end_time.normalize()
+        if inicio <= primeiro and ultimo <= fim:
+            meses.append(str(mes))
+        else:
+            trechos.append((max(inicio, primeiro), min(fim, ultimo)))
+    return meses, trechos
+
+
+def load_aggregates(filtros, pesos=None):
+    """
+    VALOR_TOTAL, TRANSACOES, VALOR_ANOMALIAS e RISCO_MAX por estado e mês das
+    transações filtradas, a partir do cubo; sem cubo ou com outros pesos, a
+    partir das linhas filtradas.
+    """
+    cubo = load_cube()
+    indice = load_panel()["indice"]
+    if cubo is None or pesos:
+        return aggregate_rows(filter_rows(indice, filtros), pesos)
+
+    estados, orgsup, orgs, ugs, sigiloso, periodo = filtros
+    mascara = cubo["SIGILOSO"].to_numpy() == sigiloso
+    for col, selecao in zip(COLUNAS_CASCATA, (estados, orgsup, orgs, ugs)):
+        if selecao:
+            mascara &= cubo[col].isin(selecao).to_numpy()
+
+    partes = []
+    if periodo:
+        meses, trechos = split_period(periodo)
+        mascara &= cubo["MES"].isin(meses).to_numpy()
+        # Meses cortados pelo período: só essas linhas são lidas
+        for trecho in trechos:
+            partes.append(aggregate_rows(filter_rows(indice, filtros[:5] + (trecho,))))
+    partes.append(cubo.loc[mascara, ["ESTADO_ESTIMADO", "MES"] + COLUNAS_AGREGADOS])
+    return summarize(pd.concat(partes, ignore_index=True))
+
+dataset = open_dataset()
+painel = load_panel()
 
 
 # 3. SIDEBAR + FILTROS EM CASCATA
@@ -174,39 +575,39 @@ with st.sidebar:
 
     st.markdown(f'<h3 style="margin-bottom:0.5rem;">{T["sidebar_filters"]}</h3>', unsafe_allow_html=True)
 
-    if df.empty:
+    if painel is None or painel["indice"]["linhas"] == 0:
         st.warning(T["warning_nodata"])
         st.stop()
+    indice = painel["indice"]
 
     # 3.1. Estado
-    estados = sorted(df["ESTADO_ESTIMADO"].unique().tolist())
+    estados = cascade_options(indice, "ESTADO_ESTIMADO", {})
     estado_sel = st.multiselect(T["filter_estado"], estados)
 
-    df_tmp = df[df["ESTADO_ESTIMADO"].isin(estado_sel)] if estado_sel else df
-
     # 3.2. Órgão Superior
-    orgsup_opts = sorted(df_tmp["NOME ÓRGÃO SUPERIOR"].unique().tolist())
+    orgsup_opts = cascade_options(indice, "NOME ÓRGÃO SUPERIOR", {"ESTADO_ESTIMADO": estado_sel})
     orgsup_sel = st.multiselect(T["filter_orgsup"], orgsup_opts)
 
-    if orgsup_sel: df_tmp = df_tmp[df_tmp["NOME ÓRGÃO SUPERIOR"].isin(orgsup_sel)]
-
     # 3.3. Órgão
-    org_opts = sorted(df_tmp["NOME ÓRGÃO"].unique().tolist())
+    org_opts = cascade_options(indice, "NOME ÓRGÃO", {"ESTADO_ESTIMADO": estado_sel, "NOME ÓRGÃO SUPERIOR": orgsup_sel})
     org_sel = st.multiselect(T["filter_org"], org_opts)
 
-    if org_sel: df_tmp = df_tmp[df_tmp["NOME ÓRGÃO"].isin(org_sel)]
-
     # 3.4. Unidade Gestora
-    ug_opts = sorted(df_tmp["NOME UNIDADE GESTORA"].unique().tolist())
+    ug_opts = cascade_options(indice, "NOME UNIDADE GESTORA", {
+        "ESTADO_ESTIMADO": estado_sel, "NOME ÓRGÃO SUPERIOR": orgsup_sel, "NOME ÓRGÃO": org_sel
+    })
     ug_sel = st.multiselect(T["filter_ug"], ug_opts)
 
     # 3.5. Sigilo
     sigilo_choice = st.radio(T["filter_sigilo"], [T["sigilo_sim"], T["sigilo_nao"]], index=1)
 
     # 3.6. Data
-    min_d, max_d = df["DATA TRANSAÇÃO"].min(), df["DATA TRANSAÇÃO"].max()
+    min_d, max_d = indice["data_min"], indice["data_max"]
     if pd.isna(max_d): max_d = datetime.now()
     if pd.isna(min_d): min_d = max_d - timedelta(days=90)
+    # Período padrão em meses inteiros: KPIs, mapas e gráfico saem só do cubo
+    min_d = pd.Timestamp(min_d).replace(day=1).date()
+    max_d = (pd.Timestamp(max_d) + pd.offsets.MonthEnd(0)).date()
 
     start_def = max_dt = datetime.now()
     try:
@@ -214,49 +615,34 @@ with st.sidebar:
     except:
         date_sel = [min_d, max_d]
 
-# APLICAÇÃO DOS FILTROS
-df_f = df.copy()
-
-mask_sem_data = df_f["DATA TRANSAÇÃO"].isna()
-if mask_sem_data.any() and "ANO EXTRATO" in df_f.columns and "MÊS EXTRATO" in df_f.columns:
-    # Cria data dia 01 do mês/ano de referência
-    datas_imputadas = pd.to_datetime(
-        df_f.loc[mask_sem_data, "ANO EXTRATO"].astype(str) + "-" +
-        df_f.loc[mask_sem_data, "MÊS EXTRATO"].astype(str) + "-01",
-        errors='coerce'
-    )
-    df_f.loc[mask_sem_data, "DATA TRANSAÇÃO"] = datas_imputadas
-
-# 1. Filtros de Categoria (Cascata)
-if 'estado_sel' in locals() and estado_sel:
-    df_f = df_f[df_f["ESTADO_ESTIMADO"].isin(estado_sel)]
-
-if 'orgsup_sel' in locals() and orgsup_sel:
-    df_f = df_f[df_f["NOME ÓRGÃO SUPERIOR"].isin(orgsup_sel)]
-
-if 'org_sel' in locals() and org_sel:
-    df_f = df_f[df_f["NOME ÓRGÃO"].isin(org_sel)]
+    # 3.7. Pesos da Pontuação de Risco (só se o Parquet tiver os componentes)
+    peso_tecnico, peso_lof = PESO_TECNICO_PADRAO, PESO_LOF_PADRAO
+    if all(c in dataset.schema.names for c in COLUNAS_PRIORIDADE):
+        pesos_etl = dataset_attrs(dataset).get("pesos_prioridade", {})
+        peso_tecnico_etl = float(pesos_etl.get("tecnico", PESO_TECNICO_PADRAO))
+        st.markdown(f"**{T['weights_title']}**")
+        peso_tecnico = st.slider(T["weight_tech"], 0.0, 1.0, peso_tecnico_etl, 0.05, help=T["weight_tech_help"])
+        peso_lof = st.slider(T["weight_lof"], 0.0, 1.0, PESO_LOF_PADRAO, 0.05, help=T["weight_lof_help"])
+        pesos_alterados = (peso_tecnico, peso_lof) != (peso_tecnico_etl, PESO_LOF_PADRAO)
+    else:
+        pesos_alterados = False
 
-if 'ug_sel' in locals() and ug_sel:
-    df_f = df_f[df_f["NOME UNIDADE GESTORA"].isin(ug_sel)]
+# APLICAÇÃO DOS FILTROS (pelo índice; na leitura do dataset para a exportação)
+periodo = None
+if isinstance(date_sel, (list, tuple)) and len(date_sel) == 2:
+    periodo = (date_sel[0], date_sel[1])
 
-# 2. Filtro de Sigilo
-df_f["SIGILOSO"] = pd.to_numeric(df_f["SIGILOSO"], errors='coerce').fillna(0).astype(int)
+filtros = (
+    tuple(estado_sel), tuple(orgsup_sel), tuple(org_sel), tuple(ug_sel),
+    1 if sigilo_choice == T["sigilo_sim"] else 0, periodo
+)
 
-if 'sigilo_choice' in locals():
-    if sigilo_choice == T["sigilo_sim"]:
-        df_f = df_f[df_f["SIGILOSO"] == 1]
-    else:
-        df_f = df_f[df_f["SIGILOSO"] == 0]
+# 4. Pesos: com outros pesos, a prioridade é recalculada a partir dos componentes
+pesos = (peso_tecnico, peso_lof) if pesos_alterados else None
 
-# 3. Filtro de Período
-if 'date_sel' in locals() and isinstance(date_sel, (list, tuple)) and len(date_sel) == 2:
-    try:
-        start_dt = pd.to_datetime(date_sel[0])
-        end_dt = pd.to_datetime(date_sel[1])
-        df_f = df_f[(df_f["DATA TRANSAÇÃO"] >= start_dt) & (df_f["DATA TRANSAÇÃO"] <= end_dt)]
-    except Exception:
-        pass
+# Agregados por estado e mês (cubo) e posições das linhas filtradas (índice)
+df_agg = load_aggregates(filtros, pesos)
+linhas = filter_rows(indice, filtros)
 
 # 5. Layout Principal
 if logo_base64:
@@ -342,7 +728,7 @@ $$
 - **Score Técnico:** média dos scores de IF e LOF — mede quão atípica é a transação.
 - **Risco Financeiro:** valor monetário da transação — maior valor = maior materialidade.
 
-Essa combinação evita que anomalias de valor ínfimo recebam prioridade acima de casos de maior impacto financeiro.
+Essa combinação evita que anomalias de valor ínfimo recebam prioridade acima de casos de maior impacto financeiro. Os pesos podem ser ajustados na barra lateral sem reprocessar os dados.
 
 ---
 
@@ -411,7 +797,7 @@ $$
 - **Technical Score:** average of IF and LOF scores.
 - **Financial Risk:** transaction amount.
 
-This prevents low-value anomalies from outranking high-impact transactions.
+This prevents low-value anomalies from outranking high-impact transactions. The weights can be adjusted in the sidebar without reprocessing the data.
 
 ---
 
@@ -452,32 +838,39 @@ Jacurutu **does not claim fraud**. It flags unusual patterns to guide human audi
 
 elif selected == T["menu_items"][1]:
 
-    if df_f.empty:
+    total_transacoes = int(df_agg["TRANSACOES"].sum())
+    if total_transacoes == 0:
         st.warning(T["warning_filter_empty"])
         st.stop()
 
-    # --- ANOMALIAS FILTRADAS ---
-    if "TECHNICAL_LABEL" in df_f.columns:
-        df_anomalias = df_f[df_f["TECHNICAL_LABEL"] == -1]
-    else:
-        corte_risco = df_f["PRIORITY_SCORE"].quantile(0.90)
-        df_anomalias = df_f[df_f["PRIORITY_SCORE"] >= corte_risco]
+    # Totais por estado (KPI 4 e mapas)
+    df_geo = df_agg.groupby("ESTADO_ESTIMADO", observed=True).agg(
+        VALOR_TOTAL=("VALOR_TOTAL", "sum"),
+        TRANSACOES=("TRANSACOES", "sum"),
+        RISCO_MAX=("RISCO_MAX", "max")
+    ).reset_index()
 
     # --- KPIs ---
     k1, k2, k3, k4 = st.columns(4)
 
     # KPI 1: Transações
-    k1.metric(T["kpi_trans"], f"{len(df_f):,}")
+    k1.metric(T["kpi_trans"], f"{total_transacoes:,}")
 
     # KPI 2: Valor Total
-    k2.metric(T["kpi_valor"], f"R$ {df_f['VALOR TRANSAÇÃO'].sum():,.2f}")
-
-    # KPI 3: Valor das Anomalias
-    total_anomalo = df_anomalias['VALOR TRANSAÇÃO'].sum()
-    k3.metric(T["kpi_anom_valor"], f"R$ {total_anomalo:,.2f}")
+    valor_total = df_agg["VALOR_TOTAL"].sum()
+    k2.metric(T["kpi_valor"], f"R$ {valor_total:,.2f}")
+
+    # KPI 3: Valor das Anomalias. Sem TECHNICAL_LABEL, o corte é o decil de cada
+    # partição SIGILOSO na base toda (o do cubo), não o da seleção: o rótulo avisa
+    total_anomalo = df_agg["VALOR_ANOMALIAS"].sum()
+    if "TECHNICAL_LABEL" in painel["tabela"].column_names:
+        k3.metric(T["kpi_anom_valor"], f"R$ {total_anomalo:,.2f}", help=T["kpi_anom_help"])
+    else:
+        k3.metric(f'{T["kpi_anom_valor"]} {T["kpi_anom_decil"]}', f"R$ {total_anomalo:,.2f}", help=T["kpi_anom_decil_help"])
 
-    # KPI 4: Estado Principal
-    top_state = df_f["ESTADO_ESTIMADO"].mode()[0] if not df_f.empty else "-"
+    # KPI 4: Estado Principal (moda: o de mais transações; empate, o primeiro em ordem alfabética)
+    mais_frequentes = df_geo.sort_values(["TRANSACOES", "ESTADO_ESTIMADO"], ascending=[False, True])
+    top_state = mais_frequentes["ESTADO_ESTIMADO"].iloc[0] if not mais_frequentes.empty else "-"
     k4.metric(T["kpi_estado"], top_state)
 
     st.divider()
@@ -487,11 +880,6 @@ elif selected == T["menu_items"][1]:
 
     # 1. Preparação dos Dados
     with st.spinner("Calculando geolocalização dos gastos..."):
-        df_geo = df_f.groupby("ESTADO_ESTIMADO")[["VALOR TRANSAÇÃO", "PRIORITY_SCORE"]].agg(
-            VALOR_TOTAL=("VALOR TRANSAÇÃO", "sum"),
-            RISCO_MAX=("PRIORITY_SCORE", "max")
-        ).reset_index()
-
         def get_heat_data(df_input, col_peso):
             data = []
             for _, r in df_input.iterrows():
@@ -506,7 +894,7 @@ elif selected == T["menu_items"][1]:
         heat_spend_data = get_heat_data(df_geo, "VALOR_TOTAL")
 
     # 2. Renderização
-    map_id = f"{len(df_f)}_{df_f['VALOR TRANSAÇÃO'].sum()}"
+    map_id = f"{total_transacoes}_{valor_total}"
 
     c1, c2 = st.columns(2)
 
@@ -544,18 +932,11 @@ elif selected == T["menu_items"][1]:
     # GRÁFICO TEMPORAL
     st.markdown(f"### {T['chart_time']}", unsafe_allow_html=True)
 
-    df_f["MES"] = df_f["DATA TRANSAÇÃO"].dt.to_period("M").astype(str)
-
-    if "TECHNICAL_LABEL" in df_f.columns:
-            df_anom_chart = df_f[df_f["TECHNICAL_LABEL"] == -1]
-    else:
-            corte_risco = df_f["PRIORITY_SCORE"].quantile(0.90)
-            df_anom_chart = df_f[df_f["PRIORITY_SCORE"] >= corte_risco]
-
-    total_by_month = df_f.groupby("MES")["VALOR TRANSAÇÃO"].sum().reset_index().rename(columns={"VALOR TRANSAÇÃO":"TOTAL"})
-    anom_by_month = df_anom_chart.groupby("MES")["VALOR TRANSAÇÃO"].sum().reset_index().rename(columns={"VALOR TRANSAÇÃO":"ANOMALIA"})
-
-    time_df = pd.merge(total_by_month, anom_by_month, on="MES", how="left").fillna(0)
+    time_df = df_agg.groupby("MES", observed=True).agg(
+        TOTAL=("VALOR_TOTAL", "sum"),
+        ANOMALIA=("VALOR_ANOMALIAS", "sum")
+    ).reset_index()
+    time_df["MES"] = time_df["MES"].astype(str)
     time_df = time_df.sort_values("MES")
 
     fig_time = px.line(
@@ -569,10 +950,12 @@ elif selected == T["menu_items"][1]:
     )
     fig_time.update_layout(height=400, xaxis_title="Mês", legend_title="", plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)")
     st.plotly_chart(fig_time, use_container_width=True)
+    st.caption(T["kpi_anom_help"] if "TECHNICAL_LABEL" in painel["tabela"].column_names else T["kpi_anom_decil_help"])
 
     #  SCATTER PLOT
     st.subheader(T["scatter"])
-    df_scat = df_f.sample(min(2000, len(df_f)))
+    amostra = np.sort(np.random.choice(linhas, min(2000, len(linhas)), replace=False))
+    df_scat = load_rows(amostra, ["VALOR TRANSAÇÃO", "PRIORITY_SCORE", "NOME ÓRGÃO SUPERIOR", "NOME FAVORECIDO", "ESTADO_ESTIMADO"], pesos)
     fig_sc = px.scatter(
         df_scat, x="VALOR TRANSAÇÃO", y="PRIORITY_SCORE",
         color="NOME ÓRGÃO SUPERIOR", size="VALOR TRANSAÇÃO",
@@ -587,9 +970,10 @@ elif selected == T["menu_items"][1]:
     st.divider()
     st.subheader(T["table"])
     cols_show = ["DATA TRANSAÇÃO", "NOME ÓRGÃO", "NOME FAVORECIDO", "VALOR TRANSAÇÃO", "TRANSAÇÃO", "PRIORITY_SCORE", "ESTADO_ESTIMADO"]
-    cols_exist = [c for c in cols_show if c in df_f.columns]
 
-    df_top = df_f.sort_values("PRIORITY_SCORE", ascending=False).head(100)[cols_exist]
+    # Só as 100 maiores são ordenadas e lidas
+    df_top = load_rows(linhas[top_k(priority_at(linhas, pesos), 100)], cols_show, pesos)
+    df_top = df_top[[c for c in cols_show if c in df_top.columns]]
 
     st.dataframe(
         df_top.style.format({
@@ -603,25 +987,12 @@ elif selected == T["menu_items"][1]:
     st.divider()
     st.markdown(f"""<h3><i class="fa-solid fa-download" style="margin-right:8px;"></i> {T['export_title']}</h3>""", unsafe_allow_html=True)
 
-    cols_export = [
-    "CÓDIGO ÓRGÃO SUPERIOR",
-    "NOME ÓRGÃO SUPERIOR",
-    "CÓDIGO ÓRGÃO","NOME ÓRGÃO",
-    "CÓDIGO UNIDADE GESTORA",
-    "NOME UNIDADE GESTORA",
-    "ANO EXTRATO",
-    "MÊS EXTRATO",
-    "CNPJ OU CPF FAVORECIDO",
-    "NOME FAVORECIDO",
-    "TRANSAÇÃO",
-    "DATA TRANSAÇÃO",
-    "VALOR TRANSAÇÃO",
-    "ESTADO_ESTIMADO",
-    "SIGILOSO",
-    "PRIORITY_SCORE",
-    "TECHNICAL_LABEL"
-    ]
-    cols_final = [c for c in cols_export if c in df_f.columns]
+    # As colunas de exportação só são lidas quando o usuário pede os arquivos
+    if not st.checkbox(T["export_prepare"], help=T["export_prepare_help"]):
+        st.stop()
+
+    df_export = load_export(filtros, pesos)
+    cols_final = [c for c in COLUNAS_EXPORTACAO if c in df_export.columns]
 
     col_xlsx, col_csv = st.columns(2)
 
@@ -633,7 +1004,7 @@ elif selected == T["menu_items"][1]:
         buffer_xlsx = io.BytesIO()
 
         with pd.ExcelWriter(buffer_xlsx, engine='openpyxl') as writer:
-            df_f[cols_final].head(limit_excel).to_excel(writer, index=False)
+            df_export.iloc[top_k(df_export["PRIORITY_SCORE"].to_numpy(), limit_excel)][cols_final].to_excel(writer, index=False)
 
         st.download_button(
             label=f"{T['excel_btn']} {limit_excel} (Excel)",
@@ -647,10 +1018,10 @@ elif selected == T["menu_items"][1]:
         st.markdown("""<p><i class="fa-solid fa-file-csv"></i> CSV (.csv)</p>""", unsafe_allow_html=True)
         st.caption(T["csv_cap"])
 
-        csv_data = df_f[cols_final].to_csv(index=False).encode('utf-8')
+        csv_data = df_export[cols_final].to_csv(index=False).encode('utf-8')
 
         st.download_button(
-            label=f"{T['csv_btn']} ({len(df_f)} {T['rows_label']})",
+            label=f"{T['csv_btn']} ({len(df_export)} {T['rows_label']})",
             data=csv_data,
             file_name="jacurutu_completo.csv",
             mime="text/csv",
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from functions.clean_df import (
+    _read_cpgf_file, _read_legacy_file, _concat_preserving_categories, clean_dataframe, report_line
+)
+
+# Versão do formato do cache. Incrementar sempre que a limpeza mudar,
+# para que os Parquets antigos sejam descartados.
+CACHE_VERSION = 5
+
+MANIFEST_NAME = 'manifest.json'
+
+def file_hash(file_path, block_size=1 << 20):
+    """SHA-256 do conteúdo do arquivo, lido em blocos."""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest(cache_dir):
+    """
+    Loads the manifest of processed source files.
+    Returns an empty manifest if it does not exist or the cache version changed.
+    """
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('versao') == CACHE_VERSION:
+            return manifest
+    return {'versao': CACHE_VERSION, 'arquivos': {}}
+
+def save_manifest(manifest, cache_dir):
+    """Grava o manifesto de forma atômica (arquivo temporário + rename)."""
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def _cache_file_name(file_name, content_hash):
+    return f"{os.path.splitext(file_name)[0]}_{content_hash[:16]}.parquet"
+
+def _ingest_file(args):
+    """
+    Parses and cleans a single CSV and writes it to the per-file Parquet cache.
+    Runs inside the worker pool, so only the report goes back to the caller.
+    """
+    file_path, cache_path, parallel = args
+    start = time.perf_counter()
+    reader = _read_cpgf_file if parallel else _read_legacy_file
+    df_raw, report = reader(file_path)
+    df_clean = clean_dataframe(df_raw)
+    df_clean.to_parquet(cache_path, index=False)
+    report['linhas_limpas'] = len(df_clean)
+    report['segundos'] = round(time.perf_counter() - start, 3)
+    return report
+
+def load_clean_incremental(csv_path, cache_dir, parallel=False, max_workers=None, verbose=False):
+    """
+    Returns the cleaned DataFrame of every CSV in csv_path, parsing only new or
+    changed files.
+
+    Each source file is tracked in a manifest keyed by name, size and SHA-256.
+    Files that match the manifest are read back from their cleaned Parquet;
+    the others go through read + clean_dataframe and are cached. Entries for
+    files that disappeared from csv_path are removed.
+
+    Each file is deduplicated when it is cleaned; transactions repeated in
+    overlapping monthly files are dropped after the concat on ID_TRANSACAO
+    (the first file in name order wins).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = load_manifest(cache_dir)
+    entries = manifest['arquivos']
+
+    csv_files = sorted(f for f in os.listdir(csv_path) if f.lower().endswith('.csv'))
+
+    # 1. Descobre o que mudou
+    pending, reports = [], []
+    for file in csv_files:
+        file_path = os.path.join(csv_path, file)
+        size = os.path.getsize(file_path)
+        content_hash = file_hash(file_path)
+        entry = entries.get(file)
+        cached = (
+            entry is not None
+            and entry['tamanho'] == size
+            and entry['hash'] == content_hash
+            and os.path.exists(os.path.join(cache_dir, entry['cache']))
+        )
+        if cached:
+            reports.append({'arquivo': file, 'linhas': entry['linhas'], 'segundos': 0.0, 'esquema': 'cache'})
+            continue
+        if entry is not None:
+            _remove_cache_file(cache_dir, entry['cache'])
+        cache_name = _cache_file_name(file, content_hash)
+        entries[file] = {'tamanho': size, 'hash': content_hash, 'cache': cache_name, 'linhas': None}
+        pending.append((file_path, os.path.join(cache_dir, cache_name), parallel))
+
+    # 2. Processa apenas os arquivos novos ou alterados
+    if parallel and len(pending) > 1:
+        workers = max_workers or min(len(pending), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            new_reports = list(executor.map(_ingest_file, pending))
+    else:
+        new_reports = [_ingest_file(args) for args in pending]
+
+    for report in new_reports:
+        entries[report['arquivo']]['linhas'] = report['linhas_limpas']
+        reports.append(report)
+
+    # 3. Remove do manifesto os arquivos que saíram do diretório
+    for file in [f for f in entries if f not in csv_files]:
+        _remove_cache_file(cache_dir, entries.pop(file)['cache'])
+
+    save_manifest(manifest, cache_dir)
+
+    if verbose:
+        for r in reports:
+            print(report_line(r))
+
+    dfs = [pd.read_parquet(os.path.join(cache_dir, entries[f]['cache'])) for f in csv_files]
+    df = _concat_preserving_categories(dfs).drop_duplicates(subset='ID_TRANSACAO', ignore_index=True)
+    df.attrs['ingestion_report'] = reports
+    return df
+
+def _remove_cache_file(cache_dir, cache_name):
+    path = os.path.join(cache_dir, cache_name)
+    if os.path.exists(path):
+        os.remove(path)
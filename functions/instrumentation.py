@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import functools
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Coleta de métricas por etapa do ETL: tempo de relógio, tempo de CPU,
+# aumento do pico de memória (RSS) e linhas de entrada/saída.
+# As medições vão para um relatório em memória, gravado em JSON ao fim da execução.
+
+_RELATORIO = []
+_PROFILE_DIR = None
+_PROFUNDIDADE = 0
+
+def start_report(profile_dir=None):
+    """
+    Starts a new run report. With profile_dir, every top-level measured call
+    also dumps a cProfile file (<name>.prof) there.
+    """
+    global _RELATORIO, _PROFILE_DIR, _PROFUNDIDADE
+    _RELATORIO = []
+    _PROFILE_DIR = profile_dir
+    _PROFUNDIDADE = 0
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+def get_report():
+    return list(_RELATORIO)
+
+def write_report(path, extra=None):
+    """Grava o relatório da execução em JSON."""
+    relatorio = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'etapas': _RELATORIO,
+    }
+    if extra:
+        relatorio.update(extra)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    return path
+
+def _peak_rss_mb():
+    """Pico de RSS do processo até agora (MB), ou None se indisponível."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB, macOS em bytes
+    return pico / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+def _children_cpu_s():
+    """CPU (usuário + sistema) dos processos filhos já finalizados, ex.: pools de leitura."""
+    if resource is None:
+        return None
+    uso = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return uso.ru_utime + uso.ru_stime
+
+def _count_rows(obj):
+    """Linhas de um DataFrame/array, ou a soma de um dict deles."""
+    if isinstance(obj, dict):
+        contagens = [_count_rows(v) for v in obj.values()]
+        contagens = [c for c in contagens if c is not None]
+        return sum(contagens) if contagens else None
+    if hasattr(obj, 'shape') and len(getattr(obj, 'shape', ())) > 0:
+        return int(obj.shape[0])
+    return None
+
+def measure(name, func, *args, **kwargs):
+    """
+    Calls func(*args, **kwargs) and records wall time, CPU time (own and of
+    finished child processes), peak RSS delta, rows in (first argument) /
+    out (return value) and throughput (rows in per second) under name.
+
+    The peak RSS delta is how much the process high-water mark grew during
+    the call (0 when the call stayed under an earlier peak).
+    """
+    global _PROFUNDIDADE
+    profiler = None
+    if _PROFILE_DIR and _PROFUNDIDADE == 0:
+        profiler = cProfile.Profile()
+
+    pico_antes = _peak_rss_mb()
+    cpu_filhos_antes = _children_cpu_s()
+    inicio_relogio, inicio_cpu = time.perf_counter(), time.process_time()
+    _PROFUNDIDADE += 1
+    try:
+        if profiler:
+            profiler.enable()
+        resultado = func(*args, **kwargs)
+    finally:
+        if profiler:
+            profiler.disable()
+        _PROFUNDIDADE -= 1
+
+    tempo = time.perf_counter() - inicio_relogio
+    pico_depois = _peak_rss_mb()
+    cpu_filhos_depois = _children_cpu_s()
+    linhas_entrada = _count_rows(args[0]) if args else None
+    _RELATORIO.append({
+        'etapa': name,
+        'nivel': _PROFUNDIDADE,
+        'tempo_s': round(tempo, 4),
+        'cpu_s': round(time.process_time() - inicio_cpu, 4),
+        'cpu_filhos_s': round(cpu_filhos_depois - cpu_filhos_antes, 4) if cpu_filhos_antes is not None else None,
+        'pico_rss_delta_mb': round(pico_depois - pico_antes, 1) if pico_antes is not None else None,
+        'pico_rss_mb': round(pico_depois, 1) if pico_depois is not None else None,
+        'linhas_entrada': linhas_entrada,
+        'linhas_saida': _count_rows(resultado),
+        'linhas_por_s': round(linhas_entrada / tempo, 1) if linhas_entrada and tempo > 0 else None,
+    })
+    if profiler:
+        profiler.dump_stats(os.path.join(_PROFILE_DIR, f'{name}.prof'))
+    return resultado
+
+def instrumented(func):
+    """Decorator: mede cada chamada de func com measure(), usando o nome da função."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return measure(func.__name__, func, *args, **kwargs)
+    return wrapper
+
+def worker_report(func, *args, **kwargs):
+    """
+    Runs func in a worker process with a report of its own.
+
+    Returns (result, records); the parent adds the records to its report
+    with merge_report(). Without this, whatever is measured inside a
+    process pool is lost with the worker.
+    """
+    start_report(profile_dir=_PROFILE_DIR)
+    resultado = func(*args, **kwargs)
+    return resultado, get_report()
+
+def merge_report(registros):
+    """Adiciona ao relatório as medições de um worker, aninhadas na chamada medida em curso."""
+    for registro in registros:
+        _RELATORIO.append({**registro, 'nivel': registro['nivel'] + _PROFUNDIDADE, 'worker': True})
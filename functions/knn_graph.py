@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+# Grafo k-NN reaproveitável para o LOF: os vizinhos são buscados em blocos de
+# linhas de tamanho fixo (memória previsível) e gravados em disco com o k pedido.
+# O LOF de qualquer n_neighbors <= k sai do grafo, sem nova busca; um k maior
+# refaz o grafo. Cada nome (partição) guarda só o grafo da matriz atual.
+
+# Teto de memória (MB) para os resultados temporários de cada bloco de consultas
+KNN_MEMORY_MB = 256
+
+# Incrementar quando a forma de construir o grafo mudar
+KNN_GRAPH_VERSION = 2
+
+def _block_rows(k, memory_mb):
+    """Linhas por bloco: cada consulta guarda k+1 distâncias/índices (float64/int64) e as cópias de trabalho."""
+    bytes_por_linha = (k + 1) * 16 * 4
+    return max(1024, int(memory_mb * 2**20 // bytes_por_linha))
+
+def build_knn_graph(X, k=20, memory_mb=KNN_MEMORY_MB, n_jobs=-1):
+    """
+    k nearest neighbours of every row of X among the other rows, queried in
+    fixed-size blocks so the peak memory does not grow with len(X).
+
+    Returns:
+        tuple: (indices int32, distances float32), both of shape (len(X), k),
+        sorted by distance. Same neighbours as LocalOutlierFactor.fit.
+    """
+    n = len(X)
+    k = max(1, min(k, n - 1))
+    nn = NearestNeighbors(n_neighbors=k, n_jobs=n_jobs).fit(X)
+
+    indices = np.empty((n, k), dtype=np.int32)
+    distances = np.empty((n, k), dtype=np.float32)
+    bloco = _block_rows(k, memory_mb)
+    for inicio in range(0, n, bloco):
+        fim = min(inicio + bloco, n)
+        dist, ind = nn.kneighbors(X[inicio:fim], n_neighbors=k + 1)
+
+        # Remove a própria amostra, como o kneighbors() sem X do sklearn: se há
+        # mais duplicatas que vizinhos a amostra pode não aparecer, e sai a primeira
+        mascara = ind != np.arange(inicio, fim)[:, np.newaxis]
+        mascara[mascara.all(axis=1), 0] = False
+        indices[inicio:fim] = ind[mascara].reshape(fim - inicio, k)
+        distances[inicio:fim] = dist[mascara].reshape(fim - inicio, k)
+    return indices, distances
+
+def _self_copies(counts, n_neighbors):
+    """Cópias do próprio ponto na sua vizinhança: as outras c_i - 1, até n_neighbors."""
+    return np.minimum(np.asarray(counts) - 1, n_neighbors).astype(np.float64)
+
+def _neighbourhood_weights(vizinhos, n_neighbors, counts=None, proprios=0):
+    """
+    Peso de cada vizinho: suas cópias, até a vizinhança (já com as proprios
+    cópias do próprio ponto) somar n_neighbors (o último, em parte).
+    """
+    if counts is None:
+        return np.ones(vizinhos.shape)
+    copias = counts[vizinhos]
+    anteriores = np.cumsum(copias, axis=1) - copias + np.reshape(proprios, (-1, 1))
+    return np.clip(n_neighbors - anteriores, 0, copias).astype(np.float64)
+
+def _local_density(dist, pesos, dist_k_vizinhos, proprios=0, dist_k=0):
+    """
+    Densidade de alcançabilidade local (lrd) a partir das distâncias aos vizinhos.
+    As proprios cópias do ponto estão a distância 0: alcance = sua própria k-distância.
+    """
+    alcance = (pesos * np.maximum(dist, dist_k_vizinhos)).sum(axis=1) + proprios * dist_k
+    return 1.0 / (alcance / (pesos.sum(axis=1) + proprios) + 1e-10)
+
+def _graph_density(indices, distances, n_neighbors=20, counts=None):
+    """k-distância e lrd de cada linha do grafo, com a vizinhança, os pesos e as cópias próprias."""
+    k = min(n_neighbors, indices.shape[1])
+    vizinhos = indices[:, :k]
+    dist = distances[:, :k].astype(np.float64)
+    proprios = np.zeros(len(dist)) if counts is None else _self_copies(counts, n_neighbors)
+    pesos = _neighbourhood_weights(vizinhos, n_neighbors, counts, proprios)
+
+    # k-distância: distância ao último vizinho que entra na vizinhança; 0 se as
+    # cópias do próprio ponto já a preenchem
+    ultimo = (pesos > 0).sum(axis=1) - 1
+    dist_k = np.where(ultimo >= 0, dist[np.arange(len(dist)), np.maximum(ultimo, 0)], 0.0)
+    lrd = _local_density(dist, pesos, dist_k[vizinhos], proprios, dist_k)
+    return dist_k, lrd, vizinhos, pesos, proprios
+
+def lof_scores_from_graph(indices, distances, n_neighbors=20, counts=None):
+    """
+    negative_outlier_factor_ derived from a k-NN graph (build_knn_graph) for
+    any n_neighbors <= k, with the same formulas as LocalOutlierFactor.
+
+    With counts (multiplicity of each row, see models.collapse_duplicates),
+    the graph is over distinct vectors and gives the same scores as
+    LocalOutlierFactor over the expanded rows: the other c_i - 1 copies of the
+    point are its first neighbours (distance 0), then the nearest distinct
+    vectors weigh as many copies as they have, until the neighbourhood adds up
+    to n_neighbors (the last one only partially).
+    """
+    _, lrd, vizinhos, pesos, proprios = _graph_density(indices, distances, n_neighbors, counts)
+    soma = (pesos * lrd[vizinhos]).sum(axis=1) + proprios * lrd
+    return -soma / (pesos.sum(axis=1) + proprios) / lrd
+
+## LOF novelty sobre vetores distintos
+
+def fit_lof_novelty(X, counts, n_neighbors=20, n_jobs=-1):
+    """
+    Novelty LOF fitted on distinct vectors X with their multiplicities
+    (models.collapse_duplicates), the weighted counterpart of
+    LocalOutlierFactor(novelty=True).fit: the training k-distances and lrd
+    come from the same weighted neighbourhoods as lof_scores_from_graph.
+
+    Returns:
+        dict: modelo para lof_novelty_scores (picklável).
+    """
+    indices, distances = build_knn_graph(X, k=n_neighbors, n_jobs=n_jobs)
+    dist_k, lrd, _, _, _ = _graph_density(indices, distances, n_neighbors, counts)
+    k = min(n_neighbors, len(X))
+    return {
+        'nn': NearestNeighbors(n_neighbors=k, n_jobs=n_jobs).fit(X),
+        'counts': np.asarray(counts),
+        'dist_k': dist_k,
+        'lrd': lrd,
+        'n_neighbors': n_neighbors,
+    }
+
+def lof_novelty_scores(modelo, X):
+    """
+    score_samples of new points against a fit_lof_novelty model: every
+    training vector is a candidate neighbour, with all its copies.
+    """
+    dist, vizinhos = modelo['nn'].kneighbors(X)
+    pesos = _neighbourhood_weights(vizinhos, modelo['n_neighbors'], modelo['counts'])
+    lrd = _local_density(dist, pesos, modelo['dist_k'][vizinhos])
+    return -(pesos * modelo['lrd'][vizinhos]).sum(axis=1) / pesos.sum(axis=1) / lrd
+
+def _graph_key(X):
+    h = hashlib.sha256(np.ascontiguousarray(X).tobytes())
+    h.update(json.dumps([KNN_GRAPH_VERSION, X.shape, str(X.dtype)]).encode('utf-8'))
+    return h.hexdigest()
+
+def _stored_k(graph_dir, name, chave):
+    """Maior k já gravado (e completo) para a matriz de chave, ou None."""
+    padrao = re.compile(rf'{re.escape(name)}_{chave}_k(\d+)_distances\.npy$')
+    ks = [int(m.group(1)) for f in os.listdir(graph_dir) if (m := padrao.match(f))]
+    return max(ks, default=None)
+
+def _prune_graphs(graph_dir, name, base):
+    """Remove os grafos antigos do mesmo nome (e os do formato anterior, knn_*)."""
+    manter = os.path.basename(base) + '_'
+    for f in os.listdir(graph_dir):
+        if (f.startswith(f'{name}_') or f.startswith('knn_')) and not f.startswith(manter):
+            os.remove(os.path.join(graph_dir, f))
+
+def load_or_build_knn_graph(X, graph_dir, k=20, name='knn', memory_mb=KNN_MEMORY_MB, n_jobs=-1):
+    """
+    build_knn_graph persisted in graph_dir under name, keyed by the content of X.
+    A graph already on disk for X with at least k neighbours is opened with
+    mmap (first k columns) instead of being rebuilt. After a new graph is
+    saved, the older graphs of the same name are deleted.
+    """
+    os.makedirs(graph_dir, exist_ok=True)
+    chave = _graph_key(X)
+    k_gravado = _stored_k(graph_dir, name, chave)
+    if k_gravado is not None and k_gravado >= min(k, len(X) - 1):
+        base = os.path.join(graph_dir, f'{name}_{chave}_k{k_gravado}')
+        return (
+            np.load(base + '_indices.npy', mmap_mode='r')[:, :k],
+            np.load(base + '_distances.npy', mmap_mode='r')[:, :k],
+        )
+
+    indices, distances = build_knn_graph(X, k=k, memory_mb=memory_mb, n_jobs=n_jobs)
+    base = os.path.join(graph_dir, f'{name}_{chave}_k{k}')
+    # distances por último: sua presença marca o grafo como completo
+    for nome, arr in (('indices', indices), ('distances', distances)):
+        np.save(base + f'_{nome}.tmp.npy', arr)
+        os.replace(base + f'_{nome}.tmp.npy', base + f'_{nome}.npy')
+    _prune_graphs(graph_dir, name, base)
+    return indices, distances
@@ -1,146 +1,200 @@
 import pandas as pd
 import numpy as np
-from sklearn.neighbors import LocalOutlierFactor
 from sklearn.ensemble import IsolationForest
 import os
 import sys
 sys.path.append(os.path.abspath('..'))
-from functions.preprocessing import get_preprocessor
+from functions.preprocessing import build_feature_matrix
+from functions.instrumentation import instrumented
+from functions.knn_graph import build_knn_graph, load_or_build_knn_graph, lof_scores_from_graph
+from functions.batch_scoring import score_isolation_forest
+
+# Subamostra por árvore no treino do IF ('auto' = min(256, n), padrão do sklearn)
+IF_MAX_SAMPLES = 'auto'
+
+## Matriz de features compartilhada
+
+def build_partition_matrices(df):
+    """
+    Monta, uma única vez, a matriz escalada (float32 contígua) de cada partição.
+
+    Args:
+        df (pd.DataFrame): DataFrame completo, após o feature engineering.
+
+    Returns:
+        dict: {0: X dos não sigilosos, 1: X dos sigilosos}, na ordem das linhas de df.
+    """
+    return {sigilo: build_feature_matrix(df[df['SIGILOSO'] == sigilo]) for sigilo in (0, 1)}
+
+@instrumented
+def collapse_duplicates(X):
+    """
+    Reduz a matriz aos vetores distintos.
+
+    Returns:
+        tuple: (vetores únicos, índice do único de cada linha de X, cópias de cada único).
+    """
+    unicos, inverso, contagens = np.unique(X, axis=0, return_inverse=True, return_counts=True)
+    return np.ascontiguousarray(unicos), inverso.ravel(), contagens
+
+def detect_lof(X, n_neighbors=20, n_jobs=-1, graph_dir=None, graph_name='knn'):
+    """
+    LOF sobre uma matriz já escalada, sem depender do DataFrame.
+    n_jobs limita as threads da busca de vizinhos (ver functions/scheduler.py).
+    Com graph_dir, os vizinhos vêm do grafo k-NN persistido (functions/knn_graph.py),
+    gravado como graph_name (um por partição).
+
+    Linhas idênticas são colapsadas: o LOF roda sobre os vetores distintos,
+    pesando cada vizinho pelo número de cópias (knn_graph.lof_scores_from_graph),
+    e o score é replicado para todas as cópias.
+
+    Só o score é calculado: os labels saem da contaminação em functions/thresholds.py.
+
+    Returns:
+        np.ndarray: negative_outlier_factor_, um valor por linha de X.
+    """
+    unicos, inverso, contagens = collapse_duplicates(X)
+    if graph_dir:
+        indices, distances = load_or_build_knn_graph(
+            unicos, graph_dir, k=n_neighbors, name=graph_name, n_jobs=n_jobs
+        )
+    else:
+        indices, distances = build_knn_graph(unicos, k=n_neighbors, n_jobs=n_jobs)
+
+    return lof_scores_from_graph(indices, distances, n_neighbors, contagens)[inverso]
+
+def detect_if(X, random_state=42, n_jobs=-1, max_samples=IF_MAX_SAMPLES, score_workers=1):
+    """
+    Isolation Forest sobre uma matriz já escalada, sem depender do DataFrame.
+    n_jobs limita as threads de treino e pontuação (ver functions/scheduler.py).
+    A pontuação é feita em blocos (functions/batch_scoring.py); score_workers > 1
+    distribui os blocos entre processos.
+
+    O treino usa todas as linhas (a subamostra de cada árvore respeita as
+    duplicatas), mas só os vetores distintos são pontuados. O score não depende
+    da contaminação: os labels saem de functions/thresholds.py.
+
+    Returns:
+        np.ndarray: score_samples, um valor por linha de X.
+    """
+    # contamination='auto' evita a passada extra do fit sobre X para calcular o corte,
+    # que agora é aplicado depois
+    if_model = IsolationForest(
+        contamination='auto',
+        random_state=random_state,
+        n_estimators=300,
+        max_samples=max_samples,
+        n_jobs=n_jobs
+    ).fit(X)
+
+    unicos, inverso, _ = collapse_duplicates(X)
+    _, decisao = score_isolation_forest(if_model, unicos, n_workers=score_workers)
+    return (decisao + if_model.offset_)[inverso]
+
+def score_frame(ids, detector, scores):
+    """Saída dos detectores: score bruto de cada transação, pela chave ID_TRANSACAO."""
+    return pd.DataFrame({
+        'ID_TRANSACAO': ids,
+        f'{detector}_SCORE': scores,
+    })
 
 ## Modelo Local Outlier Factor (LOF)
 
-def run_lof_normal(df, contamination=0.01, n_neighbors=20):
+@instrumented
+def run_lof_normal(df, n_neighbors=20, X=None, graph_dir=None):
     """
     Executa o LOF APENAS para transações NÃO SIGILOSAS (SIGILOSO=0).
     Ignora os dados sigilosos na detecção de anomalia.
 
     Args:
         df (pd.DataFrame): DataFrame completo.
-        contamination (float): Taxa de anomalia.
         n_neighbors (int): Vizinhos.
+        X (np.ndarray): Matriz escalada da partição (build_partition_matrices);
+            se omitida, é calculada aqui.
+        graph_dir (str): Pasta do grafo k-NN reaproveitável; None = busca direta.
 
     Returns:
-        pd.DataFrame: DataFrame filtrado (só não sigilosos) com scores.
+        pd.DataFrame: ID_TRANSACAO e LOF_SCORE das transações não sigilosas.
     """
     # Filtro apenas o que NÃO é sigiloso
-    df_lof_normal = df[df['SIGILOSO'] == 0].copy()
+    mascara = (df['SIGILOSO'] == 0).to_numpy()
 
-
-    # Preprocessamento
-    preprocessor = get_preprocessor()
-    X_scaled = preprocessor.fit_transform(df_lof_normal)
-
-    # Adicionando ruído
-    ruido = np.random.normal(0, 1e-5, X_scaled.shape)
-    X_final = X_scaled + ruido
-
-    # Treinando
-    lof = LocalOutlierFactor(
-        n_neighbors=n_neighbors,
-        contamination=contamination,
-        n_jobs=-1
-    )
+    # Preprocessamento (reaproveita a matriz compartilhada, se houver)
+    if X is None:
+        X = build_feature_matrix(df[mascara])
 
     # Predição
-    df_lof_normal['LOF_LABEL'] = lof.fit_predict(X_final)
-    df_lof_normal['LOF_SCORE'] = lof.negative_outlier_factor_
+    scores = detect_lof(X, n_neighbors, graph_dir=graph_dir, graph_name='lof_normal')
 
-    return df_lof_normal
+    return score_frame(df['ID_TRANSACAO'].to_numpy()[mascara], 'LOF', scores)
 
-def run_lof_classified (df, contamination=0.01, n_neighbors=20):
+@instrumented
+def run_lof_classified(df, n_neighbors=20, X=None, graph_dir=None):
     """
     Executa o LOF APENAS para transações SIGILOSAS (SIGILOSO=1).
     Foca em anomalias de valor e órgão dentro do universo de sigilo.
 
     Args:
         df (pd.DataFrame): DataFrame completo.
-        contamination (float): Taxa de anomalia.
         n_neighbors (int): Vizinhos.
+        X (np.ndarray): Matriz escalada da partição (build_partition_matrices);
+            se omitida, é calculada aqui.
+        graph_dir (str): Pasta do grafo k-NN reaproveitável; None = busca direta.
 
     Returns:
-        pd.DataFrame: DataFrame filtrado (só sigilosos) com scores.
+        pd.DataFrame: ID_TRANSACAO e LOF_SCORE das transações sigilosas.
     """
 
     # Pega apenas o SIGILOSO
-    df_lof_classified = df[df['SIGILOSO'] == 1].copy()
+    mascara = (df['SIGILOSO'] == 1).to_numpy()
 
-    # Preprocessamento
-    preprocessor = get_preprocessor()
-    X_scaled = preprocessor.fit_transform(df_lof_classified)
-
-    # Adicionando ruído
-    ruido = np.random.normal(0, 1e-5, X_scaled.shape)
-    X_final = X_scaled + ruido
-
-    # Treinando
-    lof = LocalOutlierFactor(
-        n_neighbors=n_neighbors,
-        contamination=contamination,
-        n_jobs=-1
-    )
+    # Preprocessamento (reaproveita a matriz compartilhada, se houver)
+    if X is None:
+        X = build_feature_matrix(df[mascara])
 
     # Predição
-    df_lof_classified['LOF_LABEL'] = lof.fit_predict(X_final)
-    df_lof_classified['LOF_SCORE'] = lof.negative_outlier_factor_
+    scores = detect_lof(X, n_neighbors, graph_dir=graph_dir, graph_name='lof_classified')
 
-    return df_lof_classified
+    return score_frame(df['ID_TRANSACAO'].to_numpy()[mascara], 'LOF', scores)
 
 ## Isolation Forest (IF)
 
-def run_if_normal(df, contamination=0.01, random_state=42):
+@instrumented
+def run_if_normal(df, random_state=42, X=None):
     """
     Executa Isolation Forest APENAS para transações NÃO SIGILOSAS (SIGILOSO=0).
     Ignora os dados sigilosos na detecção de anomalia.
+
+    Returns:
+        pd.DataFrame: ID_TRANSACAO e IF_SCORE das transações não sigilosas.
     """
     # Filtrar só registros não sigilosos
-    df_if_normal = df[df['SIGILOSO'] == 0].copy()
+    mascara = (df['SIGILOSO'] == 0).to_numpy()
 
-    # Preprocessamento
-    preprocessor = get_preprocessor()
-    X_scaled = preprocessor.fit_transform(df_if_normal)
+    # Preprocessamento (reaproveita a matriz compartilhada, se houver)
+    if X is None:
+        X = build_feature_matrix(df[mascara])
 
-    # Adicionar pequeno ruído para evitar colinearidade
-    ruido = np.random.normal(0, 1e-5, X_scaled.shape)
-    X_final = X_scaled + ruido
+    scores = detect_if(X, random_state)
 
-    # Treinar Isolation Forest
-    if_model = IsolationForest(
-        contamination=contamination,
-        random_state=random_state,
-        n_estimators=300,
-        n_jobs=-1
-    )
+    return score_frame(df['ID_TRANSACAO'].to_numpy()[mascara], 'IF', scores)
 
-    df_if_normal['IF_LABEL'] = if_model.fit_predict(X_final)
-    df_if_normal['IF_SCORE'] = if_model.decision_function(X_final)
-
-    return df_if_normal
-
-def run_if_classified(df, contamination=0.01, random_state=42):
+@instrumented
+def run_if_classified(df, random_state=42, X=None):
     """
     Executa Isolation Forest APENAS para transações SIGILOSAS (SIGILOSO=1).
     Usado para achar anomalias dentro do universo sigiloso.
+
+    Returns:
+        pd.DataFrame: ID_TRANSACAO e IF_SCORE das transações sigilosas.
     """
     # Filtrar só registros sigilosos
-    df_if_classified = df[df['SIGILOSO'] == 1].copy()
-
-    # Preprocessamento
-    preprocessor = get_preprocessor()
-    X_scaled = preprocessor.fit_transform(df_if_classified)
-
-    # Ruído
-    ruido = np.random.normal(0, 1e-5, X_scaled.shape)
-    X_final = X_scaled + ruido
+    mascara = (df['SIGILOSO'] == 1).to_numpy()
 
-    # Treinar Isolation Forest
-    if_model = IsolationForest(
-        contamination=contamination,
-        random_state=random_state,
-        n_estimators=300,
-        n_jobs=-1
-    )
+    # Preprocessamento (reaproveita a matriz compartilhada, se houver)
+    if X is None:
+        X = build_feature_matrix(df[mascara])
 
-    df_if_classified['IF_LABEL'] = if_model.fit_predict(X_final)
-    df_if_classified['IF_SCORE'] = if_model.decision_function(X_final)
+    scores = detect_if(X, random_state)
 
-    return df_if_classified
+    return score_frame(df['ID_TRANSACAO'].to_numpy()[mascara], 'IF', scores)
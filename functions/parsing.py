@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Kernels vetorizados para as duas conversões do caminho crítico do ETL:
+# 'VALOR TRANSAÇÃO' (formato brasileiro, ex.: 1.234,56) e 'DATA TRANSAÇÃO' (dd/mm/YYYY).
+# Trabalham direto nos buffers Arrow (offsets + bytes), em blocos de linhas, sem
+# criar colunas intermediárias de objetos Python. Linhas que o kernel não
+# reconhece são convertidas pelo método antigo (pandas), só para esse resíduo.
+
+# Linhas por bloco (limita o tamanho dos vetores temporários)
+BLOCO = 1 << 18
+
+# Maior texto de valor aceito pelo kernel e máximo de dígitos com conversão exata
+LARGURA_VALOR = 24
+MAX_DIGITOS = 15
+
+_POT10_FLOAT = 10.0 ** np.arange(23)
+
+_DIGITO_0, _DIGITO_9 = ord('0'), ord('9')
+_PONTO, _VIRGULA, _MENOS, _BARRA = ord('.'), ord(','), ord('-'), ord('/')
+
+def _arrow_strings(serie):
+    """
+    Returns the column as an Arrow large_string array, or None if it cannot
+    be represented as strings (e.g. mixed Python objects).
+    """
+    try:
+        arr = pa.array(serie, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if pa.types.is_dictionary(arr.type):
+        arr = arr.dictionary_decode()
+    if pa.types.is_null(arr.type):
+        arr = arr.cast(pa.string())
+    if not (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)):
+        return None
+    return arr.cast(pa.large_string())
+
+def _byte_blocks(arr, largura):
+    """
+    Yields (start, columns, lengths, valid) per block of rows.
+    columns[j] holds the j-th byte of every row of the block (0 past the end
+    of the string); rows longer than largura are marked as not valid.
+    """
+    n = len(arr)
+    validade = ~np.asarray(arr.is_null(), dtype=bool) if arr.null_count else np.ones(n, dtype=bool)
+    buffers = arr.buffers()
+    offsets = np.frombuffer(buffers[1], dtype=np.int64)[arr.offset:arr.offset + n + 1]
+    dados = np.frombuffer(buffers[2], dtype=np.uint8) if buffers[2] is not None else None
+    if dados is None or len(dados) == 0:
+        dados = np.zeros(1, np.uint8)
+    ultimo = len(dados) - 1
+
+    for inicio in range(0, n, BLOCO):
+        fim = min(inicio + BLOCO, n)
+        off = offsets[inicio:fim]
+        tamanhos = offsets[inicio + 1:fim + 1] - off
+        valido = validade[inicio:fim] & (tamanhos <= largura) & (tamanhos > 0)
+        largura_bloco = int(min(largura, tamanhos[valido].max())) if valido.any() else 0
+        colunas = []
+        for j in range(largura_bloco):
+            byte = dados[np.minimum(off + j, ultimo)]
+            colunas.append(np.where(tamanhos > j, byte, 0).astype(np.uint8))
+        yield inicio, colunas, tamanhos, valido
+
+def _brl_kernel(colunas, tamanhos, valido):
+    """Converte um bloco de bytes no formato 1.234,56 para float64 (NaN se inválido)."""
+    n = len(tamanhos)
+    ok = valido.copy()
+    mantissa = np.zeros(n, dtype=np.int64)
+    n_digitos = np.zeros(n, dtype=np.int64)
+    n_decimais = np.zeros(n, dtype=np.int64)
+    virgulas = np.zeros(n, dtype=np.int64)
+    negativo = np.zeros(n, dtype=bool)
+
+    # Horner coluna a coluna: a vírgula só define a escala, os pontos são ignorados
+    for j, byte in enumerate(colunas):
+        digito = (byte >= _DIGITO_0) & (byte <= _DIGITO_9)
+        virgula = byte == _VIRGULA
+        permitido = digito | virgula | (byte == _PONTO) | (tamanhos <= j)
+        if j == 0:
+            negativo = byte == _MENOS
+            permitido |= negativo
+        ok &= permitido
+        mantissa = np.where(digito, mantissa * 10 + (byte.astype(np.int64) - _DIGITO_0), mantissa)
+        n_digitos += digito
+        n_decimais += digito & (virgulas > 0)
+        virgulas += virgula
+
+    ok &= (virgulas <= 1) & (n_digitos > 0) & (n_digitos <= MAX_DIGITOS)
+
+    # Mantissa < 2^53 e 10^k exatos: a divisão tem o mesmo arredondamento do parse decimal
+    resultado = mantissa.astype(np.float64) / _POT10_FLOAT[np.minimum(n_decimais, 22)]
+    resultado = np.where(negativo, -resultado, resultado)
+    return np.where(ok, resultado, np.nan), ok
+
+def _date_kernel(colunas, tamanhos, valido):
+    """Converte um bloco de bytes dd/mm/YYYY para datetime64[D] (NaT se inválido)."""
+    ok = valido & (tamanhos == 10)
+    if len(colunas) < 10:
+        return np.full(len(tamanhos), np.datetime64('NaT', 'D')), np.zeros(len(tamanhos), dtype=bool)
+
+    d = [c.astype(np.int64) - _DIGITO_0 for c in colunas[:10]]
+    ok &= (colunas[2] == _BARRA) & (colunas[5] == _BARRA)
+    for j in (0, 1, 3, 4, 6, 7, 8, 9):
+        ok &= (d[j] >= 0) & (d[j] <= 9)
+    dia = d[0] * 10 + d[1]
+    mes = d[3] * 10 + d[4]
+    ano = d[6] * 1000 + d[7] * 100 + d[8] * 10 + d[9]
+    ok &= (dia >= 1) & (dia <= 31) & (mes >= 1) & (mes <= 12)
+
+    inicio_mes = np.where(ok, (ano - 1970) * 12 + mes - 1, 0).astype('datetime64[M]')
+    datas = inicio_mes.astype('datetime64[D]') + np.where(ok, dia - 1, 0)
+    # Rejeita dias que "transbordam" o mês (ex.: 31/02)
+    ok &= datas.astype('datetime64[M]') == inicio_mes
+    return np.where(ok, datas, np.datetime64('NaT')), ok
+
+def _legacy_brl(serie):
+    texto = serie.astype(str).str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pd.to_numeric(texto, errors='coerce').to_numpy(dtype=np.float64)
+
+def _legacy_date(serie):
+    return pd.to_datetime(serie, format='%d/%m/%Y', errors='coerce').to_numpy(dtype='datetime64[ns]')
+
+def _run_kernel(serie, kernel, largura, vazio, legado):
+    """
+    Runs a kernel over the Arrow buffers of the column. Non-null rows the
+    kernel rejects are retried with the legacy pandas conversion.
+    Returns (values, nulls, failures).
+    """
+    arr = _arrow_strings(serie)
+    if arr is None:
+        valores = legado(serie)
+        nulos = int(serie.isna().sum())
+        return valores, nulos, int(pd.isna(valores).sum()) - nulos
+
+    resultado = np.full(len(arr), vazio)
+    rejeitados = np.zeros(len(arr), dtype=bool)
+    for inicio, colunas, tamanhos, valido in _byte_blocks(arr, largura):
+        valores, ok = kernel(colunas, tamanhos, valido)
+        fim = inicio + len(valores)
+        resultado[inicio:fim] = valores
+        rejeitados[inicio:fim] = ~ok
+
+    nulos_arr = np.asarray(arr.is_null(), dtype=bool)
+    residuo = np.flatnonzero(rejeitados & ~nulos_arr)
+    if len(residuo):
+        resultado[residuo] = legado(serie.iloc[residuo])
+    falhas = int(pd.isna(resultado[residuo]).sum()) if len(residuo) else 0
+    return resultado, int(nulos_arr.sum()), falhas
+
+def parse_brl_decimal(serie):
+    """
+    Parses a Brazilian-format decimal column ('1.234,56') into float64.
+
+    Returns (np.ndarray float64, report) where report has the number of null
+    inputs ('nulos') and of non-null rows that failed coercion ('falhas').
+    Failed and null rows are NaN.
+    """
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        valores = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+        return valores, {'nulos': int(np.isnan(valores).sum()), 'falhas': 0}
+    valores, nulos, falhas = _run_kernel(serie, _brl_kernel, LARGURA_VALOR, np.nan, _legacy_brl)
+    return valores, {'nulos': nulos, 'falhas': falhas}
+
+def parse_date_ddmmyyyy(serie):
+    """
+    Parses a 'dd/mm/YYYY' date column into datetime64[ns].
+
+    Returns (np.ndarray datetime64[ns], report) with the same 'nulos' and
+    'falhas' counts as parse_brl_decimal. Failed and null rows are NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        valores = serie.to_numpy(dtype='datetime64[ns]')
+        return valores, {'nulos': int(np.isnat(valores).sum()), 'falhas': 0}
+    valores, nulos, falhas = _run_kernel(
+        serie, _date_kernel, 10, np.datetime64('NaT', 'ns'), _legacy_date
+    )
+    return valores.astype('datetime64[ns]'), {'nulos': nulos, 'falhas': falhas}
@@ -1,69 +1,291 @@
 import pandas as pd
 import numpy as np
 import os
+import tempfile
 from sklearn.preprocessing import RobustScaler, MinMaxScaler
 from functions.clean_df import load_and_combine_csvs, clean_dataframe
+from functions.incremental import load_clean_incremental, file_hash
+from functions.streaming import run_streaming_etl
 from functions.state_imput import apply_state_estimation
 from functions.feature_engineering import feature_engineering
-from functions.models import run_lof_normal, run_lof_classified, run_if_normal, run_if_classified
+from functions.feature_store import feature_engineering_incremental
+from functions.scheduler import run_detectors
+from functions.registry import models_from_registry, current_version
+from functions.models import run_lof_normal, run_lof_classified, run_if_normal, run_if_classified, build_partition_matrices
+from functions.thresholds import apply_thresholds, CONTAMINATION
+from functions.instrumentation import measure
+from functions.checkpoint import hash_values, source_hash, has_checkpoint, save_checkpoint, load_checkpoint
+from functions import clean_df, parsing, incremental, streaming, state_imput, models, preprocessing, feature_store, scheduler, knn_graph, registry, thresholds
+from functions import feature_engineering as feature_engineering_module
 
-def run_pipeline(raw_data):
+# Pesos do PRIORITY_SCORE; o dashboard usa estes como padrão e permite alterá-los
+TECHNICAL_WEIGHT = 0.7
+FINANCIAL_WEIGHT = 0.3
+
+# Etapas nomeadas do pipeline, na ordem de execução
+STAGES = ['ingest', 'clean', 'geo', 'features', 'models', 'combine', 'threshold', 'score']
+
+def _ingestion_mode(options):
+    """'streaming' (ingest já entrega as features), 'incremental' (já limpo) ou 'memoria'."""
+    if options['memory_budget_mb']:
+        return 'streaming'
+    return 'incremental' if options['cache_dir'] else 'memoria'
+
+def _stage_ingest(raw_data, options):
+    modo = _ingestion_mode(options)
+    if modo == 'streaming':
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            features_path = os.path.join(tmp_dir, 'features.parquet')
+            run_streaming_etl(
+                raw_data, features_path,
+                memory_budget_mb=options['memory_budget_mb'], cache_dir=options['cache_dir']
+            )
+            return pd.read_parquet(features_path)
+    if modo == 'incremental':
+        return load_clean_incremental(raw_data, options['cache_dir'], parallel=options['parallel'])
+    return load_and_combine_csvs(raw_data, parallel=options['parallel'])
+
+def _stage_clean(df, options):
+    return clean_dataframe(df)
+
+def _stage_geo(df, options):
+    return apply_state_estimation(df, cache_dir=options['cache_dir'])
+
+def _stage_features(df, options):
+    if options['cache_dir']:
+        store_dir = os.path.join(options['cache_dir'], 'feature_store')
+        return feature_engineering_incremental(df, store_dir)
+    return feature_engineering(df)
+
+def _detector_scores(df, options):
+    if options['registry_dir']:
+        # Modelos já treinados: só pontuação, salvo retreino explícito. Os processos
+        # de model_workers também limitam o pool de pontuação das partições grandes
+        return models_from_registry(
+            df, options['registry_dir'], retrain=options['retrain'],
+            cpu_budget=options['model_workers'] or 1, verbose=options['verbose']
+        )
+
+    # Matriz escalada construída uma vez por partição e compartilhada pelos detectores
+    X = measure('feature_matrix', build_partition_matrices, df)
+
+    # Grafo k-NN do LOF persistido junto do cache, reaproveitado entre execuções
+    graph_dir = os.path.join(options['cache_dir'], 'knn_graph') if options['cache_dir'] else None
+
+    if options['model_workers']:
+        # Os quatro detectores em paralelo, com a CPU dividida entre eles
+        return run_detectors(df, X, max_workers=options['model_workers'], graph_dir=graph_dir)
+
+    # Returning a dictionary with 4 score dataframes (keyed by ID_TRANSACAO)
+    return {
+    'lof_classified': run_lof_classified(df, X=X[1], graph_dir=graph_dir),
+    'lof_normal': run_lof_normal(df, X=X[0], graph_dir=graph_dir),
+    'if_classified': run_if_classified(df, X=X[1]),
+    'if_normal': run_if_normal(df, X=X[0])
+    }
+
+def _stage_models(df, options):
+    # As transações seguem junto dos scores para a junção por chave em combine
+    return {'transacoes': df, **_detector_scores(df, options)}
+
+def _stage_combine(results, options):
+    return combine_dataframes(
+        results['transacoes'],
+        df_lof_classified=results['lof_classified'],
+        df_lof_normal=results['lof_normal'],
+        df_if_classified=results['if_classified'],
+        df_if_normal=results['if_normal']
+    )
+
+def _stage_threshold(df, options):
+    # Labels a partir dos scores já combinados: mudar a contaminação só refaz esta etapa
+    return apply_thresholds(df, options['contamination'])
+
+def _stage_score(df, options):
+    return calculate_priority_score(df)
+
+def _passthrough_stages(options):
+    """Etapas já cobertas pela ingestão no modo atual (não executam nem gravam checkpoint)."""
+    modo = _ingestion_mode(options)
+    if modo == 'streaming':
+        return {'clean', 'geo', 'features'}
+    if modo == 'incremental':
+        return {'clean'}
+    return set()
+
+STAGE_FUNCTIONS = {
+    'ingest': _stage_ingest,
+    'clean': _stage_clean,
+    'geo': _stage_geo,
+    'features': _stage_features,
+    'models': _stage_models,
+    'combine': _stage_combine,
+    'threshold': _stage_threshold,
+    'score': _stage_score,
+}
+
+def _raw_fingerprint(raw_data):
+    """Nome, tamanho e SHA-256 de cada CSV de entrada."""
+    csv_files = sorted(f for f in os.listdir(raw_data) if f.lower().endswith('.csv'))
+    return [
+        (f, os.path.getsize(os.path.join(raw_data, f)), file_hash(os.path.join(raw_data, f)))
+        for f in csv_files
+    ]
+
+def stage_keys(raw_data, options):
+    """
+    Content-addressed key of every stage: hash of the previous stage's key
+    (the raw CSVs for 'ingest'), the source code the stage runs and its config.
+    """
+    modo = _ingestion_mode(options)
+    codigo = {
+        'ingest': source_hash(clean_df, parsing, incremental, streaming, state_imput, feature_engineering_module)
+        if modo == 'streaming' else source_hash(clean_df, parsing, incremental),
+        'clean': source_hash(clean_df, parsing),
+        'geo': source_hash(state_imput),
+        'features': source_hash(feature_engineering_module, feature_store),
+        'models': source_hash(models, preprocessing, scheduler, knn_graph, registry),
+        'combine': source_hash(combine_dataframes),
+        'threshold': source_hash(thresholds),
+        'score': source_hash(calculate_priority_score),
+    }
+    config = {
+        'ingest': {'modo': modo, 'parallel': bool(options['parallel'])},
+        'threshold': {'contamination': options['contamination']},
+        'score': {'pesos': [TECHNICAL_WEIGHT, FINANCIAL_WEIGHT]},
+    }
+    if options['registry_dir']:
+        config['models'] = {'registro': current_version(options['registry_dir'])}
+
+    keys = {}
+    anterior = _raw_fingerprint(raw_data)
+    for stage in STAGES:
+        keys[stage] = hash_values(stage, anterior, codigo[stage], config.get(stage, {}))
+        anterior = keys[stage]
+    return keys
+
+def run_stages(raw_data, until='score', checkpoint_dir=None, from_stage=None,
+               parallel=False, cache_dir=None, memory_budget_mb=None, model_workers=None,
+               registry_dir=None, retrain=False, contamination=CONTAMINATION, verbose=False):
+    """
+    Runs the named STAGES from 'ingest' up to until.
+
+    With checkpoint_dir, each stage output is saved to Parquet under its
+    content-addressed key (stage_keys). A re-run resumes after the last
+    stage whose checkpoint is still valid. from_stage forces a rebuild from
+    that stage on (the previous checkpoint is still reused when valid).
+    Stages already covered by the ingestion mode (e.g. 'clean' after
+    incremental ingestion) are skipped. Every stage that runs is measured
+    (see functions/instrumentation.py).
+
+    With registry_dir, the models stage scores with the registered models
+    (functions/registry.py); retrain refits and registers them again.
+
+    The models stage only produces raw scores; the 'threshold' stage turns
+    them into LOF_LABEL/IF_LABEL for contamination (a share or a dict per
+    SIGILOSO, see functions/thresholds.py), so a new contamination reuses
+    every checkpoint up to 'combine'.
+    """
+    options = {
+        'parallel': parallel, 'cache_dir': cache_dir, 'memory_budget_mb': memory_budget_mb,
+        'model_workers': model_workers, 'registry_dir': registry_dir, 'retrain': retrain,
+        'contamination': contamination, 'verbose': verbose,
+    }
+    if retrain and (from_stage is None or STAGES.index(from_stage) > STAGES.index('models')):
+        # Retreino nunca sai de checkpoint
+        from_stage = 'models'
+    pular = _passthrough_stages(options)
+    fim = STAGES.index(until) + 1
+    inicio = 0
+    data = raw_data
+
+    if checkpoint_dir:
+        keys = stage_keys(raw_data, options)
+        versao_registro = current_version(registry_dir) if registry_dir else None
+        limite = min(STAGES.index(from_stage), fim) if from_stage else fim
+        for i in reversed(range(limite)):
+            if has_checkpoint(checkpoint_dir, STAGES[i], keys[STAGES[i]]):
+                data = measure(f'checkpoint_{STAGES[i]}', load_checkpoint, checkpoint_dir, STAGES[i])
+                inicio = i + 1
+                if verbose:
+                    print(f"Checkpoint reaproveitado: {STAGES[i]}")
+                break
+
+    for stage in STAGES[inicio:fim]:
+        if stage in pular:
+            continue
+        if verbose:
+            print(f"Executando etapa: {stage}")
+        data = measure(stage, STAGE_FUNCTIONS[stage], data, options)
+        if checkpoint_dir and stage == 'models' and registry_dir and current_version(registry_dir) != versao_registro:
+            # A etapa treinou uma nova versão do registro: as chaves de models em
+            # diante passam a ser as dela, as mesmas que a próxima execução calcula
+            keys = stage_keys(raw_data, options)
+        if checkpoint_dir:
+            save_checkpoint(checkpoint_dir, stage, keys[stage], data)
+    return data
+
+def run_pipeline(raw_data, parallel=False, cache_dir=None, memory_budget_mb=None,
+                 checkpoint_dir=None, from_stage=None, model_workers=None,
+                 registry_dir=None, retrain=False):
     """
     Runs the entire data processing and modeling pipeline.
 
     Parameters
     raw_data : Path to directory with CSVs.
+    parallel : Reads the CSVs concurrently with the pinned CPGF schema.
+    cache_dir : If given, only new or changed CSVs are parsed; the others are
+        read from the per-file cleaned Parquet cache in this directory. The
+        state estimation lookup table, the feature store and the LOF k-NN
+        graph are also persisted there.
+    memory_budget_mb : If given, cleaning, state estimation and features run in
+        bounded-memory streaming mode (see functions/streaming.py).
+    checkpoint_dir, from_stage : Stage checkpointing, see run_stages.
+    model_workers : If given, the four detectors run concurrently in this many
+        processes (see functions/scheduler.py); otherwise sequentially.
+    registry_dir, retrain : Score with the registered models instead of
+        refitting them, see functions/registry.py.
 
     Returns
-    Dictionary of length 4:
+    Dictionary of length 5:
+        - 'transacoes': the feature engineered transactions
         - Output of run_lof_classified(df_feature_engineering)
         - Output of run_lof_normal(df_feature_engineering)
         - Output of run_if_classified(df_feature_engineering)
         - Output of run_if_normal(df_feature_engineering)
+    The detector outputs hold only ID_TRANSACAO and their raw score; the
+    labels are applied later (functions/thresholds.py).
     """
-    # Using functions created previously
-    df_raw = load_and_combine_csvs(raw_data)
-    df_clean = clean_dataframe(df_raw)
-    df_state = apply_state_estimation(df_clean)
-    df_feature_engineering = feature_engineering(df_state)
-
-    # Returning a dictionary with 4 different dataframes
-    return {
-    'lof_classified': run_lof_classified(df_feature_engineering),
-    'lof_normal': run_lof_normal(df_feature_engineering),
-    'if_classified': run_if_classified(df_feature_engineering),
-    'if_normal': run_if_normal(df_feature_engineering)
-    }
+    return run_stages(
+        raw_data, until='models', checkpoint_dir=checkpoint_dir, from_stage=from_stage,
+        parallel=parallel, cache_dir=cache_dir, memory_budget_mb=memory_budget_mb,
+        model_workers=model_workers, registry_dir=registry_dir, retrain=retrain
+    )
 
-def combine_dataframes(df_lof_classified, df_lof_normal, df_if_classified, df_if_normal):
+def combine_dataframes(df, df_lof_classified, df_lof_normal, df_if_classified, df_if_normal):
     """
-    Combine the dataframes LOF and IF, creates ID, rearrange columns,
-    and merge final adding only specific columns.
+    Joins the LOF and IF scores to the transactions by ID_TRANSACAO,
+    creates ID and checks that every transaction got both scores.
     """
-    def combine(df1, df2, label_cols):
-        df = pd.concat([df1, df2], ignore_index=True).drop_duplicates().reset_index(drop=True)
+    def scores(df1, df2):
+        df_scores = pd.concat([df1, df2], ignore_index=True)
+        chave = pd.Index(df_scores.pop('ID_TRANSACAO').to_numpy())
+        assert chave.is_unique, "ID_TRANSACAO repetido nas saídas dos detectores"
+        return chave, df_scores
 
-        df["ID"] = df.index + 1
+    # Junção por chave int64, só com as colunas de score
+    chaves = df['ID_TRANSACAO'].to_numpy()
+    df_final = df.reset_index(drop=True)
+    sem_score = np.zeros(len(df_final), dtype=bool)
+    for chave, df_scores in (scores(df_lof_classified, df_lof_normal), scores(df_if_classified, df_if_normal)):
+        posicoes = chave.get_indexer(chaves)
+        sem_score |= posicoes < 0
+        for col in df_scores.columns:
+            df_final[col] = df_scores[col].to_numpy()[posicoes]
 
-        cols = ["ID"] + [c for c in df.columns if c != "ID"]
-        df = df[cols]
+    assert not sem_score.any(), f"{int(sem_score.sum())} transações sem score LOF ou IF"
 
-        df_specific = df[["ID"] + label_cols]
-        return df, df_specific
-
-    # Processing LOF
-    df_lof_full, df_lof_specific = combine(
-        df_lof_classified, df_lof_normal,
-        label_cols=["LOF_LABEL", "LOF_SCORE"]
-    )
-    # Processing IF
-    df_if_full, df_if_specific = combine(
-        df_if_classified, df_if_normal,
-        label_cols=["IF_LABEL", "IF_SCORE"]
-    )
-
-    # Final merge: LOF (all columns) + IF (specific columns)
-    df_final = df_lof_full.merge(df_if_specific, on="ID", how="inner")
+    df_final.insert(0, 'ID', np.arange(1, len(df_final) + 1))
 
     # Normalization step
     # IF_SCORE: Assuming lower score = higher risk. Invert to: Higher score = Higher risk.
@@ -75,9 +297,9 @@ def combine_dataframes(df_lof_classified, df_lof_normal, df_if_classified, df_if
     # Normalize both risk scores
     scaler = RobustScaler()
 
-    # Reshape scores for RobustScaler and fit/transform
-    df_final['LOF_SCORE_NORM'] = scaler.fit_transform(df_final[['RISK_LOF_SCORE']])
-    df_final['IF_SCORE_NORM'] = scaler.fit_transform(df_final[['RISK_IF_SCORE']])
+    # Reshape scores for RobustScaler and fit/transform (float32, as in calculate_priority_score)
+    df_final['LOF_SCORE_NORM'] = scaler.fit_transform(df_final[['RISK_LOF_SCORE']]).astype(np.float32)
+    df_final['IF_SCORE_NORM'] = scaler.fit_transform(df_final[['RISK_IF_SCORE']]).astype(np.float32)
 
     # Clean up intermediate columns
     df_final = df_final.drop(columns=['RISK_LOF_SCORE', 'RISK_IF_SCORE'])
@@ -89,40 +311,46 @@ def calculate_priority_score(df: pd.DataFrame):
     Calculates the Technical Score, Financial Risk, and the final weighted
     Priority Score for manual review.
 
+    All components are float32 and computed the same way the dashboard
+    recomputes them for other weights (functions/front/app.py); the weights
+    used are kept in df.attrs['pesos_prioridade'].
+
     Returns:
         pd.DataFrame: The DataFrame with the final PRIORITY_SCORE, sorted descending.
     """
 
     # 3.1 Combine Technical Scores (Mean)
-    df['TECHNICAL_SCORE'] = df[['LOF_SCORE_NORM', 'IF_SCORE_NORM']].mean(axis=1)
+    lof = df['LOF_SCORE_NORM'].to_numpy(np.float32)
+    iso = df['IF_SCORE_NORM'].to_numpy(np.float32)
+    df['TECHNICAL_SCORE'] = np.float32(0.5) * lof + np.float32(0.5) * iso
 
     # 3.2 Calculate Financial Risk and Final Weighted Priority Score
 
     # Normalize LOG_VALOR to use it as a weighting factor
     log_scaler = RobustScaler()
-    df['FINANCIAL_RISK'] = log_scaler.fit_transform(df[['LOG_VALOR']])
+    df['FINANCIAL_RISK'] = log_scaler.fit_transform(df[['LOG_VALOR']]).astype(np.float32)
 
     # Final Priority Calculation: (0.7 * Technical) + (0.3 * Financial Risk)
     df['PRIORITY_SCORE'] = (
-        (0.7 * df['TECHNICAL_SCORE']) +
-        (0.3 * df['FINANCIAL_RISK'])
+        (np.float32(TECHNICAL_WEIGHT) * df['TECHNICAL_SCORE'].to_numpy()) +
+        (np.float32(FINANCIAL_WEIGHT) * df['FINANCIAL_RISK'].to_numpy())
     )
+    df.attrs['pesos_prioridade'] = {'tecnico': TECHNICAL_WEIGHT, 'financeiro': FINANCIAL_WEIGHT}
     # Order by priority score
     df = df.sort_values(by='PRIORITY_SCORE', ascending=False).reset_index(drop=True)
 
     return df
 
-def get_dashboard_data(raw_path):
+def get_dashboard_data(raw_path, parallel=False, cache_dir=None, memory_budget_mb=None,
+                       checkpoint_dir=None, from_stage=None, model_workers=None,
+                       registry_dir=None, retrain=False, contamination=CONTAMINATION, verbose=False):
     """
-    Executa o pipeline completo (ETL + Modelos + Combinação + Score)
+    Executa o pipeline completo (ETL + Modelos + Combinação + Limiares + Score)
     e retorna o DataFrame final pronto para o Dashboard.
     """
-    results = run_pipeline(raw_path)
-    df_combined = combine_dataframes(
-        df_lof_classified=results['lof_classified'],
-        df_lof_normal=results['lof_normal'],
-        df_if_classified=results['if_classified'],
-        df_if_normal=results['if_normal']
+    return run_stages(
+        raw_path, until='score', checkpoint_dir=checkpoint_dir, from_stage=from_stage,
+        parallel=parallel, cache_dir=cache_dir, memory_budget_mb=memory_budget_mb,
+        model_workers=model_workers, registry_dir=registry_dir, retrain=retrain,
+        contamination=contamination, verbose=verbose
     )
-    df_dashboard = calculate_priority_score(df_combined)
-    return df_dashboard
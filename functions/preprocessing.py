@@ -45,3 +45,11 @@ preprocessor = ColumnTransformer(
 def get_preprocessor():
     """Returns the preprocessor ColumnTransformer object."""
     return preprocessor
+
+def build_feature_matrix(df):
+    """
+    Fits the preprocessor on df and returns the scaled matrix as a
+    C-contiguous float32 array, ready to be shared by all detectors.
+    """
+    X_scaled = get_preprocessor().fit_transform(df[num_value])
+    return np.ascontiguousarray(X_scaled, dtype=np.float32)
@@ -0,0 +1,273 @@
+import os
+import re
+import json
+import shutil
+import joblib
+import sklearn
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sklearn.base import clone
+from sklearn.ensemble import IsolationForest
+from functions.preprocessing import get_preprocessor, num_value
+from functions.models import collapse_duplicates, score_frame, IF_MAX_SAMPLES
+from functions.knn_graph import fit_lof_novelty, lof_novelty_scores
+from functions.batch_scoring import score_isolation_forest
+from functions.checkpoint import source_hash
+from functions.instrumentation import measure
+from functions import preprocessing, knn_graph, batch_scoring
+
+# Registro de modelos: o preprocessador e os detectores (IF e LOF novelty)
+# de cada partição são treinados uma vez e gravados em disco com metadados de versão.
+# As execuções seguintes só pontuam as linhas novas, em lotes, até um retreino
+# explícito: os scores de cada versão ficam gravados junto dos modelos, por
+# ID_TRANSACAO, e as transações já pontuadas reaproveitam o score gravado.
+
+# Incrementar quando o formato do registro mudar
+REGISTRY_VERSION = 3
+
+INDEX_NAME = 'registry.json'
+
+# Pastas de versão (datetime.strftime de train_registry)
+VERSION_PATTERN = re.compile(r'\d{8}_\d{6}')
+
+# Linhas por lote na pontuação
+SCORE_BATCH_ROWS = 100_000
+
+# Vetores distintos por processo abaixo dos quais um pool de pontuação do IF não compensa
+SCORE_ROWS_PER_WORKER = 250_000
+
+# Mesmos parâmetros dos detectores de functions/models.py; a contaminação fica
+# fora dos modelos (os labels saem de functions/thresholds.py)
+N_NEIGHBORS = 20
+N_ESTIMATORS = 300
+RANDOM_STATE = 42
+
+PARTICOES = {0: 'normal', 1: 'classified'}
+
+def _code_hash():
+    """Código que define os modelos e os scores gravados de uma versão."""
+    return source_hash(
+        preprocessing, batch_scoring, _fit_partition, collapse_duplicates,
+        knn_graph._block_rows, knn_graph.build_knn_graph, knn_graph._self_copies,
+        knn_graph._neighbourhood_weights, knn_graph._local_density, knn_graph._graph_density,
+        knn_graph.fit_lof_novelty, knn_graph.lof_novelty_scores,
+        _lof_scores, _if_scores, _score_partition
+    )
+
+def _load_index(registry_dir):
+    """Metadados do registro, se existir e for compatível com este código/scikit-learn."""
+    path = os.path.join(registry_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        index = json.load(f)
+    if (index.get('versao') != REGISTRY_VERSION
+            or index.get('sklearn') != sklearn.__version__
+            or index.get('codigo') != _code_hash()):
+        return None
+    return index
+
+def load_registry(registry_dir):
+    """
+    Loads the current models of the registry, or None when there is none or
+    it was written by another registry/scikit-learn/model code version.
+    """
+    index = _load_index(registry_dir)
+    if index is None:
+        return None
+
+    pasta = os.path.join(registry_dir, index['atual'])
+    modelos = {
+        sigilo: joblib.load(os.path.join(pasta, f'modelos_{nome}.joblib'))
+        for sigilo, nome in PARTICOES.items()
+    }
+    return {'metadados': index, 'modelos': modelos}
+
+def current_version(registry_dir):
+    """Id da versão em uso (None se não houver registro válido)."""
+    index = _load_index(registry_dir)
+    return index['atual'] if index else None
+
+def _fit_partition(df_particao, nome):
+    """
+    Preprocessador + IF + LOF (novelty) treinados numa partição. Cada treino
+    vai para o relatório da execução (fit_if_<partição>, fit_lof_<partição>).
+    """
+    preprocessor = clone(get_preprocessor())
+    X = np.ascontiguousarray(preprocessor.fit_transform(df_particao[num_value]), dtype=np.float32)
+
+    # IF treinado sem ruído: as linhas novas também são pontuadas sem ruído,
+    # e colunas constantes na partição não viram cortes aleatórios
+    if_model = IsolationForest(
+        contamination='auto',
+        random_state=RANDOM_STATE,
+        n_estimators=N_ESTIMATORS,
+        max_samples=IF_MAX_SAMPLES,
+        n_jobs=-1
+    )
+    measure(f'fit_if_{nome}', if_model.fit, X)
+
+    # LOF sobre os vetores distintos, pesados pelas cópias, como em models.detect_lof
+    unicos, _, contagens = collapse_duplicates(X)
+    lof = measure(f'fit_lof_{nome}', fit_lof_novelty, unicos, contagens, N_NEIGHBORS)
+
+    return {'preprocessor': preprocessor, 'if': if_model, 'lof': lof}
+
+def train_registry(df, registry_dir, verbose=False):
+    """
+    Trains the models of both partitions on df and saves them as a new
+    version of the registry, which becomes the current one.
+    """
+    versao = datetime.now().strftime('%Y%m%d_%H%M%S')
+    pasta = os.path.join(registry_dir, versao)
+    os.makedirs(pasta, exist_ok=True)
+
+    modelos = {}
+    linhas = {}
+    for sigilo, nome in PARTICOES.items():
+        df_particao = df[df['SIGILOSO'] == sigilo]
+        modelos[sigilo] = _fit_partition(df_particao, nome)
+        linhas[nome] = len(df_particao)
+        joblib.dump(modelos[sigilo], os.path.join(pasta, f'modelos_{nome}.joblib'))
+
+    index = {
+        'versao': REGISTRY_VERSION,
+        'atual': versao,
+        'sklearn': sklearn.__version__,
+        'codigo': _code_hash(),
+        'treinado_em': datetime.now().isoformat(timespec='seconds'),
+        'linhas_treino': linhas,
+        'arquivos_treino': sorted(map(str, df['ARQUIVO_ORIGEM'].unique())),
+        'parametros': {
+            'n_neighbors': N_NEIGHBORS,
+            'n_estimators': N_ESTIMATORS, 'random_state': RANDOM_STATE,
+            'max_samples': IF_MAX_SAMPLES,
+        },
+    }
+    path = os.path.join(registry_dir, INDEX_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+    _prune_versions(registry_dir, versao)
+
+    if verbose:
+        print(f"Modelos treinados e registrados: versão {versao}")
+    return {'metadados': index, 'modelos': modelos}
+
+def _prune_versions(registry_dir, atual):
+    """Remove as pastas das versões anteriores (modelos e scores gravados)."""
+    for nome in os.listdir(registry_dir):
+        pasta = os.path.join(registry_dir, nome)
+        if nome != atual and VERSION_PATTERN.fullmatch(nome) and os.path.isdir(pasta):
+            shutil.rmtree(pasta)
+
+def _scores_path(registry_dir, registro, nome):
+    return os.path.join(registry_dir, registro['metadados']['atual'], f'scores_{nome}.parquet')
+
+def _load_scores(path):
+    """Scores já gravados para a versão, indexados por ID_TRANSACAO (vazio se não houver)."""
+    if path is None or not os.path.exists(path):
+        return pd.DataFrame(columns=['IF_SCORE', 'LOF_SCORE'], index=pd.Index([], dtype=np.int64))
+    tabela = pd.read_parquet(path)
+    # pd.Index direto: o set_index testa se os ids formam um intervalo e avisa de overflow com int64 grandes
+    return tabela.drop(columns='ID_TRANSACAO').set_axis(pd.Index(tabela['ID_TRANSACAO'].to_numpy()))
+
+def _save_scores(path, ids, scores):
+    tabela = pd.DataFrame({'ID_TRANSACAO': ids, **scores})
+    tabela.to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+def _lof_scores(X, lof, batch_rows):
+    return np.concatenate([
+        lof_novelty_scores(lof, X[inicio:inicio + batch_rows]) for inicio in range(0, len(X), batch_rows)
+    ])
+
+def _if_scores(X, if_model, score_workers):
+    _, decisao = score_isolation_forest(if_model, X, n_workers=score_workers)
+    # score_samples, como em models.detect_if
+    return decisao + if_model.offset_
+
+def score_workers_for(n_linhas, cpu_budget=1):
+    """Processos do pool de pontuação do IF: um por SCORE_ROWS_PER_WORKER linhas, no máximo cpu_budget."""
+    return max(1, min(cpu_budget or 1, n_linhas // SCORE_ROWS_PER_WORKER))
+
+def _score_partition(df_particao, modelos, batch_rows, cpu_budget=1, nome=''):
+    """
+    Scores brutos de IF e LOF para as linhas da partição. O preprocessamento
+    vai lote a lote; as linhas idênticas são colapsadas e cada vetor distinto é
+    pontuado uma vez (LOF em lotes, IF em blocos do tamanho do cache). Só
+    partições grandes usam um pool para o IF, de até cpu_budget processos
+    (score_workers_for). Cada detector vai para o relatório da execução
+    (score_lof_<partição>, score_if_<partição>).
+    """
+    n = len(df_particao)
+    X = np.empty((n, len(num_value)), dtype=np.float32)
+    for inicio in range(0, n, batch_rows):
+        fatia = slice(inicio, min(inicio + batch_rows, n))
+        X[fatia] = modelos['preprocessor'].transform(df_particao.iloc[fatia][num_value])
+    unicos, inverso, _ = collapse_duplicates(X)
+    score_workers = score_workers_for(len(unicos), cpu_budget)
+
+    lof_score = measure(f'score_lof_{nome}', _lof_scores, unicos, modelos['lof'], batch_rows)[inverso]
+    if_score = measure(f'score_if_{nome}', _if_scores, unicos, modelos['if'], score_workers)[inverso]
+    return {'IF_SCORE': if_score, 'LOF_SCORE': lof_score}
+
+def score_with_registry(df, registro, batch_rows=SCORE_BATCH_ROWS, cpu_budget=1, registry_dir=None, verbose=False):
+    """
+    Scores df with the registered models, without refitting. cpu_budget caps
+    the processes of the IF scoring pool, only started for large partitions.
+
+    Rows that were part of the training set are scored as new points, so
+    their LOF_SCORE is knn_graph.lof_novelty_scores() and not the training
+    negative_outlier_factor_.
+
+    With registry_dir, the scores are saved next to the models of the
+    version and only the rows whose ID_TRANSACAO has no saved score yet are
+    scored: a transaction keeps the score it got the first time it was seen
+    under this version.
+
+    Returns:
+        dict: Mesmo formato das saídas de run_lof_*/run_if_* (scores por ID_TRANSACAO).
+    """
+    saidas = {}
+    for sigilo, nome in PARTICOES.items():
+        df_particao = df[df['SIGILOSO'] == sigilo]
+        ids = df_particao['ID_TRANSACAO'].to_numpy()
+        path = _scores_path(registry_dir, registro, nome) if registry_dir else None
+        gravados = _load_scores(path)
+
+        posicao = gravados.index.get_indexer(ids)
+        novas = posicao < 0
+        scores = {}
+        for col in ('IF_SCORE', 'LOF_SCORE'):
+            scores[col] = np.full(len(ids), np.nan)
+            scores[col][~novas] = gravados[col].to_numpy(np.float64)[posicao[~novas]]
+        if novas.any():
+            calculados = _score_partition(
+                df_particao[novas], registro['modelos'][sigilo], batch_rows, cpu_budget, nome
+            )
+            for col in scores:
+                scores[col][novas] = calculados[col]
+            if path:
+                _save_scores(path, ids, scores)
+        if verbose:
+            print(f"Partição {nome}: {int(novas.sum())} linhas pontuadas, {int((~novas).sum())} reaproveitadas")
+
+        for detector in ('LOF', 'IF'):
+            saidas[f'{detector.lower()}_{nome}'] = score_frame(ids, detector, scores[f'{detector}_SCORE'])
+    return saidas
+
+def models_from_registry(df, registry_dir, retrain=False, batch_rows=SCORE_BATCH_ROWS, cpu_budget=1, verbose=False):
+    """
+    Score-only path of the models stage: uses the current registered models,
+    training (and registering) new ones only when retrain is set or there
+    is no compatible registry yet. Only the rows not scored before under
+    that version are scored (see score_with_registry).
+    """
+    registro = None if retrain else load_registry(registry_dir)
+    if registro is None:
+        registro = train_registry(df, registry_dir, verbose=verbose)
+    elif verbose:
+        print(f"Pontuando com os modelos registrados: versão {registro['metadados']['atual']}")
+    return score_with_registry(df, registro, batch_rows, cpu_budget, registry_dir, verbose)
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
+from functions.models import detect_lof, detect_if, score_frame
+from functions.instrumentation import measure, worker_report, merge_report
+
+# Escalonador dos quatro detectores: roda LOF/IF das duas partições ao mesmo
+# tempo num pool de processos. As matrizes vão para os workers como arquivos
+# .npy abertos com mmap (nada de pickle da matriz), e os núcleos disponíveis
+# são divididos entre os jobs em vez de cada um disputar todos com n_jobs=-1.
+
+# nome do resultado -> (detector, partição SIGILOSO)
+DETECTORES = {
+    'lof_classified': ('LOF', 1),
+    'lof_normal': ('LOF', 0),
+    'if_classified': ('IF', 1),
+    'if_normal': ('IF', 0),
+}
+
+def split_cpu_budget(tamanhos, cpu_budget=None):
+    """
+    Splits cpu_budget cores (default: all) among the jobs proportionally to
+    their number of rows, at least one core each.
+    """
+    total = cpu_budget or os.cpu_count() or 1
+    soma = sum(tamanhos.values()) or 1
+    return {nome: max(1, int(total * n / soma)) for nome, n in tamanhos.items()}
+
+def _run_detector(nome, detector, path, n_jobs, graph_dir=None):
+    X = np.load(path, mmap_mode='r')
+    # Também limita BLAS/OpenMP para não estourar a cota do job
+    with threadpool_limits(limits=n_jobs):
+        # Mesmo nome das medições do caminho sequencial (run_lof_normal...)
+        if detector == 'LOF':
+            return measure(f'run_{nome}', detect_lof, X, n_jobs=n_jobs, graph_dir=graph_dir, graph_name=nome)
+        return measure(f'run_{nome}', detect_if, X, n_jobs=n_jobs)
+
+def _detector_job(nome, detector, path, n_jobs, graph_dir=None):
+    """
+    Worker: abre a matriz por mmap e roda o detector com n_jobs threads.
+    Devolve (scores, medições do worker) para o relatório do processo principal.
+    """
+    return worker_report(_run_detector, nome, detector, path, n_jobs, graph_dir)
+
+def run_detectors(df, matrices, max_workers=4, cpu_budget=None, tmp_dir=None, graph_dir=None):
+    """
+    Runs the four detectors concurrently on the shared partition matrices
+    (models.build_partition_matrices).
+
+    Args:
+        df (pd.DataFrame): DataFrame completo, na mesma ordem usada para as matrizes.
+        matrices (dict): {0: X dos não sigilosos, 1: X dos sigilosos}.
+        max_workers (int): Processos simultâneos.
+        cpu_budget (int): Núcleos a dividir entre os jobs (padrão: todos).
+        tmp_dir (str): Onde gravar as matrizes mapeadas em memória.
+        graph_dir (str): Pasta do grafo k-NN do LOF (ver functions/knn_graph.py).
+
+    The timings measured in each worker (run_lof_normal...) go to the run
+    report (functions/instrumentation.py).
+
+    Returns:
+        dict: Mesmo formato das saídas de run_lof_*/run_if_* (scores por ID_TRANSACAO).
+    """
+    tamanhos = {nome: len(matrices[sigilo]) for nome, (_, sigilo) in DETECTORES.items()}
+    cotas = split_cpu_budget(tamanhos, cpu_budget)
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as pasta:
+        paths = {}
+        for sigilo, X in matrices.items():
+            paths[sigilo] = os.path.join(pasta, f'X_{sigilo}.npy')
+            np.save(paths[sigilo], X)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {
+                nome: executor.submit(_detector_job, nome, detector, paths[sigilo], cotas[nome], graph_dir)
+                for nome, (detector, sigilo) in DETECTORES.items()
+            }
+            resultados = {}
+            for nome, futuro in futuros.items():
+                resultados[nome], registros = futuro.result()
+                merge_report(registros)
+
+    ids = df['ID_TRANSACAO'].to_numpy()
+    sigilo_linhas = df['SIGILOSO'].to_numpy()
+    return {
+        nome: score_frame(ids[sigilo_linhas == sigilo], detector, resultados[nome])
+        for nome, (detector, sigilo) in DETECTORES.items()
+    }
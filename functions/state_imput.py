@@ -1,4 +1,9 @@
 import re
+import os
+import glob
+import json
+import hashlib
+import numpy as np
 import pandas as pd
 import unicodedata
 
@@ -96,24 +101,126 @@ def _normalize_text(text):
     return text.upper()
 
 
-# 3. LÓGICA DE IMPUTAÇÃO
+# 3. MOTOR DE BUSCA COMPILADO
+
+# As regras acima são compiladas uma única vez em expressões regulares.
+# Os termos de cada tabela viram uma trie (prefixos fatorados), usada num
+# lookahead para achar todas as ocorrências, inclusive sobrepostas. A
+# prioridade continua sendo a ordem das tabelas: vence o termo que aparece
+# primeiro no dicionário, não o que aparece primeiro no texto.
+
+_ENGINE = None
+_ENGINE_VERSAO = None
+
+def _trie_regex(termos):
+    """
+    Builds a prefix-factored regex matching any of the terms. At a given
+    position it matches the longest term that starts there.
+    """
+    trie = {}
+    for termo in termos:
+        no = trie
+        for ch in termo:
+            no = no.setdefault(ch, {})
+        no[''] = {}
+
+    def montar(no):
+        ramos = [re.escape(ch) + montar(filho) for ch, filho in sorted(no.items()) if ch != '']
+        if not ramos:
+            return ''
+        corpo = ramos[0] if len(ramos) == 1 else '(?:' + '|'.join(ramos) + ')'
+        return '(?:' + corpo + ')?' if '' in no else corpo
+
+    return montar(trie)
+
+def _priority_matcher(termos_prioridade):
+    """
+    Compiles {term: priority} into (regex, {term: best priority}).
+
+    The regex only reports the longest term at each position; every shorter
+    term that is a prefix of it also occurs there, so each term's priority is
+    folded with the priorities of its prefix terms.
+    """
+    termos = sorted(termos_prioridade)
+    padrao = re.compile('(?=(' + _trie_regex(termos) + '))')
+    melhor = {}
+    for termo in termos:
+        prefixos = [termo[:i] for i in range(1, len(termo) + 1) if termo[:i] in termos_prioridade]
+        melhor[termo] = min(termos_prioridade[p] for p in prefixos)
+    return padrao, melhor
+
+def _best_match(padrao, melhor, texto):
+    """Menor prioridade entre todas as ocorrências no texto (None se não houver)."""
+    prioridades = [melhor[m.group(1)] for m in padrao.finditer(texto)]
+    return min(prioridades) if prioridades else None
+
+def compile_rules():
+    """
+    Compiles MAPA_CIDADES, MAPA_ESTADOS and SIGLAS_CONFIAVEIS into the matching
+    engine. Called at import and again whenever rules_hash() changes.
+    """
+    global _ENGINE, _ENGINE_VERSAO
+
+    # Cidades: prioridade = ordem no dicionário
+    cidades = list(MAPA_CIDADES.items())
+    prioridade_cidade = {}
+    for i, (termo, _) in enumerate(cidades):
+        prioridade_cidade.setdefault(termo, i)
+
+    # Estados: prioridade = ordem da UF; termos longos e a sigla isolada da mesma UF empatam
+    ufs = list(MAPA_ESTADOS)
+    prioridade_estado = {}
+    for i, (uf, termos) in enumerate(MAPA_ESTADOS.items()):
+        for termo in termos:
+            if len(termo) > 2:
+                prioridade_estado.setdefault(termo, i)
+
+    _ENGINE = {
+        'cidades': _priority_matcher(prioridade_cidade),
+        'ufs_cidades': [uf for _, uf in cidades],
+        'estados': _priority_matcher(prioridade_estado),
+        'siglas': re.compile(r'\b(' + '|'.join(map(re.escape, ufs)) + r')\b'),
+        'indice_uf': {uf: i for i, uf in enumerate(ufs)},
+        'ufs': ufs,
+        'sede': re.compile(r'\bSEDE\b'),
+        'preposicao': re.compile(
+            r'\b(NO|NA|DO|DA|DE|EM|AO)\s+(' + '|'.join(SIGLAS_CONFIAVEIS) + r')\b'
+        ),
+    }
+    _ENGINE_VERSAO = rules_hash()
+    return _ENGINE
+
+def _get_engine():
+    """Recompila o motor se as tabelas de regras foram alteradas."""
+    if _ENGINE_VERSAO != rules_hash():
+        compile_rules()
+    return _ENGINE
+
+
+# 4. LÓGICA DE IMPUTAÇÃO
 
 def _estimate_state_row(linha):
     """
     Função interna para processar uma única linha.
     """
-    texto_bruto = str(linha['NOME ÓRGÃO']) + " " + str(linha['NOME UNIDADE GESTORA'])
+    return _estimate_state(linha['NOME ÓRGÃO'], linha['NOME UNIDADE GESTORA'])
 
+def _estimate_state(orgao, unidade, engine=None):
+    """
+    Estima a UF a partir do nome do órgão e da unidade gestora.
+    """
+    engine = engine or _get_engine()
+    texto_bruto = str(orgao) + " " + str(unidade)
     # 1. Normalização
     texto = _normalize_text(texto_bruto)
 
     # 2. Busca por Cidades Específicas
-    for termo, uf in MAPA_CIDADES.items():
-        if termo in texto:
-            return uf
+    achado = _best_match(*engine['cidades'], texto)
+    if achado is not None:
+        return engine['ufs_cidades'][achado]
 
     # 3. Limpeza de termos ambíguos
-    texto = re.sub(r'\bSEDE\b', ' ', texto)
+    texto = engine['sede'].sub(' ', texto)
     texto = texto.replace("- SEDE", " ")
 
     # 4. Casos Especiais de DF
@@ -125,37 +232,112 @@ def _estimate_state_row(linha):
         return 'DF'
 
     # 5. Busca por Padrão de Preposição
-    padrao_preposicao = r'\b(NO|NA|DO|DA|DE|EM|AO)\s+(' + '|'.join(SIGLAS_CONFIAVEIS) + r')\b'
-    match = re.search(padrao_preposicao, texto)
+    match = engine['preposicao'].search(texto)
     if match:
         return match.group(2)
 
-    # 6. Busca Geral nos Mapas de Estados
-    for uf, termos in MAPA_ESTADOS.items():
-        for termo in termos:
-            if len(termo) > 2:
-                if termo in texto:
-                    return uf
+    # 6. Busca Geral nos Mapas de Estados (nomes/termos e sigla isolada)
+    candidatos = [engine['indice_uf'][m.group(1)] for m in engine['siglas'].finditer(texto)]
+    achado = _best_match(*engine['estados'], texto)
+    if achado is not None:
+        candidatos.append(achado)
+    if candidatos:
+        return engine['ufs'][min(candidatos)]
 
-        # Verifica a Sigla (UF) isolada
-        if re.search(r'\b' + re.escape(uf) + r'\b', texto):
-            return uf
+    # 7. Termos Genéricos (TERMOS_UNIAO) e demais casos caem em UNIÃO
+    return 'UNIÃO'
 
-    # 7. Termos Genéricos
-    for termo in TERMOS_UNIAO:
-        if termo in texto:
-            return 'UNIÃO'
+# 5. TABELA DE CONSULTA (MEMOIZAÇÃO)
 
-    return 'UNIÃO'
+# Cache em memória: (órgão, unidade) -> UF. Reaproveitado entre lotes do modo streaming.
+_LOOKUP = {}
+_LOOKUP_VERSAO = None
+
+LOOKUP_PREFIX = 'estado_lookup_'
+
+def rules_hash():
+    """Hash das tabelas de regras; muda sempre que MAPA_CIDADES/MAPA_ESTADOS/TERMOS_UNIAO mudam."""
+    regras = json.dumps([MAPA_CIDADES, MAPA_ESTADOS, TERMOS_UNIAO], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(regras.encode('utf-8')).hexdigest()[:16]
 
-def apply_state_estimation(df):
+def _lookup_path(cache_dir, versao):
+    return os.path.join(cache_dir, f'{LOOKUP_PREFIX}{versao}.parquet')
+
+def _get_lookup(cache_dir=None):
+    """
+    Returns the in-memory lookup for the current rules, loading the persisted
+    table from cache_dir on first use. A change in the rules starts a new table.
+    """
+    global _LOOKUP, _LOOKUP_VERSAO
+    versao = rules_hash()
+    if _LOOKUP_VERSAO != versao:
+        _LOOKUP, _LOOKUP_VERSAO = {}, versao
+    if cache_dir and not _LOOKUP:
+        path = _lookup_path(cache_dir, versao)
+        if os.path.exists(path):
+            tabela = pd.read_parquet(path)
+            _LOOKUP.update(zip(
+                zip(tabela['NOME ÓRGÃO'], tabela['NOME UNIDADE GESTORA']), tabela['ESTADO_ESTIMADO']
+            ))
+    return _LOOKUP
+
+def _save_lookup(lookup, cache_dir):
+    """Grava a tabela de consulta e remove as tabelas de versões antigas das regras."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _lookup_path(cache_dir, rules_hash())
+    chaves = list(lookup)
+    tabela = pd.DataFrame({
+        'NOME ÓRGÃO': [k[0] for k in chaves],
+        'NOME UNIDADE GESTORA': [k[1] for k in chaves],
+        'ESTADO_ESTIMADO': list(lookup.values()),
+    })
+    tabela.to_parquet(path, index=False)
+    for antigo in glob.glob(os.path.join(cache_dir, f'{LOOKUP_PREFIX}*.parquet')):
+        if antigo != path:
+            os.remove(antigo)
+
+def apply_state_estimation(df, cache_dir=None):
     """
     Aplica a lógica de estimação de estado para todo o DataFrame.
+
+    The estimate only depends on (NOME ÓRGÃO, NOME UNIDADE GESTORA), so it is
+    computed once per distinct pair and mapped back to the rows by their
+    integer codes. Pairs already seen are reused from an in-memory table and,
+    when cache_dir is given, from a Parquet table persisted there across runs
+    (named after rules_hash(), so editing the rule tables invalidates it).
     """
-    df_resultado = df.copy()
-    if not df_resultado.empty:
-        df_resultado['ESTADO_ESTIMADO'] = df_resultado.apply(_estimate_state_row, axis=1)
-    else:
-        df_resultado['ESTADO_ESTIMADO'] = []
+    df_resultado = df.copy(deep=False)
+    if df_resultado.empty:
+        df_resultado['ESTADO_ESTIMADO'] = pd.Categorical([])
+        return df_resultado
+
+    # Códigos inteiros de cada par distinto (órgão, unidade)
+    cod_orgao, orgaos = pd.factorize(df_resultado['NOME ÓRGÃO'], use_na_sentinel=False)
+    cod_unidade, unidades = pd.factorize(df_resultado['NOME UNIDADE GESTORA'], use_na_sentinel=False)
+    chave = cod_orgao.astype(np.int64) * len(unidades) + cod_unidade
+    pares, inversa = np.unique(chave, return_inverse=True)
+
+    lookup = _get_lookup(cache_dir)
+    engine = _get_engine()
+    estados = np.empty(len(pares), dtype=object)
+    novos = 0
+    for i, par in enumerate(pares):
+        k = (str(orgaos[par // len(unidades)]), str(unidades[par % len(unidades)]))
+        uf = lookup.get(k)
+        if uf is None:
+            uf = lookup[k] = _estimate_state(*k, engine=engine)
+            novos += 1
+        estados[i] = uf
 
+    if cache_dir and novos:
+        _save_lookup(lookup, cache_dir)
+
+    # Resultado categórico: uma categoria por UF, códigos mapeados a partir dos pares
+    categorias, cod_estado = np.unique(estados.astype(str), return_inverse=True)
+    df_resultado['ESTADO_ESTIMADO'] = pd.Categorical.from_codes(
+        cod_estado.ravel()[inversa.ravel()], categories=categorias
+    )
     return df_resultado
+
+# Compila as regras na importação do módulo
+compile_rules()
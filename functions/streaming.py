@@ -0,0 +1,171 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from functions.clean_df import (
+    CPGF_SCHEMA, DOCUMENT_COLUMNS, clean_dataframe, apply_categorical_policy, schema_mismatch, _source_column
+)
+from functions.state_imput import apply_state_estimation
+from functions.feature_engineering import (
+    row_features, compute_aggregates, merge_aggregates, apply_aggregates
+)
+
+# Quantas cópias de um lote coexistem durante limpeza/estimação/features
+FATOR_COPIAS = 4
+
+# Linhas usadas para estimar o custo em memória de cada linha
+LINHAS_AMOSTRA = 10_000
+
+def _csv_files(csv_path):
+    csv_files = sorted(f for f in os.listdir(csv_path) if f.lower().endswith('.csv'))
+    return [os.path.join(csv_path, f) for f in csv_files]
+
+def _read_kwargs(file_path, pinned=True):
+    """
+    Usa o esquema fixo do CPGF quando o cabeçalho confere; senão deixa o pandas
+    inferir (documentos como texto, como em clean_df._read_legacy_file).
+    """
+    header = pd.read_csv(file_path, sep=';', encoding='latin-1', nrows=0).columns
+    if pinned and schema_mismatch(header) is None:
+        return {'dtype': CPGF_SCHEMA}
+    return {'low_memory': False, 'dtype': DOCUMENT_COLUMNS}
+
+def _iter_chunks(file_path, chunk_rows, verbose=False, **read_kwargs):
+    """
+    Chunks of one CSV. If a chunk fails the pinned dtypes, the file is read
+    again with inferred dtypes, like clean_df._read_cpgf_file; the rows already
+    yielded come back with the same ID_TRANSACAO and are dropped by the caller.
+    """
+    kwargs = _read_kwargs(file_path)
+    try:
+        yield from pd.read_csv(file_path, sep=';', encoding='latin-1', chunksize=chunk_rows, **kwargs, **read_kwargs)
+    except (ValueError, TypeError, OverflowError) as erro:
+        if kwargs['dtype'] is not CPGF_SCHEMA:
+            raise
+        if verbose:
+            print(f"{os.path.basename(file_path)}: tipo fixo falhou ({erro}), relendo com tipos inferidos")
+        yield from pd.read_csv(
+            file_path, sep=';', encoding='latin-1', chunksize=chunk_rows,
+            **_read_kwargs(file_path, pinned=False), **read_kwargs
+        )
+
+def chunk_rows_for_budget(file_paths, memory_budget_mb):
+    """
+    Estimates how many rows fit in the memory budget, from the deep memory
+    usage of a sample of the first file and the number of copies a batch
+    goes through.
+    """
+    if not file_paths:
+        return LINHAS_AMOSTRA
+    sample = next(_iter_chunks(file_paths[0], LINHAS_AMOSTRA, nrows=LINHAS_AMOSTRA), pd.DataFrame())
+    bytes_por_linha = max(sample.memory_usage(deep=True).sum() / max(len(sample), 1), 1)
+    return max(int(memory_budget_mb * 1024 ** 2 / (bytes_por_linha * FATOR_COPIAS)), 1_000)
+
+def iter_clean_batches(csv_path, chunk_rows, verbose=False):
+    """
+    Generator of cleaned record batches, file by file and chunk by chunk.
+
+    Duplicates are dropped within each chunk by clean_dataframe and across
+    chunks and files through the ID_TRANSACAO fingerprint. The fingerprints
+    already seen are kept as a sorted int64 array (8 bytes per row). A file
+    that fails the pinned schema is read again with inferred dtypes.
+    """
+    vistos = np.empty(0, dtype=np.int64)
+    for file_path in _csv_files(csv_path):
+        for chunk in _iter_chunks(file_path, chunk_rows, verbose):
+            chunk['ARQUIVO_ORIGEM'] = _source_column(file_path, len(chunk))
+            lote = clean_dataframe(apply_categorical_policy(chunk))
+            ids = lote['ID_TRANSACAO'].to_numpy()
+            pos = np.minimum(np.searchsorted(vistos, ids), max(len(vistos) - 1, 0))
+            novos = vistos[pos] != ids if len(vistos) else np.ones(len(ids), dtype=bool)
+            # Dois runs ordenados: o sort estável (timsort) faz só o merge
+            vistos = np.sort(np.concatenate([vistos, ids[novos]]), kind='stable')
+            if not novos.all():
+                lote = lote[novos]
+            if not lote.empty:
+                yield lote
+
+def _arrow_schema(table):
+    """
+    Fixes the types that can change from one batch to another: dictionary
+    indices (int8/int16/...) and all-null columns.
+    """
+    campos = []
+    for campo in table.schema:
+        tipo = campo.type
+        if pa.types.is_dictionary(tipo):
+            tipo = pa.dictionary(pa.int32(), tipo.value_type)
+        elif pa.types.is_null(tipo):
+            tipo = pa.string()
+        campos.append(pa.field(campo.name, tipo))
+    return pa.schema(campos, metadata=table.schema.metadata)
+
+class _IncrementalParquetWriter:
+    """ParquetWriter que fixa o esquema no primeiro lote e converte os seguintes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.schema = None
+
+    def write(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.schema = _arrow_schema(table)
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(table.cast(self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def run_streaming_etl(csv_path, output_path, memory_budget_mb=512, chunk_rows=None, cache_dir=None, verbose=False):
+    """
+    Bounded-memory version of clean → state estimation → feature engineering.
+
+    Pass 1 streams batches through cleaning, state estimation and the row-level
+    features, accumulates the global statistics (frequency counts and
+    organ/month sums) and spills each batch to a temporary Parquet.
+    Pass 2 reads the spill back batch by batch, maps the global statistics onto
+    the rows and appends them to output_path.
+
+    At most one batch (sized from memory_budget_mb) is in memory at a time.
+    cache_dir is passed to apply_state_estimation for its persisted lookup.
+    Returns the number of rows written.
+    """
+    if chunk_rows is None:
+        chunk_rows = chunk_rows_for_budget(_csv_files(csv_path), memory_budget_mb)
+
+    total = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spill_path = os.path.join(tmp_dir, 'spill.parquet')
+
+        # 1ª passada: limpeza + estado + features por linha + agregados
+        aggs = None
+        spill = _IncrementalParquetWriter(spill_path)
+        try:
+            for lote in iter_clean_batches(csv_path, chunk_rows, verbose):
+                lote = row_features(apply_state_estimation(lote, cache_dir=cache_dir))
+                aggs = merge_aggregates(aggs, compute_aggregates(lote))
+                spill.write(lote)
+        finally:
+            spill.close()
+
+        if aggs is None:
+            return 0
+
+        # 2ª passada: aplica as estatísticas globais e grava a saída
+        saida = _IncrementalParquetWriter(output_path)
+        try:
+            for batch in pq.ParquetFile(spill_path).iter_batches(batch_size=chunk_rows):
+                lote = apply_aggregates(batch.to_pandas(), aggs)
+                saida.write(lote)
+                total += len(lote)
+        finally:
+            saida.close()
+
+    if verbose:
+        print(f"{total} linhas gravadas em {output_path} (lotes de {chunk_rows} linhas)")
+    return total
@@ -0,0 +1,170 @@
+import os
+import csv
+import calendar
+import numpy as np
+import pandas as pd
+from functions.clean_df import CPGF_SCHEMA
+from functions.state_imput import MAPA_CIDADES, MAPA_ESTADOS
+
+# Gerador de dados sintéticos no layout do CPGF, para medir o ETL sem os
+# downloads do Portal da Transparência: um CSV por mês (';', latin-1, campos
+# entre aspas, valores no formato brasileiro), com cardinalidades de órgãos,
+# unidades, portadores e favorecidos próximas das reais, popularidade com cauda
+# longa, parcela de transações sigilosas e linhas duplicadas.
+
+# Cardinalidades aproximadas de um ano de CPGF
+N_ORGAOS_SUPERIORES = 30
+N_ORGAOS = 250
+N_UNIDADES = 3000
+N_PORTADORES = 15000
+N_FAVORECIDOS = 60000
+
+# Parcela de transações sigilosas e de linhas repetidas no mesmo arquivo
+TAXA_SIGILOSO = 0.12
+TAXA_DUPLICATAS = 0.02
+
+# Concentração da popularidade (lei de potência): poucas unidades/favorecidos
+# concentram a maior parte das transações
+EXPOENTE_ZIPF = 1.1
+
+TRANSACAO_SIGILOSA = 'Informações protegidas por sigilo'
+TIPOS_TRANSACAO = {
+    'COMPRA A/V - R$ - APRES': 0.80,
+    'SAQUE CASH/ATM BB': 0.15,
+    'COMPRA A/V - INT$ - APRES': 0.04,
+    'SAQUE - INT$ - APRES': 0.01,
+}
+
+ORGAOS_SUPERIORES = [
+    'MINISTERIO DA DEFESA', 'MINISTERIO DA EDUCACAO', 'MINISTERIO DA SAUDE',
+    'MINISTERIO DA JUSTICA E SEGURANCA PUBLICA', 'PRESIDENCIA DA REPUBLICA',
+    'MINISTERIO DA FAZENDA', 'MINISTERIO DA AGRICULTURA E PECUARIA',
+    'MINISTERIO DO MEIO AMBIENTE', 'MINISTERIO DAS RELACOES EXTERIORES',
+    'MINISTERIO DA CIENCIA, TECNOLOGIA E INOVACAO', 'MINISTERIO DO TRABALHO E EMPREGO',
+    'MINISTERIO DA INTEGRACAO E DO DESENVOLVIMENTO REGIONAL',
+]
+PADROES_ORGAO = [
+    'UNIVERSIDADE FEDERAL DE {estado}', 'INSTITUTO FEDERAL DE {estado}',
+    'SUPERINTENDENCIA REGIONAL EM {estado}', 'FUNDACAO NACIONAL',
+    'COMANDO DO EXERCITO', 'COMANDO DA MARINHA', 'AGENCIA NACIONAL',
+]
+PADROES_UNIDADE = [
+    'CAMPUS {cidade}', 'DELEGACIA EM {cidade}', 'BATALHAO DE {cidade}',
+    'GERENCIA REGIONAL - {uf}', 'ESCRITORIO /{uf}', 'SECRETARIA - SEDE',
+    'HOSPITAL UNIVERSITARIO DE {cidade}', 'CAPITANIA DOS PORTOS',
+]
+
+def _popularity(n, rng):
+    """Pesos de lei de potência, embaralhados para não favorecer os primeiros códigos."""
+    pesos = 1.0 / np.arange(1, n + 1) ** EXPOENTE_ZIPF
+    rng.shuffle(pesos)
+    return pesos / pesos.sum()
+
+def _dimensions(rng):
+    """Tabelas de órgãos, unidades, portadores e favorecidos, fixas para uma seed."""
+    cidades = list(MAPA_CIDADES)
+    estados = [nomes[0] for nomes in MAPA_ESTADOS.values()]
+    ufs = list(MAPA_ESTADOS)
+
+    superiores = [
+        ORGAOS_SUPERIORES[i] if i < len(ORGAOS_SUPERIORES) else f'{ORGAOS_SUPERIORES[i % len(ORGAOS_SUPERIORES)]} {i}'
+        for i in range(N_ORGAOS_SUPERIORES)
+    ]
+    orgao_superior = rng.integers(0, N_ORGAOS_SUPERIORES, N_ORGAOS)
+    # O número no fim do nome mantém nomes distintos para códigos distintos
+    orgaos = [
+        PADROES_ORGAO[rng.integers(len(PADROES_ORGAO))].format(estado=estados[rng.integers(len(estados))]) + f' {i}'
+        for i in range(N_ORGAOS)
+    ]
+    unidade_orgao = rng.integers(0, N_ORGAOS, N_UNIDADES)
+    unidades = [
+        PADROES_UNIDADE[rng.integers(len(PADROES_UNIDADE))].format(
+            cidade=cidades[rng.integers(len(cidades))], uf=ufs[rng.integers(len(ufs))]
+        ) + f' {i}'
+        for i in range(N_UNIDADES)
+    ]
+    return {
+        'superiores': np.array(superiores, dtype=object),
+        'orgao_superior': orgao_superior,
+        'orgaos': np.array(orgaos, dtype=object),
+        'unidade_orgao': unidade_orgao,
+        'unidades': np.array(unidades, dtype=object),
+        'peso_unidades': _popularity(N_UNIDADES, rng),
+        'cpfs': np.array([f'***.{i // 1000 % 1000:03d}.{i % 1000:03d}-**' for i in rng.permutation(10**6)[:N_PORTADORES]], dtype=object),
+        'portadores': np.array([f'PORTADOR SINTETICO {i}' for i in range(N_PORTADORES)], dtype=object),
+        'peso_portadores': _popularity(N_PORTADORES, rng),
+        'cnpjs': 10**13 + rng.choice(10**12, N_FAVORECIDOS, replace=False),
+        'favorecidos': np.array([f'FORNECEDOR SINTETICO {i} LTDA' for i in range(N_FAVORECIDOS)], dtype=object),
+        'peso_favorecidos': _popularity(N_FAVORECIDOS, rng),
+    }
+
+def _format_brl(valores):
+    """1234.5 -> '1.234,50'."""
+    centavos = np.round(valores * 100).astype(np.int64)
+    return np.array(
+        [f'{r:,}'.replace(',', '.') + f',{c:02d}' for r, c in zip(centavos // 100, centavos % 100)],
+        dtype=object
+    )
+
+def _month_frame(n, ano, mes, dims, rng, classified_share):
+    unidade = rng.choice(N_UNIDADES, n, p=dims['peso_unidades'])
+    orgao = dims['unidade_orgao'][unidade]
+    superior = dims['orgao_superior'][orgao]
+    portador = rng.choice(N_PORTADORES, n, p=dims['peso_portadores'])
+    favorecido = rng.choice(N_FAVORECIDOS, n, p=dims['peso_favorecidos'])
+    sigiloso = rng.random(n) < classified_share
+
+    tipos = np.array(list(TIPOS_TRANSACAO), dtype=object)
+    transacao = tipos[rng.choice(len(tipos), n, p=list(TIPOS_TRANSACAO.values()))]
+    dias = np.array([f'{d:02d}/{mes:02d}/{ano}' for d in range(1, calendar.monthrange(ano, mes)[1] + 1)], dtype=object)
+    data = dias[rng.integers(0, len(dias), n)]
+    valor = _format_brl(np.minimum(rng.lognormal(4.5, 1.3, n), 1e6))
+
+    df = pd.DataFrame({
+        'CÓDIGO ÓRGÃO SUPERIOR': 20000 + superior,
+        'NOME ÓRGÃO SUPERIOR': dims['superiores'][superior],
+        'CÓDIGO ÓRGÃO': 30000 + orgao,
+        'NOME ÓRGÃO': dims['orgaos'][orgao],
+        'CÓDIGO UNIDADE GESTORA': 100000 + unidade,
+        'NOME UNIDADE GESTORA': dims['unidades'][unidade],
+        'ANO EXTRATO': ano,
+        'MÊS EXTRATO': mes,
+        'CPF PORTADOR': np.where(sigiloso, '', dims['cpfs'][portador]),
+        'NOME PORTADOR': np.where(sigiloso, 'Sigiloso', dims['portadores'][portador]),
+        'CNPJ OU CPF FAVORECIDO': np.where(sigiloso, -11, dims['cnpjs'][favorecido]),
+        'NOME FAVORECIDO': np.where(sigiloso, 'Sem informação', dims['favorecidos'][favorecido]),
+        'TRANSAÇÃO': np.where(sigiloso, TRANSACAO_SIGILOSA, transacao),
+        'DATA TRANSAÇÃO': np.where(sigiloso, '', data),
+        'VALOR TRANSAÇÃO': valor,
+    })
+    return df[list(CPGF_SCHEMA)]
+
+def generate_cpgf(output_dir, n_rows, months=12, year=2024, seed=0,
+                  classified_share=TAXA_SIGILOSO, duplicate_rate=TAXA_DUPLICATAS):
+    """
+    Writes n_rows synthetic CPGF transactions split into one CSV per month
+    (<year><month>_CPGF.csv) in output_dir, including duplicate_rate exact
+    duplicate rows. The same seed always produces the same files.
+
+    Returns:
+        list: Caminhos dos CSVs gerados.
+    """
+    rng = np.random.default_rng(seed)
+    dims = _dimensions(rng)
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = []
+    por_mes = np.full(months, n_rows // months)
+    por_mes[:n_rows % months] += 1
+    for i, n in enumerate(por_mes):
+        mes = i % 12 + 1
+        ano = year + i // 12
+        n_unicas = int(round(n / (1 + duplicate_rate)))
+        df = _month_frame(n_unicas, ano, mes, dims, rng, classified_share)
+        repetidas = df.iloc[rng.integers(0, n_unicas, n - n_unicas)]
+        df = pd.concat([df, repetidas], ignore_index=True)
+
+        path = os.path.join(output_dir, f'{ano}{mes:02d}_CPGF.csv')
+        df.to_csv(path, sep=';', encoding='latin-1', index=False, quoting=csv.QUOTE_ALL)
+        paths.append(path)
+    return paths
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+# Limiares dos detectores: os modelos só produzem scores brutos (LOF_SCORE =
+# negative_outlier_factor_, IF_SCORE = score_samples; quanto menor, mais anômalo)
+# e os labels saem aqui, pelo percentil da contaminação em cada partição, como no
+# fit do sklearn. Mudar a contaminação não exige rodar os modelos de novo.
+
+CONTAMINATION = 0.01
+
+DETECTORES = ('LOF', 'IF')
+PARTICOES = {0: 'normal', 1: 'classified'}
+
+def _per_partition(contamination):
+    """Contaminação única ou {SIGILOSO: contaminação}."""
+    if isinstance(contamination, dict):
+        return {sigilo: contamination.get(sigilo, CONTAMINATION) for sigilo in PARTICOES}
+    return {sigilo: contamination for sigilo in PARTICOES}
+
+def apply_thresholds(df, contamination=CONTAMINATION):
+    """
+    Derives LOF_LABEL and IF_LABEL (-1 = anomaly) from the raw scores.
+
+    contamination is a single share or a dict {SIGILOSO: share}; each
+    partition is cut at its own percentile. The cut-offs used are stored in
+    df.attrs['limiares'].
+    """
+    contaminacao = _per_partition(contamination)
+    sigilo = df['SIGILOSO'].to_numpy()
+    limiares = {}
+    for detector in DETECTORES:
+        scores = df[f'{detector}_SCORE'].to_numpy()
+        labels = np.ones(len(df), dtype=np.int64)
+        for valor, nome in PARTICOES.items():
+            mascara = sigilo == valor
+            if not mascara.any():
+                continue
+            corte = np.percentile(scores[mascara], 100.0 * contaminacao[valor])
+            labels[mascara & (scores < corte)] = -1
+            limiares[f'{detector}_{nome}'] = float(corte)
+        df[f'{detector}_LABEL'] = labels
+    df.attrs['limiares'] = limiares
+    return df
+
+def contamination_sweep(df, values, per_partition=False):
+    """
+    Evaluates many contamination shares in one pass over the stored scores.
+
+    Each partition's scores are sorted once; the cut-off of every share is a
+    percentile of that sorted array and the number of anomalies a
+    searchsorted on it. With per_partition, one row per partition and
+    share; otherwise the share is applied to both partitions (as in
+    apply_thresholds) and the rows are totals.
+
+    Returns:
+        pd.DataFrame: contaminação, limiares, anomalias de cada detector e de ambos.
+    """
+    valores = np.asarray(sorted(values), dtype=float)
+    sigilo = df['SIGILOSO'].to_numpy()
+    linhas = []
+    for valor, nome in PARTICOES.items():
+        mascara = sigilo == valor
+        if not mascara.any():
+            continue
+        scores = {d: df[f'{d}_SCORE'].to_numpy()[mascara] for d in DETECTORES}
+        ordenados = {d: np.sort(s) for d, s in scores.items()}
+        cortes = {d: np.percentile(ordenados[d], 100.0 * valores) for d in DETECTORES}
+
+        for i, c in enumerate(valores):
+            linha = {'particao': nome, 'contaminacao': c, 'transacoes': int(mascara.sum())}
+            for d in DETECTORES:
+                linha[f'limiar_{d}'] = cortes[d][i]
+                linha[f'anomalias_{d}'] = int(np.searchsorted(ordenados[d], cortes[d][i], side='left'))
+            linha['anomalias_ambos'] = int(np.count_nonzero(
+                (scores['LOF'] < cortes['LOF'][i]) & (scores['IF'] < cortes['IF'][i])
+            ))
+            linhas.append(linha)
+
+    resultado = pd.DataFrame(linhas)
+    if per_partition or resultado.empty:
+        return resultado
+
+    contagens = ['transacoes', 'anomalias_LOF', 'anomalias_IF', 'anomalias_ambos']
+    return resultado.groupby('contaminacao', as_index=False)[contagens].sum()
@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import glob
+import platform
+import argparse
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import sklearn
+from functions.synthetic import generate_cpgf
+from functions.pipeline import run_stages
+from functions.instrumentation import start_report, get_report
+
+# Benchmark do ETL com dados sintéticos do CPGF (functions/synthetic.py).
+# Cada tamanho roda o pipeline completo a frio; o tempo, a CPU e a memória de cada
+# etapa de functions/pipeline.py e de cada detector de functions/models.py vão
+# para benchmarks/<commit>_<linhas>.json, para comparar entre commits.
+
+SIZES = [100_000, 1_000_000, 10_000_000]
+
+# Dados gerados uma vez por tamanho (mesma seed = mesmos arquivos)
+DATA_DIR = 'cache/benchmarks/'
+RESULTS_DIR = 'benchmarks/'
+MONTHS = 12
+
+# Execução a frio (sem cache/checkpoints), com leitura paralela como no run_etl.py.
+# Detectores em sequência por padrão: assim cada run_* de models.py é medido
+# sozinho. Com MODEL_WORKERS, as medições dos processos do escalonador também
+# voltam ao relatório (worker=True), mas os quatro detectores disputam a CPU.
+PARALLEL_INGESTION = True
+MODEL_WORKERS = None
+
+def _git(*args):
+    try:
+        saida = subprocess.run(['git', *args], capture_output=True, text=True, check=True)
+        return saida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _dataset(n_rows):
+    """Pasta com os CSVs sintéticos de n_rows linhas, gerados se ainda não existirem."""
+    pasta = os.path.join(DATA_DIR, f'cpgf_{n_rows}')
+    if len(glob.glob(os.path.join(pasta, '*.csv'))) != MONTHS:
+        print(f"Gerando {n_rows} linhas sintéticas em {pasta}")
+        generate_cpgf(pasta, n_rows, months=MONTHS)
+    return pasta
+
+def run_benchmark(n_rows, model_workers=MODEL_WORKERS):
+    """Roda o pipeline completo sobre os dados sintéticos e grava o relatório por etapa."""
+    pasta = _dataset(n_rows)
+    commit = _git('rev-parse', '--short', 'HEAD') or 'sem_git'
+
+    start_report()
+    df = run_stages(pasta, until='score', parallel=PARALLEL_INGESTION, model_workers=model_workers)
+    etapas = get_report()
+
+    resultado = {
+        'commit': commit,
+        'alteracoes_locais': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'linhas_geradas': n_rows,
+        'linhas_saida': len(df),
+        'model_workers': model_workers,
+        'tempo_total_s': round(sum(e['tempo_s'] for e in etapas if e['nivel'] == 0), 3),
+        'maquina': {
+            'cpus': os.cpu_count(), 'plataforma': platform.platform(),
+            'python': platform.python_version(), 'pandas': pd.__version__,
+            'numpy': np.__version__, 'sklearn': sklearn.__version__,
+        },
+        'etapas': etapas,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'{commit}_{n_rows}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"{n_rows} linhas: {resultado['tempo_total_s']} s -> {path}")
+    return resultado
+
+def compare_results(results_dir=RESULTS_DIR):
+    """Tabela etapa x commit (tempo_s) para cada tamanho, na ordem em que os resultados foram gerados."""
+    linhas = []
+    for path in glob.glob(os.path.join(results_dir, '*.json')):
+        with open(path, encoding='utf-8') as f:
+            r = json.load(f)
+        for e in r['etapas']:
+            linhas.append({
+                'linhas': r['linhas_geradas'], 'commit': r['commit'], 'gerado_em': r['gerado_em'],
+                'etapa': '  ' * e['nivel'] + e['etapa'], 'tempo_s': e['tempo_s'],
+            })
+    if not linhas:
+        print(f"Nenhum resultado em {results_dir}")
+        return None
+
+    df = pd.DataFrame(linhas)
+    ordem = df.groupby('commit')['gerado_em'].min().sort_values().index
+    for n, grupo in df.groupby('linhas'):
+        tabela = grupo.pivot_table(index='etapa', columns='commit', values='tempo_s', aggfunc='sum', sort=False)
+        print(f"\n== {n} linhas (tempo_s)")
+        print(tabela.reindex(columns=[c for c in ordem if c in tabela.columns]).to_string())
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark do ETL do Projeto Jacurutu com dados sintéticos')
+    parser.add_argument(
+        '--rows', type=int, nargs='+', default=SIZES,
+        help='Tamanhos (linhas) a medir.'
+    )
+    parser.add_argument(
+        '--model-workers', type=int, default=MODEL_WORKERS,
+        help='Roda os detectores em paralelo com este número de processos.'
+    )
+    parser.add_argument(
+        '--compare', action='store_true',
+        help=f'Só compara os resultados já gravados em {RESULTS_DIR}.'
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results()
+        sys.exit(0)
+    for n_rows in args.rows:
+        run_benchmark(n_rows, model_workers=args.model_workers)
@@ -1,7 +1,64 @@
-from functions.pipeline import get_dashboard_data
+import argparse
+from functions.pipeline import get_dashboard_data, STAGES
+from functions.dashboard_store import write_dashboard_dataset, write_dashboard_cube
+from functions.instrumentation import start_report, write_report
 
 RAW_PATH = 'raw_data/'
-OUTPUT_PATH = 'functions/front/dashboard_data.parquet'
+# Dataset Parquet particionado lido pelo dashboard (ver functions/dashboard_store.py)
+OUTPUT_PATH = 'functions/front/dashboard_data/'
 
-df_final = get_dashboard_data(RAW_PATH)
-df_final.to_parquet(OUTPUT_PATH, index=False)
+# Cubo de agregados dos KPIs, mapas e gráfico mensal do dashboard
+CUBE_PATH = 'functions/front/dashboard_cube.parquet'
+
+# Leitura paralela dos CSVs com o esquema fixo do CPGF
+PARALLEL_INGESTION = True
+
+# Cache incremental: só os meses novos/alterados são lidos do CSV
+CACHE_DIR = 'cache/'
+
+# Limite de memória (MB) para o modo streaming; None = processamento em memória
+MEMORY_BUDGET_MB = None
+
+# Processos para rodar os quatro detectores em paralelo; None = sequencial
+MODEL_WORKERS = 4
+
+# Registro de modelos: treina uma vez e depois só pontua as transações novas;
+# None = retreina a cada execução
+REGISTRY_DIR = 'cache/registry/'
+
+# Contaminação dos detectores (parcela de anomalias por partição); também aceita
+# {0: não sigilosos, 1: sigilosos}. Só a etapa 'threshold' é refeita ao mudar
+CONTAMINATION = 0.01
+
+# Checkpoints de cada etapa (ingest, clean, geo, features, models, combine, threshold, score)
+CHECKPOINT_DIR = 'cache/checkpoints/'
+
+# Relatório de tempo/memória por etapa, gravado ao lado do Parquet de saída
+REPORT_PATH = OUTPUT_PATH.rstrip('/') + '_report.json'
+PROFILE_DIR = 'cache/profiles/'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ETL do Projeto Jacurutu')
+    parser.add_argument(
+        '--from-stage', choices=STAGES, default=None,
+        help='Força a reexecução a partir desta etapa, ignorando checkpoints posteriores.'
+    )
+    parser.add_argument(
+        '--retrain', action='store_true',
+        help=f'Retreina os detectores e registra uma nova versão em {REGISTRY_DIR}.'
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help=f'Grava um dump do cProfile por etapa em {PROFILE_DIR}.'
+    )
+    args = parser.parse_args()
+
+    start_report(profile_dir=PROFILE_DIR if args.profile else None)
+    df_final = get_dashboard_data(
+        RAW_PATH, parallel=PARALLEL_INGESTION, cache_dir=CACHE_DIR, memory_budget_mb=MEMORY_BUDGET_MB,
+        checkpoint_dir=CHECKPOINT_DIR, from_stage=args.from_stage, model_workers=MODEL_WORKERS,
+        registry_dir=REGISTRY_DIR, retrain=args.retrain, contamination=CONTAMINATION, verbose=True
+    )
+    write_dashboard_dataset(df_final, OUTPUT_PATH)
+    write_dashboard_cube(df_final, CUBE_PATH)
+    write_report(REPORT_PATH, extra={'saida': OUTPUT_PATH, 'linhas': len(df_final)})
@@ -0,0 +1,32 @@
+import argparse
+from functions.dashboard_store import read_dashboard_dataset
+from functions.thresholds import contamination_sweep
+
+# Varredura de contaminação sobre os scores já gravados pelo run_etl.py: quantas
+# transações cada detector (e ambos) marcaria para cada parcela, sem retreinar.
+
+INPUT_PATH = 'functions/front/dashboard_data/'
+VALUES = [0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Varredura de contaminação dos detectores do Projeto Jacurutu')
+    parser.add_argument(
+        '--values', type=float, nargs='+', default=VALUES,
+        help='Parcelas de contaminação a avaliar.'
+    )
+    parser.add_argument(
+        '--per-partition', action='store_true',
+        help='Uma linha por partição (não sigilosos/sigilosos) em vez dos totais.'
+    )
+    parser.add_argument(
+        '--output', default=None,
+        help='Grava a tabela em CSV neste caminho.'
+    )
+    args = parser.parse_args()
+
+    # Só as colunas necessárias
+    df = read_dashboard_dataset(INPUT_PATH, columns=['SIGILOSO', 'LOF_SCORE', 'IF_SCORE'])
+    tabela = contamination_sweep(df, args.values, per_partition=args.per_partition)
+    print(tabela.to_string(index=False))
+    if args.output:
+        tabela.to_csv(args.output, index=False)
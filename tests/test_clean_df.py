@@ -0,0 +1,41 @@
+from functions.clean_df import CPGF_SCHEMA, _read_cpgf_file, _read_legacy_file, add_fingerprint
+
+
+def _csv(tmp_path):
+    linha = {
+        'CÓDIGO ÓRGÃO SUPERIOR': '52000', 'NOME ÓRGÃO SUPERIOR': 'MINISTERIO', 'CÓDIGO ÓRGÃO': '52100',
+        'NOME ÓRGÃO': 'ORGAO', 'CÓDIGO UNIDADE GESTORA': '160000', 'NOME UNIDADE GESTORA': 'UNIDADE',
+        'ANO EXTRATO': '2024', 'MÊS EXTRATO': '1', 'CPF PORTADOR': '***.348.671-**',
+        'NOME PORTADOR': 'PORTADOR', 'NOME FAVORECIDO': 'FORNECEDOR', 'TRANSAÇÃO': 'COMPRA A/V',
+        'DATA TRANSAÇÃO': '26/01/2024', 'VALOR TRANSAÇÃO': '1.443,32',
+    }
+    documentos = ['***.123.456-**', '', '00012345000190', '10000000108', '-11']
+    linhas = [';'.join(CPGF_SCHEMA)]
+    for doc in documentos:
+        linhas.append(';'.join(doc if c == 'CNPJ OU CPF FAVORECIDO' else linha[c] for c in CPGF_SCHEMA))
+    path = tmp_path / '202401_CPGF.csv'
+    path.write_text('\n'.join(linhas) + '\n', encoding='latin-1')
+    return str(path), documentos
+
+
+def test_documentos_mascarados_usam_o_esquema_fixo(tmp_path):
+    path, documentos = _csv(tmp_path)
+    df, report = _read_cpgf_file(path)
+    assert report['esquema'] == 'cpgf' and 'motivo' not in report
+    # Zeros à esquerda preservados; vazio vira nulo
+    assert df['CNPJ OU CPF FAVORECIDO'].fillna('').tolist() == documentos
+
+
+def test_fingerprint_igual_nas_duas_leituras(tmp_path):
+    path, _ = _csv(tmp_path)
+    fixo, _ = _read_cpgf_file(path)
+    inferido, _ = _read_legacy_file(path)
+    assert (add_fingerprint(fixo)['ID_TRANSACAO'] == add_fingerprint(inferido)['ID_TRANSACAO']).all()
+
+
+def test_motivo_do_fallback_no_relatorio(tmp_path):
+    path = tmp_path / 'outro.csv'
+    path.write_text('a;b\n1;2\n', encoding='latin-1')
+    _, report = _read_cpgf_file(str(path))
+    assert report['esquema'] == 'inferido'
+    assert 'cabeçalho' in report['motivo']
@@ -0,0 +1,47 @@
+import pandas as pd
+import pandas.testing as tm
+
+from functions import state_imput
+from functions.state_imput import apply_state_estimation
+from functions.feature_engineering import feature_engineering
+from functions.feature_store import feature_engineering_incremental
+
+
+def _transacoes():
+    unidades = ['CAMPUS CURITIBA', 'NUCLEO SANTOS', 'REITORIA', 'CAMPUS MARINGA']
+    linhas = []
+    for i in range(40):
+        mes = 1 + i % 2
+        linhas.append({
+            'ID_TRANSACAO': 1000 + i,
+            'ARQUIVO_ORIGEM': f'2024{mes:02d}_CPGF.csv',
+            'ANO EXTRATO': 2024,
+            'MÊS EXTRATO': mes,
+            'NOME ÓRGÃO': 'UNIVERSIDADE FEDERAL' if i % 3 else 'INSTITUTO FEDERAL',
+            'NOME UNIDADE GESTORA': unidades[i % len(unidades)],
+            'NOME FAVORECIDO': f'FORNECEDOR {i % 5}',
+            'TRANSAÇÃO': 'COMPRA A/V - R$ - APRES',
+            'CPF PORTADOR': f'***.{i % 7:03d}.***-**',
+            'NOME PORTADOR': f'PORTADOR {i % 7}',
+            'DATA TRANSAÇÃO': pd.Timestamp(2024, mes, 1 + i % 28),
+            'VALOR TRANSAÇÃO': 10.0 * (i + 1),
+        })
+    return pd.DataFrame(linhas)
+
+
+def _features(store_dir):
+    df = apply_state_estimation(_transacoes())
+    esperado = feature_engineering(df.copy())
+    return esperado, feature_engineering_incremental(df.copy(), str(store_dir))
+
+
+def test_store_refeito_quando_as_regras_mudam(tmp_path, monkeypatch):
+    store_dir = tmp_path / 'feature_store'
+    esperado, obtido = _features(store_dir)
+    tm.assert_frame_equal(obtido, esperado)
+
+    # Nova regra de cidade: ESTADO_ESTIMADO muda sem que os arquivos de origem mudem
+    monkeypatch.setitem(state_imput.MAPA_CIDADES, 'REITORIA', 'SP')
+    esperado, obtido = _features(store_dir)
+    assert (esperado['ESTADO_ESTIMADO'] == 'SP').sum() > 0
+    tm.assert_frame_equal(obtido, esperado)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from sklearn.neighbors import LocalOutlierFactor
+
+from functions.models import collapse_duplicates
+from functions.knn_graph import (
+    build_knn_graph, load_or_build_knn_graph, lof_scores_from_graph, fit_lof_novelty, lof_novelty_scores
+)
+
+
+def _dados(seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(2000, 5)), rng.normal(size=(300, 5)) * 1.5
+
+
+def test_lof_do_grafo_igual_ao_sklearn():
+    X, _ = _dados()
+    indices, distances = build_knn_graph(X, k=20)
+    esperado = LocalOutlierFactor(n_neighbors=20).fit(X).negative_outlier_factor_
+    np.testing.assert_allclose(lof_scores_from_graph(indices, distances, 20), esperado, rtol=1e-6)
+
+
+def test_lof_novelty_igual_ao_sklearn_sem_duplicatas():
+    X, Q = _dados()
+    modelo = fit_lof_novelty(X, np.ones(len(X), dtype=np.int64), n_neighbors=20)
+    esperado = LocalOutlierFactor(n_neighbors=20, novelty=True).fit(X).score_samples(Q)
+    np.testing.assert_allclose(lof_novelty_scores(modelo, Q), esperado, rtol=1e-6)
+
+
+def _com_duplicatas(seed=0):
+    X, Q = _dados(seed)
+    # Cada vetor repetido de 1 a 4 vezes, mais um bloco de 500 linhas idênticas
+    copias = np.repeat(X, np.arange(len(X)) % 4 + 1, axis=0)
+    return np.vstack([copias, np.repeat(X[:1] * 0.1, 500, axis=0)]), Q
+
+
+# O sklearn avisa que as duplicatas distorcem o LOF: é justamente o comportamento reproduzido
+@pytest.mark.filterwarnings('ignore:Duplicate values')
+def test_lof_com_duplicatas_colapsadas_igual_ao_sklearn_expandido():
+    linhas, _ = _com_duplicatas()
+    unicos, inverso, contagens = collapse_duplicates(linhas)
+    indices, distances = build_knn_graph(unicos, k=20)
+    obtido = lof_scores_from_graph(indices, distances, 20, contagens)
+
+    expandido = np.repeat(unicos, contagens, axis=0)
+    esperado = LocalOutlierFactor(n_neighbors=20).fit(expandido).negative_outlier_factor_
+    np.testing.assert_allclose(np.repeat(obtido, contagens), esperado, rtol=1e-5)
+
+    # O bloco de linhas idênticas é rotina, não o ponto mais anômalo
+    assert obtido[inverso[-1]] == -1.0
+
+
+def test_lof_novelty_com_duplicatas_colapsadas_igual_ao_sklearn_expandido():
+    linhas, Q = _com_duplicatas()
+    unicos, _, contagens = collapse_duplicates(linhas)
+    modelo = fit_lof_novelty(unicos, contagens, n_neighbors=20)
+
+    expandido = np.repeat(unicos, contagens, axis=0)
+    lof = LocalOutlierFactor(n_neighbors=20, novelty=True).fit(expandido)
+    consultas = np.vstack([Q, unicos[:50]])
+    np.testing.assert_allclose(lof_novelty_scores(modelo, consultas), lof.score_samples(consultas), rtol=1e-5)
+
+
+def test_grafo_persistido_reaproveitado_e_podado(tmp_path):
+    X, Q = _dados()
+    Y = X[:500] + 0.5
+    pasta = str(tmp_path)
+
+    load_or_build_knn_graph(X, pasta, k=20, name='lof_normal')
+    load_or_build_knn_graph(Q, pasta, k=20, name='lof_classified')
+    # Nova matriz (scaler reajustado): o grafo antigo do mesmo nome sai, o da outra partição fica
+    load_or_build_knn_graph(Y, pasta, k=20, name='lof_normal')
+    arquivos = sorted(p.name for p in tmp_path.iterdir())
+    assert len(arquivos) == 4
+    assert sum(a.startswith('lof_classified_') for a in arquivos) == 2
+
+    # k menor sai do grafo gravado; k maior refaz e substitui
+    indices, distances = load_or_build_knn_graph(Y, pasta, k=10, name='lof_normal')
+    assert isinstance(indices, np.memmap) and indices.shape == (500, 10)
+    np.testing.assert_array_equal(indices, build_knn_graph(Y, k=10)[0])
+    load_or_build_knn_graph(Y, pasta, k=30, name='lof_normal')
+    assert sorted(a for a in (p.name for p in tmp_path.iterdir()) if a.startswith('lof_normal_'))[0].endswith('_k30_distances.npy')
+    assert len(list(tmp_path.iterdir())) == 4
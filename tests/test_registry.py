@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from functions import registry
+from functions.synthetic import generate_cpgf
+from functions.clean_df import load_and_combine_csvs, clean_dataframe
+from functions.state_imput import apply_state_estimation
+from functions.feature_engineering import feature_engineering
+
+
+def _transacoes(tmp_path):
+    raw = str(tmp_path / 'raw')
+    generate_cpgf(raw, 3000, months=3)
+    df = feature_engineering(apply_state_estimation(clean_dataframe(load_and_combine_csvs(raw))))
+    return df.reset_index(drop=True)
+
+
+def _scores(saidas):
+    return pd.concat([saidas[k] for k in sorted(saidas) if k.startswith('lof')]).set_index('ID_TRANSACAO')
+
+
+def test_so_linhas_novas_sao_pontuadas(tmp_path, monkeypatch):
+    df = _transacoes(tmp_path)
+    registry_dir = str(tmp_path / 'registro')
+    antigas = df[df['MÊS EXTRATO'] < 3]
+
+    os.makedirs(os.path.join(registry_dir, '20200101_000000'))
+    registro = registry.train_registry(antigas, registry_dir)
+    # A versão anterior sai com o novo treino
+    assert not os.path.exists(os.path.join(registry_dir, '20200101_000000'))
+    primeira = registry.score_with_registry(antigas, registro, registry_dir=registry_dir)
+
+    pontuadas = []
+    original = registry._score_partition
+    monkeypatch.setattr(registry, '_score_partition', lambda d, *a, **k: pontuadas.append(len(d)) or original(d, *a, **k))
+    segunda = registry.score_with_registry(df, registro, registry_dir=registry_dir)
+    assert sum(pontuadas) == int((df['MÊS EXTRATO'] == 3).sum())
+
+    # Transações já pontuadas mantêm o score; as novas saem iguais a uma pontuação completa
+    completa = _scores(registry.score_with_registry(df, registro))
+    segunda = _scores(segunda)
+    velhas = _scores(primeira).index
+    np.testing.assert_array_equal(segunda.loc[velhas, 'LOF_SCORE'], _scores(primeira)['LOF_SCORE'])
+    novas = segunda.index.difference(velhas)
+    np.testing.assert_allclose(segunda.loc[novas, 'LOF_SCORE'], completa.loc[novas, 'LOF_SCORE'])
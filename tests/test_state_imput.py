@@ -0,0 +1,146 @@
+import re
+import random
+import pytest
+import pandas as pd
+
+from functions import state_imput
+from functions.state_imput import (
+    MAPA_CIDADES, MAPA_ESTADOS, SIGLAS_CONFIAVEIS, TERMOS_UNIAO,
+    _normalize_text, _estimate_state, apply_state_estimation
+)
+
+
+# Cópia congelada da implementação original (uma varredura por termo), referência da paridade
+
+def _legacy_estimate(orgao, unidade):
+    texto = _normalize_text(str(orgao) + " " + str(unidade))
+
+    for termo, uf in MAPA_CIDADES.items():
+        if termo in texto:
+            return uf
+
+    texto = re.sub(r'\bSEDE\b', ' ', texto)
+    texto = texto.replace("- SEDE", " ")
+
+    if 'PRESIDENCIA DA REPUBLICA' in texto or 'GABINETE DE SEGURANCA' in texto:
+        return 'DF'
+    if 'PRESIDENCIA' in texto and ('PLANALTO' in texto or 'REPUBLICA' in texto):
+        return 'DF'
+
+    padrao_preposicao = r'\b(NO|NA|DO|DA|DE|EM|AO)\s+(' + '|'.join(SIGLAS_CONFIAVEIS) + r')\b'
+    match = re.search(padrao_preposicao, texto)
+    if match:
+        return match.group(2)
+
+    for uf, termos in MAPA_ESTADOS.items():
+        for termo in termos:
+            if len(termo) > 2:
+                if termo in texto:
+                    return uf
+        if re.search(r'\b' + re.escape(uf) + r'\b', texto):
+            return uf
+
+    for termo in TERMOS_UNIAO:
+        if termo in texto:
+            return 'UNIÃO'
+
+    return 'UNIÃO'
+
+
+# (órgão, unidade, UF esperada) cobrindo cada nível de prioridade
+CASOS = [
+    # Cidade vence estado e sigla, mesmo aparecendo depois no texto
+    ('UNIVERSIDADE FEDERAL DO PARANA', 'CAMPUS CURITIBA', 'PR'),
+    ('GOVERNO DA BAHIA', 'ESCRITORIO EM RECIFE', 'PE'),
+    ('MINISTERIO DA SAUDE', 'NUCLEO - SP EM MANAUS', 'AM'),
+    # Entre cidades, vence a primeira do dicionário, não a primeira no texto
+    ('CAMPUS SANTOS', 'SAO PAULO', 'SP'),
+    ('RIO GRANDE', 'RIO DE JANEIRO', 'RJ'),
+    ('DELEGACIA', 'RIO GRANDE DO NORTE', 'RS'),
+    # Prefixo mais longo: 'MATO GROSSO DO SUL' contém 'MATO GROSSO' (MT vem antes de MS);
+    # 'PARAIBA' contém 'PARA' (PB vem antes de PA)
+    ('SUPERINTENDENCIA REGIONAL', 'MATO GROSSO DO SUL', 'MT'),
+    ('INSTITUTO FEDERAL', 'PARAIBA', 'PB'),
+    ('INSTITUTO FEDERAL', 'PARA', 'PA'),
+    # Acentos e caixa
+    ('Universidade Federal de Goiás', 'Campus Goiânia', 'GO'),
+    ('Instituto Federal do Ceará', 'Reitoria', 'CE'),
+    ('Presidência da República', 'Secretaria de Administração', 'DF'),
+    ('secretaria geral da presidência', 'palácio do planalto', 'DF'),
+    ('Gabinete de Segurança Institucional', 'Coordenação', 'DF'),
+    # SEDE é removido antes das demais buscas
+    ('SUPERINTENDENCIA - SEDE', 'UNIDADE SEDE', 'UNIÃO'),
+    # Preposição + sigla vence nome de estado
+    ('POLICIA FEDERAL NO RJ', 'SUPERINTENDENCIA EM ALAGOAS', 'RJ'),
+    ('SUPERINTENDENCIA DA BA', 'DELEGACIA', 'BA'),
+    # Nomes, siglas com barra/hífen e sigla isolada: vence a UF que vem antes no mapa
+    ('DELEGACIA/AC', 'NUCLEO', 'AC'),
+    ('SUPERINTENDENCIA - TO', 'ESPIRITO SANTO', 'ES'),
+    ('NUCLEO SE', 'ALAGOAS', 'AL'),
+    ('NUCLEO RR', 'UNIDADE', 'RR'),
+    # Sem correspondência
+    ('COMANDO DO EXERCITO', 'BATALHAO LOGISTICO', 'UNIÃO'),
+    ('ORGAO QUALQUER', 'UNIDADE QUALQUER', 'UNIÃO'),
+    ('', '', 'UNIÃO'),
+    (None, float('nan'), 'UNIÃO'),
+]
+
+
+def _corpus(n=3000, seed=0):
+    """Nomes sintéticos combinando termos de todas as tabelas de regras com ruído."""
+    rng = random.Random(seed)
+    termos = (list(MAPA_CIDADES) + [t for ts in MAPA_ESTADOS.values() for t in ts] + TERMOS_UNIAO +
+              ['SEDE', '- SEDE', 'PRESIDENCIA', 'REPUBLICA', 'PLANALTO', 'NO', 'DA', 'EM'] + SIGLAS_CONFIAVEIS)
+    ruido = ['MINISTERIO', 'SECRETARIA', 'CAMPUS', 'Goiânia', 'São', 'coordenação', 'X', '-', '/']
+    nomes = []
+    for _ in range(n):
+        partes = [rng.choice(termos if rng.random() < 0.6 else ruido) for _ in range(rng.randint(1, 5))]
+        nome = ' '.join(partes)
+        nomes.append(nome.lower() if rng.random() < 0.2 else nome)
+    return list(zip(nomes[::2], nomes[1::2]))
+
+
+@pytest.mark.parametrize('orgao, unidade, esperado', CASOS)
+def test_casos_por_prioridade(orgao, unidade, esperado):
+    assert _legacy_estimate(orgao, unidade) == esperado
+    assert _estimate_state(orgao, unidade) == esperado
+
+
+def test_paridade_corpus():
+    diferencas = [(o, u) for o, u in _corpus() if _estimate_state(o, u) != _legacy_estimate(o, u)]
+    assert diferencas == []
+
+
+def _frame():
+    pares = [(o, u) for o, u, _ in CASOS if isinstance(o, str)] + _corpus(400, seed=1)
+    # Pares repetidos exercitam o mapeamento de volta às linhas
+    pares = pares + pares[::3]
+    return pd.DataFrame(pares, columns=['NOME ÓRGÃO', 'NOME UNIDADE GESTORA'])
+
+
+@pytest.fixture
+def lookup_limpo(monkeypatch):
+    monkeypatch.setattr(state_imput, '_LOOKUP', {})
+    monkeypatch.setattr(state_imput, '_LOOKUP_VERSAO', None)
+
+
+def test_apply_state_estimation(lookup_limpo):
+    df = _frame()
+    esperado = [_legacy_estimate(o, u) for o, u in zip(df['NOME ÓRGÃO'], df['NOME UNIDADE GESTORA'])]
+    resultado = apply_state_estimation(df)
+    assert isinstance(resultado['ESTADO_ESTIMADO'].dtype, pd.CategoricalDtype)
+    assert resultado['ESTADO_ESTIMADO'].astype(str).tolist() == esperado
+
+
+def test_apply_state_estimation_lookup_persistido(tmp_path, lookup_limpo, monkeypatch):
+    df = _frame()
+    esperado = [_legacy_estimate(o, u) for o, u in zip(df['NOME ÓRGÃO'], df['NOME UNIDADE GESTORA'])]
+    apply_state_estimation(df, cache_dir=str(tmp_path))
+    assert list(tmp_path.glob(f'{state_imput.LOOKUP_PREFIX}*.parquet'))
+
+    # Nova execução: a tabela vem só do disco, sem chamar o motor de regras
+    monkeypatch.setattr(state_imput, '_LOOKUP', {})
+    monkeypatch.setattr(state_imput, '_LOOKUP_VERSAO', None)
+    monkeypatch.setattr(state_imput, '_estimate_state', lambda *a, **k: pytest.fail('par fora da tabela'))
+    resultado = apply_state_estimation(df, cache_dir=str(tmp_path))
+    assert resultado['ESTADO_ESTIMADO'].astype(str).tolist() == esperado
@@ -0,0 +1,30 @@
+import csv
+
+import pandas as pd
+
+from functions.synthetic import generate_cpgf
+from functions.clean_df import load_and_combine_csvs, clean_dataframe
+from functions.streaming import run_streaming_etl
+
+
+def _csvs(tmp_path):
+    paths = generate_cpgf(str(tmp_path / 'raw'), 3000, months=2)
+    # Documentos mascarados/vazios e, no fim do segundo arquivo, um código vazio
+    # que só o último lote encontra
+    df = pd.read_csv(paths[1], sep=';', encoding='latin-1', dtype=str, keep_default_na=False)
+    df.loc[::40, 'CNPJ OU CPF FAVORECIDO'] = '***.123.456-**'
+    df.loc[5::40, 'CNPJ OU CPF FAVORECIDO'] = ''
+    df.loc[len(df) - 10, 'CÓDIGO ÓRGÃO'] = ''
+    df.to_csv(paths[1], sep=';', encoding='latin-1', index=False, quoting=csv.QUOTE_ALL)
+    return str(tmp_path / 'raw')
+
+
+def test_streaming_com_fallback_por_lote_igual_a_leitura_completa(tmp_path):
+    raw = _csvs(tmp_path)
+    saida = str(tmp_path / 'saida.parquet')
+    total = run_streaming_etl(raw, saida, chunk_rows=500)
+
+    esperado = clean_dataframe(load_and_combine_csvs(raw, parallel=True))
+    obtido = pd.read_parquet(saida)
+    assert total == len(esperado)
+    assert set(obtido['ID_TRANSACAO']) == set(esperado['ID_TRANSACAO'])